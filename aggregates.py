@@ -0,0 +1,498 @@
+"""
+Incremental chart aggregates for the dashboard.
+
+This module keeps the counts behind the charts built in visualizations.py
+(party x sentiment, day x party, party x topic and leader mentions) together with
+the contribution of every comment that was folded into them. This allows:
+1.  Applying a delta of new comments, identified by `id_comentario`, in time
+    proportional to the delta instead of the whole corpus.
+2.  Replacing comments that were already folded in (e.g. after re-classification):
+    their old contribution is subtracted before the new one is added.
+3.  Tailing `comments_with_sentiment.csv` from a stored watermark (byte offset), so
+    only rows appended since the last refresh are read and annotated.
+
+The state is a dictionary. Its totals and watermark are saved as JSON to
+AGGREGATES_STATE_PATH; the per-comment contributions go to an indexed SQLite file next
+to it (see contributions_path), so a refresh only reads the contributions of the comments
+in its delta and only writes the ones that changed.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import os
+import sqlite3
+
+import visualizations
+
+# --- Configuration & Constants ---
+
+AGGREGATES_STATE_PATH = "chart_aggregates.json"
+STATE_VERSION = 4
+TAIL_CHECK_BYTES = 16  # Bytes before the watermark checked to detect a file rewritten with more rows
+
+# --- Helper Functions ---
+
+def comment_key(row):
+    """Returns the key identifying a comment: `id_comentario`, or a content hash when it is empty."""
+    comment_id = (row.get("id_comentario") or "").strip()
+    if comment_id:
+        return comment_id
+    fingerprint = "\x1f".join(
+        row.get(field) or "" for field in ("titulo_post", "data_comentario", "texto_comentario")
+    )
+    return "sha1:" + hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()
+
+def row_contribution(row, annotation=None):
+    """
+    Returns what a single comment adds to the aggregates: [party, day, sentiment, topics, leader, leaders].
+
+    annotation ({"topics", "leader", "leaders"}, e.g. from the pipeline's topic stage)
+    replaces matching the text against the topic and leader keywords.
+    """
+    text = row.get("texto_comentario") or ""
+    date_str = row.get("data_comentario")
+    day = None
+    if date_str:
+        try:
+            day = visualizations.parse_comment_day(date_str)
+        except Exception:
+            day = None
+    if annotation is None:
+        leader_counts = visualizations.count_party_leaders(text)
+        annotation = {
+            "topics": visualizations.identify_topics(text),
+            "leader": max(leader_counts, key=leader_counts.get) if leader_counts else "Undefined",
+            "leaders": list(leader_counts) or ["Undefined"],
+        }
+    return [
+        row.get("party") or "",
+        day,
+        row.get("sentiment") or "",
+        [topic for topic in annotation["topics"] if topic != "Undefined"],
+        annotation["leader"],
+        list(annotation["leaders"]),
+    ]
+
+def _bump(table, outer_key, inner_key, delta):
+    """Adds delta to table[outer_key][inner_key], dropping entries that reach zero."""
+    inner = table.setdefault(outer_key, {})
+    inner[inner_key] = inner.get(inner_key, 0) + delta
+    if inner[inner_key] == 0:
+        del inner[inner_key]
+        if not inner:
+            del table[outer_key]
+
+def _fold(state, contribution, sign):
+    """Adds (sign=1) or subtracts (sign=-1) one comment's contribution."""
+    party, day, sentiment, topics, leader, leaders = contribution
+    _bump(state["party_sentiment"], party, sentiment, sign)
+    if day:
+        _bump(state["day_party"], day, party, sign)
+    for topic in topics:
+        _bump(state["party_topics"], party, topic, sign)
+    _bump(state["leaders"], "main", leader, sign)
+    for mentioned in leaders:
+        _bump(state["leaders"], "mentioned", mentioned, sign)
+
+def _complete_records_length(chunk):
+    """
+    Returns how many bytes of chunk form complete CSV records.
+
+    A record ends at a newline that is not inside a quoted field. A trailing partial
+    record (e.g. a row still being written) is left for the next refresh.
+    """
+    end = 0
+    quotes = 0
+    position = 0
+    while True:
+        newline = chunk.find(b"\n", position)
+        if newline == -1:
+            return end
+        quotes += chunk.count(b'"', position, newline)
+        position = newline + 1
+        if quotes % 2 == 0:
+            end = position
+
+_store_connections = {}
+
+def contributions_path(state_path):
+    """Returns the SQLite file holding the per-comment contributions of the state saved at state_path."""
+    return os.path.splitext(state_path)[0] + ".contributions.db"
+
+def _store_connection(store_path):
+    """Returns an open connection to a contributions file (kept open for the next lookups)."""
+    if store_path not in _store_connections:
+        connection = sqlite3.connect(store_path, timeout=30)
+        connection.execute("CREATE TABLE IF NOT EXISTS contributions (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        _store_connections[store_path] = connection
+    return _store_connections[store_path]
+
+def _close_store(store_path):
+    """Closes the kept connection to a contributions file, e.g. before the file is replaced."""
+    connection = _store_connections.pop(store_path, None)
+    if connection is not None:
+        connection.close()
+
+def _store_digest(store_path):
+    """The digest recorded in a contributions file (None if missing or empty)."""
+    if not os.path.exists(store_path):
+        return None
+    row = _store_connection(store_path).execute("SELECT value FROM meta WHERE name = 'digest'").fetchone()
+    return row[0] if row else None
+
+def _stored_rows(items, hasher):
+    """Yields (key, JSON value) rows of (key, contribution) pairs, adding each to a digest."""
+    for key, contribution in items:
+        value = json.dumps(contribution, ensure_ascii=False)
+        hasher.update(f"{key}\0{value}\0".encode("utf-8"))
+        yield key, value
+
+def get_contribution(state, key):
+    """Returns the contribution folded in for a comment key, or None."""
+    contribution = state["contributions"].get(key)
+    if contribution is None and state["store"] is not None:
+        row = _store_connection(state["store"]).execute(
+            "SELECT value FROM contributions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            contribution = json.loads(row[0])
+    return contribution
+
+def iter_contributions(state):
+    """Yields (key, contribution) for every comment folded into the state."""
+    changed = state["contributions"]
+    yield from changed.items()
+    if state["store"] is not None:
+        for key, value in _store_connection(state["store"]).execute("SELECT key, value FROM contributions"):
+            if key not in changed:
+                yield key, json.loads(value)
+
+def _tail_checksum(csvfile, offset):
+    """Short checksum of the bytes of csvfile just before offset."""
+    start = max(0, offset - TAIL_CHECK_BYTES)
+    csvfile.seek(start)
+    return hashlib.sha1(csvfile.read(offset - start)).hexdigest()[:16]
+
+def _file_identity(stat):
+    """What read_csv_tail remembers of the file it read: [device, inode], size and modification time."""
+    return {"file": [stat.st_dev, stat.st_ino], "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+def _rewritten(watermark, stat):
+    """
+    Whether a file changed other than by appending since the watermark was taken: replaced
+    by another file, truncated, or modified without growing (e.g. a label edited in place).
+    """
+    if watermark.get("file") != [stat.st_dev, stat.st_ino] or stat.st_size < watermark["offset"]:
+        return True
+    return stat.st_size <= watermark["size"] and stat.st_mtime_ns != watermark["mtime"]
+
+# --- Core Functions ---
+
+def new_watermark():
+    """Returns the watermark of a file that was not read yet (see read_csv_tail)."""
+    return {"source": None, "header": None, "offset": 0, "rows": 0, "tail": None,
+            "file": None, "size": 0, "mtime": None}
+
+def new_aggregates():
+    """Returns an empty aggregates state."""
+    return {
+        "version": STATE_VERSION,
+        "watermark": new_watermark(),
+        "comments": 0,  # Comments folded in
+        "digest": None,  # Identifies the saved contributions; changes whenever they do
+        "contributions": {},  # Contributions changed since the state was loaded (not saved with the totals)
+        "store": None,  # Contributions file the others are read from (not saved with the totals)
+        "party_sentiment": {},
+        "day_party": {},
+        "party_topics": {},
+        "leaders": {},
+    }
+
+def apply_delta(state, rows, annotations=None):
+    """
+    Folds a batch of comments into the aggregates.
+
+    New comments are added; comments whose key was already folded in are subtracted
+    and re-added with their new values. annotations, if given, holds the topic/leader
+    annotation of each row (see row_contribution). Returns counts of added/replaced/unchanged rows.
+    """
+    stats = {"added": 0, "replaced": 0, "unchanged": 0}
+    contributions = state["contributions"]
+    for position, row in enumerate(rows):
+        key = comment_key(row)
+        contribution = row_contribution(row, annotations[position] if annotations is not None else None)
+        previous = get_contribution(state, key)
+        if previous == contribution:
+            stats["unchanged"] += 1
+            continue
+        if previous is not None:
+            _fold(state, previous, -1)
+            stats["replaced"] += 1
+        else:
+            stats["added"] += 1
+            state["comments"] += 1
+        _fold(state, contribution, 1)
+        contributions[key] = contribution
+    return stats
+
+def merge_aggregates(states):
+    """
+    Returns a new state with the comments of all the given states (e.g. one per dataset
+    partition). A comment folded into several states is counted once, with the values
+    of the last state holding it.
+    """
+    merged = new_aggregates()
+    contributions = merged["contributions"]
+    for state in states:
+        for key, contribution in iter_contributions(state):
+            previous = contributions.get(key)
+            if previous is not None:
+                _fold(merged, previous, -1)
+            _fold(merged, contribution, 1)
+            contributions[key] = contribution
+    merged["comments"] = len(contributions)
+    return merged
+
+def read_csv_tail(watermark, file_path, max_bytes=None):
+    """
+    Reads the complete CSV records appended to file_path since the watermark and advances it.
+
+    watermark is a dictionary (see new_watermark). If it refers to another file, or the
+    file was replaced, truncated or modified since, it is restarted and the file is read
+    from the start. A file is taken as only appended to when it kept its inode and header,
+    and either grew (its bytes just before the offset unchanged) or was not modified at
+    all; so an edit that keeps the length (e.g. positive -> negative) is caught by the
+    modification time, without reading the rows already folded in. A trailing record
+    that is still being written is left for the next call. With max_bytes, roughly that
+    many bytes are read per call (at least one record).
+
+    Returns (rows, restarted).
+    """
+    with open(file_path, mode="rb") as csvfile:
+        header_line = csvfile.readline()
+        header = next(csv.reader([header_line.decode("utf-8")]), [])
+        stat = os.fstat(csvfile.fileno())
+
+        restarted = (watermark["source"] != os.path.abspath(file_path)
+                     or watermark["header"] != header
+                     or _rewritten(watermark, stat))
+        if not restarted and watermark["offset"] > len(header_line):
+            restarted = _tail_checksum(csvfile, watermark["offset"]) != watermark["tail"]
+        if restarted:
+            watermark.update(source=os.path.abspath(file_path), header=header,
+                             offset=len(header_line), rows=0, tail=None)
+        watermark.update(_file_identity(stat))
+
+        csvfile.seek(watermark["offset"])
+        chunk = csvfile.read(max_bytes or -1)
+        complete = _complete_records_length(chunk)
+        while not complete and max_bytes:
+            more = csvfile.read(max_bytes)
+            if not more:
+                break
+            chunk += more
+            complete = _complete_records_length(chunk)
+
+        rows = list(csv.DictReader(io.StringIO(chunk[:complete].decode("utf-8"), newline=""), fieldnames=header))
+        if complete:
+            watermark["offset"] += complete
+            watermark["rows"] += len(rows)
+            watermark["tail"] = _tail_checksum(csvfile, watermark["offset"])
+    return rows, restarted
+
+def advance_watermark(watermark, file_path, rows):
+    """
+    Moves the watermark to the end of file_path, which holds `rows` records: for a file
+    rewritten in place whose rows are all folded in already (e.g. re-annotated).
+    """
+    with open(file_path, mode="rb") as csvfile:
+        header_line = csvfile.readline()
+        stat = os.fstat(csvfile.fileno())
+        size = stat.st_size
+        watermark.update(_file_identity(stat))
+        watermark.update(source=os.path.abspath(file_path),
+                         header=next(csv.reader([header_line.decode("utf-8")]), []),
+                         offset=size, rows=rows,
+                         tail=_tail_checksum(csvfile, size) if size > len(header_line) else None)
+
+def read_appended_rows(state, file_path):
+    """
+    Reads the rows appended to file_path since the stored watermark and advances it.
+
+    If the file is not the one the watermark refers to, or was rewritten/truncated,
+    the aggregates are reset and the file is read from the start.
+    """
+    previous_source = state["watermark"]["source"]
+    rows, restarted = read_csv_tail(state["watermark"], file_path)
+    if restarted:
+        if previous_source is not None:
+            print(f"Dataset {file_path} was rewritten; rebuilding aggregates from scratch.")
+        watermark = state["watermark"]
+        state.clear()
+        state.update(new_aggregates())
+        state["watermark"] = watermark
+    return rows
+
+def refresh_aggregates(state, file_path=visualizations.INPUT_CSV_PATH):
+    """Folds the rows appended to file_path since the last refresh into the aggregates."""
+    if not os.path.exists(file_path):
+        print(f"Warning: Data file {file_path} not found.")
+        return {"added": 0, "replaced": 0, "unchanged": 0}
+    rows = read_appended_rows(state, file_path)
+    return apply_delta(state, rows)
+
+def load_aggregates(state_path=AGGREGATES_STATE_PATH):
+    """
+    Loads a saved aggregates state, or returns an empty one. Only the totals are read;
+    contributions are looked up in the contributions file as comments come in.
+    """
+    if not os.path.exists(state_path):
+        return new_aggregates()
+    try:
+        with open(state_path, mode="r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (IOError, ValueError) as e:
+        print(f"Error reading aggregates state {state_path}: {e}. Starting from scratch.")
+        return new_aggregates()
+    if state.get("version") != STATE_VERSION:
+        print(f"Aggregates state {state_path} has an old format. Starting from scratch.")
+        return new_aggregates()
+    store_path = os.path.abspath(contributions_path(state_path))
+    try:
+        stored_digest = _store_digest(store_path)
+    except sqlite3.Error as e:
+        print(f"Error reading aggregates contributions {store_path}: {e}. Starting from scratch.")
+        return new_aggregates()
+    if stored_digest != state["digest"]:
+        # E.g. interrupted between saving the contributions and the totals
+        print(f"Aggregates state {state_path} doesn't match {store_path}. Starting from scratch.")
+        return new_aggregates()
+    state["contributions"] = {}
+    state["store"] = store_path if stored_digest is not None else None
+    return state
+
+def save_aggregates(state, state_path=AGGREGATES_STATE_PATH):
+    """
+    Atomically saves the aggregates state: the contributions file first, then the totals
+    as JSON. For a state loaded from state_path only the changed contributions are written;
+    otherwise (e.g. a new or merged state) the contributions file is written anew.
+    """
+    store_path = os.path.abspath(contributions_path(state_path))
+    changed = state["contributions"]
+    if state["store"] == store_path:
+        if changed:
+            hasher = hashlib.sha1(state["digest"].encode("utf-8"))  # Chained onto the saved contributions
+            connection = _store_connection(store_path)
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO contributions (key, value) VALUES (?, ?)",
+                                       _stored_rows(sorted(changed.items()), hasher))
+                connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('digest', ?)",
+                                   (hasher.hexdigest(),))
+            state["digest"] = hasher.hexdigest()
+    else:
+        tmp_store_path = store_path + ".tmp"
+        if os.path.exists(tmp_store_path):
+            os.remove(tmp_store_path)
+        hasher = hashlib.sha1()
+        connection = _store_connection(tmp_store_path)
+        try:
+            with connection:
+                connection.executemany("INSERT INTO contributions (key, value) VALUES (?, ?)",
+                                       _stored_rows(iter_contributions(state), hasher))
+                connection.execute("INSERT INTO meta (name, value) VALUES ('digest', ?)", (hasher.hexdigest(),))
+        finally:
+            _close_store(tmp_store_path)
+        _close_store(store_path)
+        os.replace(tmp_store_path, store_path)
+        state["digest"] = hasher.hexdigest()
+        state["store"] = store_path
+    state["contributions"] = {}
+
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, mode="w", encoding="utf-8") as f:
+        json.dump({key: value for key, value in state.items() if key not in ("contributions", "store")},
+                  f, ensure_ascii=False)
+    os.replace(tmp_path, state_path)
+
+# --- Chart Payloads (same format as visualizations.get_*_data) ---
+
+def get_paired_bar_plot_data(state):
+    """Paired bar payload of positive vs. negative sentiment per party."""
+    sentiment_counts = {}
+    for party, counts in state["party_sentiment"].items():
+        if not party or party == "Undefined":
+            continue
+        if counts.get("positive") or counts.get("negative"):
+            sentiment_counts[party] = {
+                "positive": counts.get("positive", 0),
+                "negative": counts.get("negative", 0),
+            }
+    if not sentiment_counts and not state["comments"]:
+        return {"labels": [], "datasets": []}
+    return visualizations._paired_bar_payload(sentiment_counts)
+
+def get_pie_chart_party_distribution_data(state):
+    """Pie payload of mentions per party."""
+    party_counts = visualizations.Counter({
+        party: sum(counts.values())
+        for party, counts in state["party_sentiment"].items()
+        if party and party != "Undefined"
+    })
+    return visualizations._party_distribution_payload(party_counts)
+
+def get_time_series_party_mentions_data(state, top_n=None):
+    """Time series payload of mentions per party per day."""
+    mentions_by_day_party = {
+        day: visualizations.Counter({p: n for p, n in counts.items() if p and p != "Undefined"})
+        for day, counts in state["day_party"].items()
+    }
+    return visualizations._time_series_payload(mentions_by_day_party, top_n)
+
+def get_pie_chart_leader_distribution_data(state, count_all=False):
+    """Pie payload of mentions per party leader (every leader mentioned with count_all=True)."""
+    if not state["comments"]:
+        return {"labels": [], "datasets": []}
+    return visualizations._leader_distribution_payload(
+        state["leaders"].get("mentioned" if count_all else "main", {})
+    )
+
+def get_topic_frequencies(state, party_filter="overall"):
+    """Returns {topic: mentions}, overall or for a single party."""
+    if party_filter != "overall":
+        return dict(state["party_topics"].get(party_filter, {}))
+    frequencies = visualizations.Counter()
+    for counts in state["party_topics"].values():
+        frequencies.update(counts)
+    return dict(frequencies)
+
+# --- Main Execution ---
+
+def main():
+    """Refreshes the saved aggregates with rows appended to the dataset (and an optional delta file)."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Incrementally maintain the dashboard chart aggregates.")
+    parser.add_argument("--data", default=visualizations.INPUT_CSV_PATH, help="Dataset CSV to tail.")
+    parser.add_argument("--state", default=AGGREGATES_STATE_PATH, help="Where the aggregates are stored.")
+    parser.add_argument("--delta", help="CSV of new or re-classified comments to fold in.")
+    parser.add_argument("--rebuild", action="store_true", help="Discard the stored state first.")
+    args = parser.parse_args()
+
+    state = new_aggregates() if args.rebuild else load_aggregates(args.state)
+    stats = refresh_aggregates(state, args.data)
+    print(f"Dataset {args.data}: {stats['added']} added, {stats['replaced']} replaced, "
+          f"{stats['unchanged']} unchanged.")
+
+    if args.delta:
+        delta_stats = apply_delta(state, visualizations.read_csv_data(args.delta))
+        print(f"Delta {args.delta}: {delta_stats['added']} added, {delta_stats['replaced']} replaced, "
+              f"{delta_stats['unchanged']} unchanged.")
+
+    save_aggregates(state, args.state)
+    print(f"Aggregates for {state['comments']} comments saved to {args.state}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Load test for api_server.py: sends GET requests from concurrent clients and reports
+throughput (requests/s) and latency percentiles per run.
+
+Each client keeps one HTTP/1.1 connection open and cycles through the given paths.
+With --revalidate, clients send the ETag from their previous response for that path
+(If-None-Match), as a polling dashboard would, so unchanged payloads come back as 304.
+
+Example (with the server running):
+    python api_load_test.py --clients 16 --requests 2000 --gzip --revalidate
+"""
+
+import argparse
+import http.client
+import threading
+import time
+from collections import Counter
+
+# --- Configuration & Constants ---
+
+DEFAULT_PATHS = [
+    "/api/sentiment",
+    "/api/party-distribution",
+    "/api/mentions?granularity=day",
+    "/api/mentions?granularity=hour&start=2025-04-20&end=2025-05-05&party=PS,AD",
+    "/api/leaders",
+    "/api/topics?party=CHEGA",
+]
+
+# --- Core Functions ---
+
+def run_client(host, port, paths, n_requests, offset, use_gzip, revalidate, latencies, statuses, lock):
+    """Sends n_requests GETs over one connection, recording latencies (seconds) and status codes."""
+    connection = http.client.HTTPConnection(host, port, timeout=60)
+    etags = {}
+    local_latencies = []
+    local_statuses = Counter()
+    for i in range(n_requests):
+        path = paths[(offset + i) % len(paths)]
+        headers = {}
+        if use_gzip:
+            headers["Accept-Encoding"] = "gzip"
+        if revalidate and path in etags:
+            headers["If-None-Match"] = etags[path]
+        start = time.perf_counter()
+        try:
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as e:
+            local_statuses[f"error: {type(e).__name__}"] += 1
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=60)
+            continue
+        local_latencies.append(time.perf_counter() - start)
+        local_statuses[response.status] += 1
+        if response.getheader("ETag"):
+            etags[path] = response.getheader("ETag")
+    connection.close()
+    with lock:
+        latencies.extend(local_latencies)
+        statuses.update(local_statuses)
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def run_load_test(host, port, paths, clients, total_requests, use_gzip=False, revalidate=False):
+    """Runs the load test; returns a summary dictionary."""
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    per_client = max(1, total_requests // clients)
+    threads = [
+        threading.Thread(
+            target=run_client,
+            args=(host, port, paths, per_client, i, use_gzip, revalidate, latencies, statuses, lock),
+        )
+        for i in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed if elapsed else float("nan"),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": (latencies[-1] if latencies else float("nan")) * 1000,
+        "statuses": dict(statuses),
+    }
+
+# --- Main Execution ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the chart payload API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients (threads).")
+    parser.add_argument("--requests", type=int, default=1000, help="Total requests across all clients.")
+    parser.add_argument("--path", action="append", dest="paths", help="Path to request (repeatable).")
+    parser.add_argument("--gzip", action="store_true", help="Send Accept-Encoding: gzip.")
+    parser.add_argument("--revalidate", action="store_true", help="Send If-None-Match with the last ETag.")
+    args = parser.parse_args()
+
+    summary = run_load_test(args.host, args.port, args.paths or DEFAULT_PATHS, args.clients,
+                            args.requests, args.gzip, args.revalidate)
+    print(f"{summary['requests']} requests from {args.clients} clients in {summary['seconds']:.2f} s")
+    print(f"  {summary['requests_per_second']:.1f} requests/s")
+    print(f"  latency p50 {summary['p50_ms']:.1f} ms, p99 {summary['p99_ms']:.1f} ms, max {summary['max_ms']:.1f} ms")
+    print(f"  status codes: {summary['statuses']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+Headless JSON API serving the dashboard's chart payloads.
+
+Every payload is built by the same visualizations.get_*_data functions as the
+dashboard, from the same data source, resolved on every request as app.py does: the
+partitioned elections (see partitions.py) when there are any, else the comments
+database (see storage.py) if it exists, else the dataset CSV, served from live compact
+comments (see live.py) so appended rows are served without reloading the file.
+Endpoints (GET):
+
+    /api/version                 data source, version and row count
+    /api/sentiment               positive vs. negative sentiment per party
+    /api/party-distribution      mentions per party
+    /api/mentions                mentions per party over time (granularity=hour|day|week, top_n=N,
+                                 max_points=N to downsample long series, see visualizations.downsample_time_series)
+    /api/leaders                 mentions per party leader (count_all=1 for every leader mentioned)
+    /api/topics                  topic frequencies
+
+All chart endpoints accept start=YYYY-MM-DD, end=YYYY-MM-DD and party=PS,AD (or a
+repeated party parameter) to restrict the comments they are built from. With
+partitioned datasets, every endpoint accepts election=SUBREDDIT/FLAIR (repeated for
+their union) to select elections; the default is the most recent one, as in the dashboard.
+
+Responses carry an ETag (If-None-Match gets a 304) and are gzip-compressed when the
+client accepts it. Encoded responses are cached per data source, version and query,
+so concurrent clients asking for the same chart share the work.
+
+Run with:
+    python api_server.py --port 8502
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import live
+import partitions
+import storage
+import visualizations
+
+# --- Configuration & Constants ---
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8502
+RESPONSE_CACHE_SIZE = 256  # Encoded responses kept in memory
+FRAME_CACHE_SIZE = 4  # Frames of partition selections or the database kept in memory
+GZIP_MIN_BYTES = 1024  # Smaller bodies are sent uncompressed
+
+# Endpoint -> (needs topic/leader columns, query parameters it accepts besides the filters)
+ENDPOINTS = {
+    "/api/sentiment": (False, ()),
+    "/api/party-distribution": (False, ()),
+    "/api/mentions": (False, ("granularity", "top_n", "max_points")),
+    "/api/leaders": (True, ("count_all",)),
+    "/api/topics": (True, ()),
+}
+FILTER_PARAMETERS = ("start", "end", "party")
+SOURCE_PARAMETERS = ("election",)  # Accepted by every endpoint, /api/version included
+
+class BadRequest(ValueError):
+    """Raised for invalid query parameters (answered with a 400)."""
+
+# --- Helper Functions ---
+
+def parse_elections(query):
+    """The (subreddit, flair) pairs of a query's election=SUBREDDIT/FLAIR parameters, sorted."""
+    elections = set()
+    for value in query.get("election", []):
+        subreddit, sep, flair = value.partition("/")
+        if not (sep and subreddit.strip() and flair.strip()):
+            raise BadRequest("election must be SUBREDDIT/FLAIR")
+        elections.add((subreddit.strip(), flair.strip()))
+    return tuple(sorted(elections))
+
+def parse_query(endpoint, query_string):
+    """Validates the query of an endpoint; returns its normalized parameters as a sorted tuple."""
+    query = parse_qs(query_string, keep_blank_values=True)
+    allowed = set(SOURCE_PARAMETERS)
+    if endpoint in ENDPOINTS:
+        allowed |= set(FILTER_PARAMETERS) | set(ENDPOINTS[endpoint][1])
+    unknown = sorted(set(query) - allowed)
+    if unknown:
+        raise BadRequest(f"Unknown parameter(s) for {endpoint}: {', '.join(unknown)}")
+
+    params = {}
+    elections = parse_elections(query)
+    if elections:
+        params["election"] = elections
+    for name in ("start", "end"):
+        if query.get(name, [""])[-1]:
+            try:
+                params[name] = date.fromisoformat(query[name][-1]).isoformat()
+            except ValueError:
+                raise BadRequest(f"{name} must be a date (YYYY-MM-DD)")
+    parties = sorted({p.strip() for value in query.get("party", []) for p in value.split(",") if p.strip()})
+    if parties:
+        params["party"] = ",".join(parties)
+
+    granularity = query.get("granularity", ["day"])[-1]
+    if "granularity" in allowed:
+        if granularity not in visualizations.TIME_SERIES_GRANULARITIES:
+            raise BadRequest(f"granularity must be one of {', '.join(visualizations.TIME_SERIES_GRANULARITIES)}")
+        params["granularity"] = granularity
+    for name in ("top_n", "max_points"):
+        if query.get(name, [""])[-1]:
+            try:
+                params[name] = int(query[name][-1])
+            except ValueError:
+                raise BadRequest(f"{name} must be an integer")
+    if params.get("max_points", 3) < 3:
+        raise BadRequest("max_points must be at least 3")
+    if "count_all" in query:
+        params["count_all"] = query["count_all"][-1].lower() in ("1", "true", "yes")
+    return tuple(sorted(params.items()))
+
+def build_payload(endpoint, params, frame):
+    """Builds the chart payload of an endpoint from a compact frame."""
+    params = dict(params)
+    start = date.fromisoformat(params["start"]) if "start" in params else None
+    end = date.fromisoformat(params["end"]) if "end" in params else None
+    parties = params["party"].split(",") if "party" in params else None
+    comments = visualizations.filter_compact_comments(frame, start, end, parties)
+
+    if endpoint == "/api/sentiment":
+        return visualizations.get_paired_bar_plot_data(comments)
+    if endpoint == "/api/party-distribution":
+        return visualizations.get_pie_chart_party_distribution_data(comments)
+    if endpoint == "/api/mentions":
+        payload = visualizations.get_time_series_party_mentions_data(
+            comments, top_n=params.get("top_n"), granularity=params["granularity"]
+        )
+        if "max_points" in params:
+            payload = visualizations.downsample_time_series(payload, params["max_points"])
+        return visualizations.to_json_compatible(payload)
+    if endpoint == "/api/leaders":
+        return visualizations.get_pie_chart_leader_distribution_data(comments, count_all=params.get("count_all", False))
+    return visualizations.get_word_cloud_data(comments)
+
+def encode_response(payload):
+    """Returns (body, gzipped body or None, ETag) for a JSON payload."""
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    compressed = gzip.compress(body, compresslevel=6, mtime=0) if len(body) >= GZIP_MIN_BYTES else None
+    return body, compressed, '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+def elections_by_recency(partition_root):
+    """The elections partitioned under partition_root, most recent first (as listed in the dashboard)."""
+    latest_day = {}
+    for partition in partitions.list_partitions(partition_root):
+        election = (partition["subreddit"], partition["flair"])
+        if partition["day"] != partitions.UNKNOWN_DAY:
+            latest_day[election] = max(latest_day.get(election, ""), partition["day"])
+        else:
+            latest_day.setdefault(election, "")
+    return sorted(latest_day, key=lambda e: (latest_day[e], e), reverse=True)
+
+# --- Core Functions ---
+
+def new_api_state(file_path=visualizations.INPUT_CSV_PATH, partition_root=partitions.DEFAULT_PARTITION_ROOT,
+                  db_path=storage.DEFAULT_DB_PATH):
+    """
+    Returns the state shared by all request threads: where datasets are looked for, the
+    live CSV datasets, the frames of the current partitions or database, and the response cache.
+    """
+    return {
+        "source": file_path,
+        "partition_root": partition_root,
+        "db_path": db_path,
+        "datasets": {
+            False: live.new_live_dataset(file_path, annotate=False),
+            True: live.new_live_dataset(file_path, annotate=True),
+        },
+        "partition_caches": {False: partitions.new_partition_cache(), True: partitions.new_partition_cache()},
+        "frames": OrderedDict(),  # (source, annotated) -> (version, frame) of partitions or the database
+        "frames_lock": threading.Lock(),
+        "cache": OrderedDict(),
+        "cache_lock": threading.Lock(),
+    }
+
+def current_source(state, elections=()):
+    """
+    Returns the data source payloads are built from and a description of it, as app.py
+    resolves it: a tuple of the partition files of the requested elections (default: the
+    most recent one) when there are partitioned datasets, else the comments database if
+    it exists, else the dataset CSV.
+    """
+    available = elections_by_recency(state["partition_root"])
+    if available:
+        unknown = [f"{subreddit}/{flair}" for subreddit, flair in elections if (subreddit, flair) not in available]
+        if unknown:
+            raise BadRequest(f"Unknown election(s): {', '.join(unknown)}. Elections: "
+                             + ", ".join(f"{subreddit}/{flair}" for subreddit, flair in available))
+        elections = elections or available[:1]
+        paths = tuple(p["path"] for p in partitions.list_partitions(state["partition_root"], elections=elections))
+        return paths, {"kind": "partitions", "source": state["partition_root"],
+                       "elections": [f"{subreddit}/{flair}" for subreddit, flair in elections]}
+    if elections:
+        raise BadRequest(f"There are no partitioned elections under {state['partition_root']}")
+    if storage.get_storage_version(state["db_path"]) is not None:
+        return state["db_path"], {"kind": "database", "source": state["db_path"]}
+    return state["source"], {"kind": "csv", "source": state["source"]}
+
+def load_frame(state, source, annotated):
+    """
+    Returns (version, compact frame) of a data source (see current_source). Partitions and
+    the database are loaded again only when their version changes; the CSV is tailed.
+    """
+    if source == state["source"]:
+        dataset = state["datasets"][annotated]
+        live.refresh_live_dataset(dataset)
+        # Read once, with the version under the lock: a refresh swaps in a new frame rather than changing it
+        with dataset["lock"]:
+            return live.live_version(dataset), dataset["frame"]
+    if isinstance(source, tuple):
+        version = partitions.get_partitions_version(source)
+    else:
+        version = storage.get_storage_version(source)
+    frames = state["frames"]
+    with state["frames_lock"]:  # Concurrent requests for a new version wait for a single load
+        cached = frames.get((source, annotated))
+        if cached is None or cached[0] != version:
+            if isinstance(source, tuple):
+                frame = partitions.load_partitions(state["partition_caches"][annotated], source, annotate=annotated)
+            else:
+                frame = storage.load_compact_comments(source, annotate=annotated)
+            cached = (version, frame)
+            frames[(source, annotated)] = cached
+        frames.move_to_end((source, annotated))
+        while len(frames) > FRAME_CACHE_SIZE:
+            frames.popitem(last=False)
+    return cached
+
+def get_response(state, endpoint, query_string):
+    """Returns the encoded (body, gzipped body, ETag) for a chart endpoint, from the cache when possible."""
+    params = parse_query(endpoint, query_string)
+    annotated = ENDPOINTS[endpoint][0]
+    source, _ = current_source(state, dict(params).get("election", ()))
+    version, frame = load_frame(state, source, annotated)
+    # Live versions count the frames of one dataset, so the annotation is part of the key
+    key = (endpoint, params, source, annotated, version)
+
+    cache = state["cache"]
+    with state["cache_lock"]:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    # Built outside the lock so slow charts don't block others; concurrent misses may both build
+    response = encode_response(build_payload(endpoint, params, frame))
+    with state["cache_lock"]:
+        cache[key] = response
+        while len(cache) > RESPONSE_CACHE_SIZE:
+            cache.popitem(last=False)
+    return response
+
+def version_payload(state, query_string=""):
+    """Payload of /api/version."""
+    params = dict(parse_query("/api/version", query_string))
+    source, description = current_source(state, params.get("election", ()))
+    version, frame = load_frame(state, source, False)
+    return dict(description, version=version, rows=len(frame))
+
+class ChartAPIHandler(BaseHTTPRequestHandler):
+    """Serves the chart payloads of the shared API state (set on the server as `api_state`)."""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive, so load tests and polling clients reuse connections
+    # Headers and body are written separately; with Nagle's algorithm the body then waits
+    # for the client's delayed ACK (~40 ms per response on keep-alive connections)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            if url.path == "/api/version":
+                response = encode_response(version_payload(self.server.api_state, url.query))
+            elif url.path in ENDPOINTS:
+                response = get_response(self.server.api_state, url.path, url.query)
+            else:
+                self.send_json_error(404, f"Unknown endpoint {url.path}. Endpoints: /api/version, "
+                                          + ", ".join(ENDPOINTS))
+                return
+        except BadRequest as e:
+            self.send_json_error(400, str(e))
+            return
+        except Exception as e:
+            print(f"Error serving {self.path}: {e}")
+            self.send_json_error(500, "Internal error")
+            return
+        self.send_payload(*response)
+
+    def send_payload(self, body, compressed, etag):
+        """Sends an encoded payload, honouring If-None-Match and Accept-Encoding."""
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        use_gzip = compressed is not None and "gzip" in self.headers.get("Accept-Encoding", "")
+        content = compressed if use_gzip else body
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")  # Clients revalidate with the ETag
+        self.send_header("Vary", "Accept-Encoding")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_json_error(self, status, message):
+        body = json.dumps({"error": message}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # One line per request would dominate the output under load
+
+def create_server(host=DEFAULT_HOST, port=DEFAULT_PORT, file_path=visualizations.INPUT_CSV_PATH,
+                  partition_root=partitions.DEFAULT_PARTITION_ROOT, db_path=storage.DEFAULT_DB_PATH):
+    """Creates the threaded API server (call serve_forever() on it)."""
+    server = ThreadingHTTPServer((host, port), ChartAPIHandler)
+    server.daemon_threads = True
+    server.api_state = new_api_state(file_path, partition_root, db_path)
+    return server
+
+# --- Main Execution ---
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the dashboard chart payloads as JSON.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--data", default=visualizations.INPUT_CSV_PATH,
+                        help="Dataset CSV, served when there are no partitions and no database.")
+    parser.add_argument("--partition-root", default=partitions.DEFAULT_PARTITION_ROOT,
+                        help="Partitioned datasets (see partitions.py); served first when present.")
+    parser.add_argument("--db", default=storage.DEFAULT_DB_PATH,
+                        help="Comments database (see storage.py); served when there are no partitions.")
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.data, args.partition_root, args.db)
+    source, description = current_source(server.api_state)
+    print(f"Loading {description['source']} ({description['kind']})...")
+    for annotated in (False, True):
+        load_frame(server.api_state, source, annotated)  # So the first clients don't wait for the initial load
+    print(f"Serving chart payloads on http://{args.host}:{args.port}/api/ (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
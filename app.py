@@ -1,431 +1,770 @@
-import streamlit as st
-import pandas as pd
-import visualizations
-import matplotlib.pyplot as plt
-import plotly.express as px
-import plotly.graph_objects as go
-from wordcloud import WordCloud
-from collections import Counter, defaultdict
-import random
-from matplotlib.colors import LinearSegmentedColormap
-from PIL import Image
-import io
-from datetime import datetime
-
-st.set_page_config(layout="wide") 
-
-container = st.container()
-with container:
-    st.title("iPolls: A Public Perception of Political Parties")
-    st.markdown("This dashboard analyzes the public perception of political parties in Portugal using Reddit data.")
-
-# data = pd.read_csv("comments_with_sentiment.csv")
-data = visualizations.read_csv_data("comments_with_sentiment.csv")
-# data = csv.DictReader("comments_with_sentiment.csv")
-
-col1, col2 = st.columns([3, 2])
-
-with col1:
-    st.subheader("Sentiment Analysis")
-
-    chart_choice = st.radio("Select Analysis:", ["Total Counts", "Percentage (%)"], horizontal=True)
-    chart_data = visualizations.get_paired_bar_plot_data(data)
-
-    if chart_choice == "Total Counts":
-
-        df = pd.DataFrame({
-            'Party': chart_data["labels"],
-            'Positive': chart_data["datasets"][0]["data"],
-            'Negative': chart_data["datasets"][1]["data"]
-        })
-        
-        # Create the bar chart
-        fig = go.Figure()
-
-        fig.add_trace(go.Bar(
-            x=df['Party'],
-            y=df['Positive'],
-            name='Positive',
-            marker_color="#4CAF50",  # Green
-            text=df['Positive'],
-            textposition='auto'
-        ))
-        
-        # Add negative bars
-        fig.add_trace(go.Bar(
-            x=df['Party'],
-            y=df['Negative'],
-            name='Negative',
-            marker_color="#F44336",  # Red
-            text=df['Negative'],
-            textposition='auto'
-        ))
-
-        fig.update_layout(
-            title='Positive vs Negative Sentiment',
-            barmode='group',  # Side-by-side bars
-            legend=dict(orientation="h")
-        )
-
-        # Display the chart
-        st.plotly_chart(fig, use_container_width=True)
-    
-    elif chart_choice == "Percentage (%)":
-        
-        df = pd.DataFrame({
-            'Party': chart_data["labels"],
-            'Positive': [round(p) for p in chart_data["datasets"][0]["percentage"]],
-            'Negative': [round(n) for n in chart_data["datasets"][1]["percentage"]],
-        })
-
-        # Create the stacked bar chart
-        fig = go.Figure()
-
-        fig.add_trace(go.Bar(
-            x=df['Party'],
-            y=df['Positive'],
-            name='Positive',
-            marker_color="#4CAF50",  # Green
-            text=[f"{x}%" for x in df['Positive']],
-            textposition='auto'
-        ))
-
-        fig.add_trace(go.Bar(
-            x=df['Party'],
-            y=df['Negative'],
-            name='Negative',
-            marker_color="#F44336",  # Red
-            text=[f"{x}%" for x in df['Negative']],
-            textposition='auto'
-        ))
-
-        fig.update_layout(
-            title='Positive vs Negative Sentiment',
-            barmode='stack',  # Stacked bars instead of grouped
-            legend=dict(orientation="h"),
-            xaxis_title='Party',
-            yaxis_title='Percentage (%)',
-            yaxis=dict(range=[0, 100])  # Optional: limit Y-axis to 100%
-        )
-
-        # Display the chart
-        st.plotly_chart(fig, use_container_width=True)
-
-
-    st.subheader("Party Mentions Over Time")
-
-    time_series_data = visualizations.get_time_series_party_mentions_data(data)
-
-    if time_series_data["labels"] and time_series_data["datasets"]:
-
-        debate_info = {
-            "2025-04-07": "7th April: AD-CDU (TVI), Chega-PAN (RTP3)",
-            "2025-04-08": "8th April: PS-BE (SIC), Chega-Livre (RTP3)",
-            "2025-04-09": "9th April: CDU-Livre (SIC Notícias)",
-            "2025-04-10": "10th April: PS-IL (RTP1), BE-PAN (CNN Portugal)",
-            "2025-04-11": "11th April: AD-Livre (TVI), IL-CDU (SIC Notícias)",
-            "2025-04-12": "12th April: PS-PAN (TVI), BE-CDU (RTP3)",
-            "2025-04-13": "13th April: AD-PAN (SIC), IL-Livre (CNN Portugal)",
-            "2025-04-14": "14th April: AD-IL (RTP1), BE-Livre (SIC Notícias)",
-            "2025-04-15": "15th April: PS-Chega (TVI), IL-PAN (SIC Notícias)",
-            "2025-04-16": "16th April: AD-BE (RTP1), Chega-CDU (CNN Portugal)",
-            "2025-04-17": "17th April: PS-Livre (SIC), Chega-IL (RTP3)",
-            "2025-04-21": "21st April: PS-CDU (RTP1), Chega-BE (SIC Notícias)",
-            "2025-04-22": "22nd April: Livre-PAN (RTP3)",
-            "2025-04-23": "23rdth April: CDU-PAN (CNN Portugal)",
-            "2025-04-24": "24th April: AD-Chega (SIC), IL-BE (CNN Portugal)",
-            "2025-04-30": "30th April: AD-PS (RTP1, SIC, TVI)",
-            "2025-05-04": "04th May: All-party debate (RTP1)",
-            "2025-05-06": "06th May: All-party debate (RTP1)",
-            "2025-05-08": "08th May: Parties with no parliamentary seat debate (RTP1)"
-        }
-        
-        # Create a placeholder for the chart
-        chart_placeholder = st.empty()
-
-        date_objects = [datetime.strptime(label, "%Y-%m-%d") for label in time_series_data["labels"]]
-        min_date = min(date_objects)
-        max_date = max(date_objects)
-
-        start_date, end_date = st.date_input(
-            "Select date range:",
-            value=[min_date, max_date],
-            min_value=min_date,
-            max_value=max_date
-        )
-        date_mask = [(d.date() >= start_date and d.date() <= end_date) for d in date_objects]
-        # Filter the labels (dates) and datasets
-        filtered_labels = [label for label, keep in zip(time_series_data["labels"], date_mask) if keep]
-        filtered_dates = [d for d, keep in zip(date_objects, date_mask) if keep]
-        filtered_datasets = []
-        for dataset in time_series_data["datasets"]:
-            filtered_data = [val for val, keep in zip(dataset["data"], date_mask) if keep]
-            filtered_datasets.append({
-                "label": dataset["label"],
-                "data": filtered_data,
-                "borderColor": dataset["borderColor"]
-            })
-
-        # Display filter options below the chart space
-        selected_parties = st.multiselect(
-            "Filter parties to display:",
-            options=[dataset["label"] for dataset in time_series_data["datasets"]],
-            default=[dataset["label"] for dataset in time_series_data["datasets"]]
-        )
-        
-        # Create filtered figure based on selection
-        filtered_fig = go.Figure()
-
-        # Add a special invisible trace just for the hover text
-        # This will be the ONLY trace that shows hover information
-        hover_y_values = [0] * len(filtered_labels)
-        hover_texts = [
-            debate_info.get(date, "") for date, keep in zip(time_series_data["labels"], date_mask) if keep
-        ]
-        
-        # # Populate hover texts for debate dates
-        # for i, date in enumerate(time_series_data["labels"]):
-        #     if date in debate_info:
-        #         hover_texts[i] = debate_info[date]
-        
-        # Add invisible hover trace
-        filtered_fig.add_trace(go.Scatter(
-            x=filtered_labels,
-            y=hover_y_values,
-            mode='lines',
-            line=dict(width=0),
-            opacity=0,
-            hoverinfo="text",
-            text=hover_texts,
-            hovertemplate="%{text}<extra></extra>",
-            showlegend=False,
-        ))
-        
-        # Add all normal data traces but with hoverinfo="none"
-        for dataset in filtered_datasets:
-            if dataset["label"] in selected_parties:
-                filtered_fig.add_trace(go.Scatter(
-                    x=filtered_labels,
-                    y=dataset["data"],
-                    mode='lines+markers',
-                    name=dataset["label"],
-                    line=dict(color=dataset["borderColor"], width=2),
-                    marker=dict(size=6),
-                    hoverinfo="none",  # Disable hover for data traces
-                ))
-        
-        # Update layout
-        filtered_fig.update_layout(
-            title="Party Mentions Trend",
-            xaxis_title="Date",
-            yaxis_title="Number of Mentions",
-            legend_title="Political Party",
-            hovermode="x unified",  # Use closest to prevent multiple hovers
-            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-        )
-        
-        filtered_fig.update_xaxes(tickformat="%d/%m")
-
-        # Display the chart in the placeholder
-        chart_placeholder.plotly_chart(filtered_fig, use_container_width=True)
-            
-    else:
-        st.warning("No time series data available to generate the chart.")
-
-with col2:
-    st.subheader("Party Mention Distribution")
-
-    chart_choice = st.radio("Select Analysis:", ["Per Party", "Per Candidate"], horizontal=True)
-    
-    if chart_choice == "Per Party":
-
-        chart_data = visualizations.get_pie_chart_party_distribution_data(data)
-        df = pd.DataFrame({
-            'Party': chart_data["labels"],
-            'Mentions': chart_data["datasets"][0]["data"]
-        })
-
-        color_map = {party: color for party, color in zip(
-            chart_data["labels"], 
-            chart_data["datasets"][0]["backgroundColor"]
-        )}
-        
-        # Create and display the Plotly pie chart
-        fig = px.pie(
-            df, 
-            values='Mentions', 
-            names='Party',
-            title='Distribution of Mentions per Party',
-            color='Party',
-            color_discrete_map=color_map
-        )
-        fig.update_traces(textposition='inside', textinfo='percent+label')
-        fig.update_layout(
-            legend_title="Political Party",
-            showlegend=True,
-            legend=dict(
-                orientation="v",  # Changed from "h" to "v" for vertical orientation
-                yanchor="middle",  # Anchor point for y
-                y=0.5,  # Center vertically
-                xanchor="right",  # Anchor point for x
-                x=1.1  # Position slightly to the right of the plot
-            )
-        )
-        st.plotly_chart(fig, use_container_width=True)
-    
-    if chart_choice == "Per Candidate":
-
-        chart_data2 = visualizations.get_pie_chart_leader_distribution_data(data)
-        df2 = pd.DataFrame({
-            'Leader': chart_data2["labels"],
-            'Mentions': chart_data2["datasets"][0]["data"]
-        })
-
-        color_map = {leader: color for leader, color in zip(
-            chart_data2["labels"], 
-            chart_data2["datasets"][0]["backgroundColor"]
-        )}
-        
-        # Create and display the Plotly pie chart
-        fig = px.pie(
-            df2, 
-            values='Mentions', 
-            names='Leader',
-            title='Distribution of Mentions per Candidate',
-            color='Leader',
-            color_discrete_map=color_map
-        )
-        fig.update_traces(textposition='inside', textinfo='percent+label')
-        fig.update_layout(
-            legend_title="Party Leader",
-            showlegend=True,
-            legend=dict(
-                orientation="v",  # Changed from "h" to "v" for vertical orientation
-                yanchor="middle",  # Anchor point for y
-                y=0.5,  # Center vertically
-                xanchor="right",  # Anchor point for x
-                x=1.3  # Position slightly to the right of the plot
-            )
-        )
-        st.plotly_chart(fig, use_container_width=True)
-
-
-    st.subheader("Trendy Topics")
-
-    data = pd.DataFrame(data)
-    data['topics'] = data['texto_comentario'].apply(lambda x: visualizations.identify_topics(x))
-    all_topics = [topic for topics_list in data['topics'] for topic in topics_list if topic != "Undefined"]
-    topic_counts = Counter(all_topics)
-    topic_freq = {topic: count for topic, count in topic_counts.items()}
-
-    portuguese_party_colors = [
-        "#F886A8",  # PS (Socialist Party) - rose/pink
-        "#F8812A",  # PSD (Social Democratic Party) - orange
-        "#0094D4",  # CDS-PP (People's Party) - blue
-        "#BE0019",  # BE (Left Bloc) - red
-        "#8C0013",  # PCP (Portuguese Communist Party) - dark red
-        "#00ADEF",  # IL (Liberal Initiative) - cyan/light blue
-        "#122B68",  # Chega - dark blue
-        "#009A49",  # Livre - green
-        "#005C35"   # PAN (People-Animals-Nature) - dark green
-    ]
-
-    # Create a colormap from these colors
-    portuguese_cmap = LinearSegmentedColormap.from_list("portuguese_parties", portuguese_party_colors, N=256)
-
-    # Function to randomly select colors from the Portuguese party palette
-    def portuguese_party_color_func(word, font_size, position, orientation, random_state=None, **kwargs):
-        return random.choice(portuguese_party_colors)
-
-    # Check if we have topics to display
-    if topic_freq:
-        # Generate the word cloud
-        wordcloud = WordCloud(
-            width=800, 
-            height=400, 
-            background_color='white', 
-            color_func=portuguese_party_color_func,
-            max_words=100,
-            normalize_plurals=False
-        ).generate_from_frequencies(topic_freq)
-        
-        # Create a matplotlib figure
-        fig, ax = plt.subplots(figsize=(10, 5))
-        ax.imshow(wordcloud, interpolation='bilinear')
-        ax.axis('off')
-        
-        # Display in Streamlit
-        st.pyplot(fig)
-        
-    else:
-        st.warning("No topics found in the data.")
-
-
-### Sidebar 
-logo = Image.open("logo.jpg")
-logo = logo.resize((200, 200), Image.LANCZOS)
-st.sidebar.image(logo, use_container_width=False)
-st.sidebar.header("Political Parties")
-
-parties = {
-    "PS": {
-        "image": "ps.jpg",
-        "url": "https://ps.pt/"
-    },
-    "AD": {
-        "image": "ad.jpg",
-        "url": "https://ad2025.pt/"
-    },
-    "IL": {
-        "image": "il.jpg",
-        "url": "https://iniciativaliberal.pt/"
-    },
-    "CHEGA": {
-        "image": "chega.jpg",
-        "url": "https://partidochega.pt/"
-    },
-    "BE": {
-        "image": "be.jpg",
-        "url": "https://www.bloco.org/"
-    },
-    "Livre": {
-        "image": "livre.jpg",
-        "url": "https://partidolivre.pt/"
-    },
-    "PAN": {
-        "image": "pan.jpg",
-        "url": "https://www.pan.com.pt/"
-    },
-    "PCP": {
-        "image": "pcp.jpg",
-        "url": "https://www.pcp.pt/"
-    },
-}
-
-IMAGE_WIDTH = 100
-IMAGE_HEIGHT = 100
-
-# Create columns in the sidebar
-cols = st.sidebar.columns(2)  # 2 columns for the grid
-
-# Render each party with an image and make it clickable
-for i, (name, data) in enumerate(parties.items()):
-    col_idx = i % 2  # Alternate between columns
-    with cols[col_idx]:
-        try:
-            # Open and resize the image to consistent dimensions
-            img = Image.open(data["image"])
-            img = img.resize((IMAGE_WIDTH, IMAGE_HEIGHT), Image.LANCZOS)
-            
-            # Display the resized image
-            st.image(img, use_container_width=False)
-            
-        except Exception as e:
-            # If there's an issue loading the image, just use the original file
-            st.image(data["image"], width=IMAGE_WIDTH)
-        
-        # Create a button with the party name that links to the website
-        if st.button(f"Visit {name}", key=f"btn_{name}"):
-            # This will open the URL when the button is clicked
-            import webbrowser
-            webbrowser.open_new_tab(data["url"])
+import streamlit as st
+import pandas as pd
+import visualizations
+import thumbnails
+import live
+import partitions
+import storage
+import profiling
+import plotly.graph_objects as go
+import random
+import io
+
+# Heavy libraries only some sections need (plotly.express, wordcloud and the matplotlib
+# it pulls in) are imported inside those sections, so they do not delay the first chart.
+
+st.set_page_config(layout="wide") 
+
+# Opt-in render timings (?profile=1 or DASHBOARD_PROFILE, see profiling.py)
+profile_mode = profiling.get_profile_mode(st.query_params.get("profile"))
+if profile_mode:
+    profiling.start_run("rerun")
+    rerun_profiler = profiling.start_profiler(profile_mode)
+
+
+container = st.container()
+with container:
+    st.title("iPolls: A Public Perception of Political Parties")
+    st.markdown("This dashboard analyzes the public perception of political parties in Portugal using Reddit data.")
+
+    # Live mode (e.g. on debate nights): sections refresh on an interval, folding in only newly appended comments
+    live_mode = st.toggle(
+        "Live updates",
+        value=live.get_live_interval() is not None,
+        help=f"Refresh every {live.get_live_interval() or live.DEFAULT_LIVE_INTERVAL:g} s "
+             f"(set {live.LIVE_INTERVAL_ENV} to change the interval)."
+    )
+refresh_interval = (live.get_live_interval() or live.DEFAULT_LIVE_INTERVAL) if live_mode else None
+
+# data = pd.read_csv("comments_with_sentiment.csv")
+# data = csv.DictReader("comments_with_sentiment.csv")
+
+DATA_PATH = "comments_with_sentiment.csv"
+# Datasets partitioned by subreddit/flair/day (see partitions.py); used instead of DATA_PATH when present
+PARTITION_ROOT = partitions.DEFAULT_PARTITION_ROOT
+# Comments database written by the scripts' --db option (see storage.py); used instead of DATA_PATH when present
+DB_PATH = storage.DEFAULT_DB_PATH
+
+# Elections (subreddit/flair pairs) to show, most recent first; charts use the union of
+# the selected ones, and only their partitions are loaded
+latest_day = {}
+for partition in partitions.list_partitions(PARTITION_ROOT):
+    election = (partition["subreddit"], partition["flair"])
+    if partition["day"] != partitions.UNKNOWN_DAY:
+        latest_day[election] = max(latest_day.get(election, ""), partition["day"])
+    else:
+        latest_day.setdefault(election, "")
+if latest_day:
+    elections = sorted(latest_day, key=lambda e: (latest_day[e], e), reverse=True)
+    with container:
+        selected_elections = st.multiselect(
+            "Elections:",
+            options=elections,
+            default=elections[:1],
+            format_func=lambda e: f"r/{e[0]} · {e[1]}",
+            key="elections"
+        )
+else:
+    selected_elections = None
+
+# Most points drawn per time series chart: about one per pixel of the chart's width
+TIME_SERIES_MAX_POINTS = 800
+
+# --- Cached data loading and chart preparation ---
+# Everything is keyed on the dataset version (file mtime + size), so a new or appended
+# dataset is picked up on the next interaction while unchanged data is never reprocessed.
+# In live mode the version is that of the live dataset, which only reads appended rows.
+
+@st.cache_resource
+def get_live_dataset(file_path, annotate):
+    """The live (tailed) compact comments, shared by all sessions; see live.py."""
+    return live.new_live_dataset(file_path, annotate=annotate)
+
+def current_dataset():
+    """
+    Returns the data source charts read and the version they are keyed on: a tuple of the
+    selected elections' partition files (listed again, so new days are picked up), the
+    comments database (versioned by its write counter), or DATA_PATH, folding in appended
+    rows first in live mode.
+    """
+    if selected_elections is not None:
+        paths = tuple(p["path"] for p in partitions.list_partitions(PARTITION_ROOT, elections=selected_elections))
+        return paths, partitions.get_partitions_version(paths)
+    db_version = storage.get_storage_version(DB_PATH)
+    if db_version is not None:
+        return DB_PATH, db_version
+    return DATA_PATH, current_dataset_version()
+
+def current_dataset_version():
+    """Returns the version of DATA_PATH chart data is keyed on, folding in appended rows first in live mode."""
+    if refresh_interval:
+        dataset = get_live_dataset(DATA_PATH, False)
+        with profiling.timed_section("live refresh"):
+            live.refresh_live_dataset(dataset)
+        return live.live_version(dataset)
+    return visualizations.get_dataset_version(DATA_PATH)
+
+@st.cache_resource
+def get_partition_cache(annotate):
+    """Compact frames of the partitions loaded so far, shared by all sessions; see partitions.py."""
+    return partitions.new_partition_cache()
+
+@st.cache_resource(max_entries=2)
+def load_dashboard_data(file_path, dataset_version):
+    """
+    Loads the compact, label-only comments once per process; shared read-only by all sessions.
+    file_path is DATA_PATH, the comments database or a tuple of partition files, whose union is loaded.
+    """
+    if isinstance(file_path, tuple):
+        with profiling.timed_section("load partitions"):
+            return partitions.load_partitions(get_partition_cache(False), file_path, annotate=False)
+    if storage.is_database(file_path):
+        with profiling.timed_section("load compact comments from database"):
+            return storage.load_compact_comments(file_path, annotate=False)
+    if str(dataset_version).startswith("live-"):
+        return get_live_dataset(file_path, False)["frame"]
+    # Party, sentiment and dates only: enough for the charts shown first, and fast to build
+    with profiling.timed_section("load compact comments"):
+        return visualizations.load_compact_comments(file_path, annotate=False)
+
+@st.cache_resource(max_entries=2)
+def load_annotated_dashboard_data(file_path, dataset_version):
+    """Like load_dashboard_data, plus the topic and leader columns; only loaded when a section needs them."""
+    if isinstance(file_path, tuple):
+        with profiling.timed_section("load annotated partitions"):
+            return partitions.load_partitions(get_partition_cache(True), file_path, annotate=True)
+    if storage.is_database(file_path):
+        with profiling.timed_section("load annotated compact comments from database"):
+            return storage.load_compact_comments(file_path)
+    if str(dataset_version).startswith("live-"):
+        dataset = get_live_dataset(file_path, True)
+        with profiling.timed_section("live refresh (annotated)"):
+            live.refresh_live_dataset(dataset)
+        return dataset["frame"]
+    with profiling.timed_section("load annotated compact comments"):
+        return visualizations.load_compact_comments(file_path)
+
+@st.cache_resource(max_entries=2)
+def get_stratified_sample(file_path, dataset_version):
+    """
+    The stratified sample approximate charts are answered from (see visualizations.py),
+    drawn once per dataset version; in live mode appended rows are folded into it.
+    """
+    if str(dataset_version).startswith("live-"):
+        with profiling.timed_section("live sample update"):
+            return live.live_sample(get_live_dataset(file_path, False))
+    with profiling.timed_section("build stratified sample"):
+        return visualizations.build_stratified_sample(load_dashboard_data(file_path, dataset_version))
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def get_paired_bar_plot_data(file_path, dataset_version, approximate=False):
+    if approximate:
+        return visualizations.get_approximate_paired_bar_data(get_stratified_sample(file_path, dataset_version))
+    return visualizations.get_paired_bar_plot_data(load_dashboard_data(file_path, dataset_version))
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def get_time_series_party_mentions_data(file_path, dataset_version, granularity, approximate=False):
+    if approximate:
+        return visualizations.get_approximate_time_series_data(
+            get_stratified_sample(file_path, dataset_version), granularity=granularity
+        )
+    return visualizations.get_time_series_party_mentions_data(
+        load_dashboard_data(file_path, dataset_version), granularity=granularity
+    )
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def get_pie_chart_party_distribution_data(file_path, dataset_version, approximate=False):
+    if approximate:
+        return visualizations.get_approximate_party_distribution_data(get_stratified_sample(file_path, dataset_version))
+    return visualizations.get_pie_chart_party_distribution_data(load_dashboard_data(file_path, dataset_version))
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def get_pie_chart_leader_distribution_data(file_path, dataset_version, count_all):
+    return visualizations.get_pie_chart_leader_distribution_data(
+        load_annotated_dashboard_data(file_path, dataset_version), count_all=count_all
+    )
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def get_word_cloud_tables(file_path, dataset_version):
+    return visualizations.get_word_cloud_tables(load_annotated_dashboard_data(file_path, dataset_version))
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def get_word_cloud_data(file_path, dataset_version, party_filter):
+    return visualizations.get_word_cloud_data(
+        None, party_filter, tables=get_word_cloud_tables(file_path, dataset_version)
+    )
+
+# Approximate mode: the sentiment, party share and time series charts are answered from a
+# stratified sample of the comments, so interactions cost the same whatever the dataset's
+# size; on by default for datasets of visualizations.APPROXIMATE_MIN_ROWS comments or more
+with container:
+    approximate = st.toggle(
+        "Approximate results",
+        value=len(load_dashboard_data(*current_dataset())) >= visualizations.APPROXIMATE_MIN_ROWS,
+        help=f"Estimate charts from up to {visualizations.SAMPLE_PER_STRATUM} comments per party and day, "
+             f"with {visualizations.CONFIDENCE_LEVEL:.0%} confidence intervals. Turn off for exact results."
+    )
+
+def approximate_caption(chart_data):
+    """Notes that a chart was estimated from the sample, and from how many comments."""
+    info = chart_data.get("approximate")
+    if info:
+        st.caption(
+            f"Approximate: estimated from {info['sampled']:,} of the {info['comments']:,} comments about a party; "
+            f"error bars are {info['confidence']:.0%} confidence intervals. "
+            "Turn off \"Approximate results\" for exact counts."
+        )
+
+# --- Dashboard sections ---
+# Each section is a fragment: interacting with one of its widgets reruns only that
+# section, and only the data for the current selection is computed. Sections read the
+# dataset version themselves, so a fragment rerun also picks up new data; in live mode
+# they rerun every refresh_interval seconds. Filters have keys so they survive refreshes.
+
+def keep_date_range(key, min_date, max_date):
+    """Fits a keyed date range filter to the data, extending it to new days if it ended on the last one."""
+    selected = st.session_state.get(key)
+    if selected is None:
+        st.session_state[key] = (min_date, max_date)
+    elif len(selected) == 2:
+        start, end = selected
+        if end == st.session_state.get(f"{key}_max"):
+            end = max_date
+        st.session_state[key] = (min(max(start, min_date), max_date), min(max(end, min_date), max_date))
+    st.session_state[f"{key}_max"] = max_date
+
+def keep_selection(key, options):
+    """Fits a keyed multiselect filter to its options, adding new ones if everything was selected."""
+    selected = st.session_state.get(key)
+    if selected is None or set(selected) >= set(st.session_state.get(f"{key}_options", [])):
+        st.session_state[key] = list(options)
+    else:
+        st.session_state[key] = [option for option in selected if option in options]
+    st.session_state[f"{key}_options"] = list(options)
+
+@st.fragment(run_every=refresh_interval)
+@profiling.section("section: Sentiment Analysis", enabled=profile_mode)
+def sentiment_section():
+    data_source, dataset_version = current_dataset()
+    st.subheader("Sentiment Analysis")
+
+    chart_choice = st.radio("Select Analysis:", ["Total Counts", "Percentage (%)"], horizontal=True)
+    with profiling.timed_section("get_paired_bar_plot_data"):
+        chart_data = get_paired_bar_plot_data(data_source, dataset_version, approximate)
+
+    if chart_choice == "Total Counts":
+
+        with profiling.timed_section("figure: sentiment (counts)"):
+            df = pd.DataFrame({
+                'Party': chart_data["labels"],
+                'Positive': chart_data["datasets"][0]["data"],
+                'Negative': chart_data["datasets"][1]["data"]
+            })
+
+            # Create the bar chart
+            fig = go.Figure()
+
+            fig.add_trace(go.Bar(
+                x=df['Party'],
+                y=df['Positive'],
+                name='Positive',
+                marker_color="#4CAF50",  # Green
+                text=df['Positive'],
+                textposition='auto',
+                error_y=dict(type="data", array=chart_data["datasets"][0].get("ci"),
+                             visible="ci" in chart_data["datasets"][0])
+            ))
+
+            # Add negative bars
+            fig.add_trace(go.Bar(
+                x=df['Party'],
+                y=df['Negative'],
+                name='Negative',
+                marker_color="#F44336",  # Red
+                text=df['Negative'],
+                textposition='auto',
+                error_y=dict(type="data", array=chart_data["datasets"][1].get("ci"),
+                             visible="ci" in chart_data["datasets"][1])
+            ))
+
+            fig.update_layout(
+                title='Positive vs Negative Sentiment',
+                barmode='group',  # Side-by-side bars
+                legend=dict(orientation="h")
+            )
+
+        # Display the chart
+        with profiling.timed_section("st.plotly_chart: sentiment"):
+            st.plotly_chart(fig, use_container_width=True)
+        approximate_caption(chart_data)
+
+    elif chart_choice == "Percentage (%)":
+
+        with profiling.timed_section("figure: sentiment (percentage)"):
+            df = pd.DataFrame({
+                'Party': chart_data["labels"],
+                'Positive': [round(p) for p in chart_data["datasets"][0]["percentage"]],
+                'Negative': [round(n) for n in chart_data["datasets"][1]["percentage"]],
+            })
+
+            # Create the stacked bar chart
+            fig = go.Figure()
+
+            fig.add_trace(go.Bar(
+                x=df['Party'],
+                y=df['Positive'],
+                name='Positive',
+                marker_color="#4CAF50",  # Green
+                text=[f"{x}%" for x in df['Positive']],
+                textposition='auto',
+                # Stacked: the positive bar's top is the split between the two, so its interval is the one shown
+                error_y=dict(type="data", array=chart_data["datasets"][0].get("percentage_ci"),
+                             visible="percentage_ci" in chart_data["datasets"][0])
+            ))
+
+            fig.add_trace(go.Bar(
+                x=df['Party'],
+                y=df['Negative'],
+                name='Negative',
+                marker_color="#F44336",  # Red
+                text=[f"{x}%" for x in df['Negative']],
+                textposition='auto'
+            ))
+
+            fig.update_layout(
+                title='Positive vs Negative Sentiment',
+                barmode='stack',  # Stacked bars instead of grouped
+                legend=dict(orientation="h"),
+                xaxis_title='Party',
+                yaxis_title='Percentage (%)',
+                yaxis=dict(range=[0, 100])  # Optional: limit Y-axis to 100%
+            )
+
+        # Display the chart
+        with profiling.timed_section("st.plotly_chart: sentiment"):
+            st.plotly_chart(fig, use_container_width=True)
+        approximate_caption(chart_data)
+
+@st.fragment(run_every=refresh_interval)
+@profiling.section("section: Party Mentions Over Time", enabled=profile_mode)
+def mentions_over_time_section():
+    data_source, dataset_version = current_dataset()
+    st.subheader("Party Mentions Over Time")
+
+    granularity = st.radio(
+        "Granularity:", ["day", "hour", "week"], horizontal=True,
+        format_func=lambda g: {"hour": "Hourly", "day": "Daily", "week": "Weekly"}[g]
+    )
+    with profiling.timed_section("get_time_series_party_mentions_data"):
+        time_series_data = get_time_series_party_mentions_data(data_source, dataset_version, granularity, approximate)
+
+    if time_series_data["labels"] and time_series_data["datasets"]:
+
+        debate_info = {
+            "2025-04-07": "7th April: AD-CDU (TVI), Chega-PAN (RTP3)",
+            "2025-04-08": "8th April: PS-BE (SIC), Chega-Livre (RTP3)",
+            "2025-04-09": "9th April: CDU-Livre (SIC Notícias)",
+            "2025-04-10": "10th April: PS-IL (RTP1), BE-PAN (CNN Portugal)",
+            "2025-04-11": "11th April: AD-Livre (TVI), IL-CDU (SIC Notícias)",
+            "2025-04-12": "12th April: PS-PAN (TVI), BE-CDU (RTP3)",
+            "2025-04-13": "13th April: AD-PAN (SIC), IL-Livre (CNN Portugal)",
+            "2025-04-14": "14th April: AD-IL (RTP1), BE-Livre (SIC Notícias)",
+            "2025-04-15": "15th April: PS-Chega (TVI), IL-PAN (SIC Notícias)",
+            "2025-04-16": "16th April: AD-BE (RTP1), Chega-CDU (CNN Portugal)",
+            "2025-04-17": "17th April: PS-Livre (SIC), Chega-IL (RTP3)",
+            "2025-04-21": "21st April: PS-CDU (RTP1), Chega-BE (SIC Notícias)",
+            "2025-04-22": "22nd April: Livre-PAN (RTP3)",
+            "2025-04-23": "23rdth April: CDU-PAN (CNN Portugal)",
+            "2025-04-24": "24th April: AD-Chega (SIC), IL-BE (CNN Portugal)",
+            "2025-04-30": "30th April: AD-PS (RTP1, SIC, TVI)",
+            "2025-05-04": "04th May: All-party debate (RTP1)",
+            "2025-05-06": "06th May: All-party debate (RTP1)",
+            "2025-05-08": "08th May: Parties with no parliamentary seat debate (RTP1)"
+        }
+
+        # Create a placeholder for the chart
+        chart_placeholder = st.empty()
+
+        dates = time_series_data["dates"]
+        min_date = dates[0].astype("datetime64[D]").item()
+        max_date = dates[-1].astype("datetime64[D]").item()
+
+        keep_date_range("mentions_date_range", min_date, max_date)
+        start_date, end_date = st.date_input(
+            "Select date range:",
+            min_value=min_date,
+            max_value=max_date,
+            key="mentions_date_range"
+        )
+        # Binary search on the sorted dates, then slice each dataset
+        filtered_data = visualizations.filter_time_series_by_date_range(time_series_data, start_date, end_date)
+
+        # Display filter options below the chart space
+        party_options = [dataset["label"] for dataset in time_series_data["datasets"]]
+        keep_selection("mentions_parties", party_options)
+        selected_parties = st.multiselect(
+            "Filter parties to display:",
+            options=party_options,
+            key="mentions_parties"
+        )
+
+        # Cap the points sent to the browser (LTTB); narrowing the date range brings back full resolution
+        with profiling.timed_section("downsample time series"):
+            filtered_data = visualizations.downsample_time_series(
+                dict(filtered_data, datasets=[d for d in filtered_data["datasets"] if d["label"] in selected_parties]),
+                TIME_SERIES_MAX_POINTS
+            )
+        filtered_labels = filtered_data["labels"]
+        filtered_datasets = filtered_data["datasets"]
+        if "downsampled_from" in filtered_data:
+            st.caption(
+                f"Showing {len(filtered_labels)} of {filtered_data['downsampled_from']} points; "
+                "narrow the date range for full resolution."
+            )
+
+        with profiling.timed_section("figure: mentions over time"):
+            # Create filtered figure based on selection
+            filtered_fig = go.Figure()
+
+            # Add a special invisible trace just for the hover text
+            # This will be the ONLY trace that shows hover information
+            hover_y_values = [0] * len(filtered_labels)
+            # Debates are listed per day; hourly labels start with their day, weekly ones have no hover text
+            hover_texts = [
+                debate_info.get(label[:10], "") if granularity != "week" else "" for label in filtered_labels
+            ]
+
+            # # Populate hover texts for debate dates
+            # for i, date in enumerate(time_series_data["labels"]):
+            #     if date in debate_info:
+            #         hover_texts[i] = debate_info[date]
+
+            # Add invisible hover trace
+            filtered_fig.add_trace(go.Scatter(
+                x=filtered_labels,
+                y=hover_y_values,
+                mode='lines',
+                line=dict(width=0),
+                opacity=0,
+                hoverinfo="text",
+                text=hover_texts,
+                hovertemplate="%{text}<extra></extra>",
+                showlegend=False,
+            ))
+
+            # Add all normal data traces but with hoverinfo="none"
+            for dataset in filtered_datasets:
+                if dataset["label"] in selected_parties:
+                    filtered_fig.add_trace(go.Scatter(
+                        x=filtered_labels,
+                        y=dataset["data"],
+                        mode='lines+markers',
+                        name=dataset["label"],
+                        line=dict(color=dataset["borderColor"], width=2),
+                        marker=dict(size=6),
+                        hoverinfo="none",  # Disable hover for data traces
+                        # Only hourly mentions are estimated; daily and weekly ones are exact in approximate mode too
+                        error_y=dict(type="data", array=dataset.get("ci"), visible=any(dataset.get("ci", []))),
+                    ))
+
+            # Update layout
+            filtered_fig.update_layout(
+                title="Party Mentions Trend",
+                xaxis_title="Date",
+                yaxis_title="Number of Mentions",
+                legend_title="Political Party",
+                hovermode="x unified",  # Use closest to prevent multiple hovers
+                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+            )
+
+            filtered_fig.update_xaxes(tickformat="%d/%m")
+
+        # Display the chart in the placeholder
+        with profiling.timed_section("st.plotly_chart: mentions over time"):
+            chart_placeholder.plotly_chart(filtered_fig, use_container_width=True)
+        if granularity == "hour":
+            approximate_caption(time_series_data)
+        elif approximate:
+            st.caption("Exact in approximate mode too: the sample counts every comment of each party and day.")
+
+    else:
+        st.warning("No time series data available to generate the chart.")
+
+@st.fragment(run_every=refresh_interval)
+@profiling.section("section: Party Mention Distribution", enabled=profile_mode)
+def mention_distribution_section():
+    import plotly.express as px
+
+    data_source, dataset_version = current_dataset()
+    st.subheader("Party Mention Distribution")
+
+    chart_choice = st.radio("Select Analysis:", ["Per Party", "Per Candidate"], horizontal=True)
+
+    if chart_choice == "Per Party":
+
+        with profiling.timed_section("get_pie_chart_party_distribution_data"):
+            chart_data = get_pie_chart_party_distribution_data(data_source, dataset_version, approximate)
+        with profiling.timed_section("figure: party distribution"):
+            df = pd.DataFrame({
+                'Party': chart_data["labels"],
+                'Mentions': chart_data["datasets"][0]["data"]
+            })
+
+            color_map = {party: color for party, color in zip(
+                chart_data["labels"], 
+                chart_data["datasets"][0]["backgroundColor"]
+            )}
+
+            # Create and display the Plotly pie chart
+            fig = px.pie(
+                df, 
+                values='Mentions', 
+                names='Party',
+                title='Distribution of Mentions per Party',
+                color='Party',
+                color_discrete_map=color_map
+            )
+            fig.update_traces(textposition='inside', textinfo='percent+label')
+            fig.update_layout(
+                legend_title="Political Party",
+                showlegend=True,
+                legend=dict(
+                    orientation="v",  # Changed from "h" to "v" for vertical orientation
+                    yanchor="middle",  # Anchor point for y
+                    y=0.5,  # Center vertically
+                    xanchor="right",  # Anchor point for x
+                    x=1.1  # Position slightly to the right of the plot
+                )
+            )
+        with profiling.timed_section("st.plotly_chart: party distribution"):
+            st.plotly_chart(fig, use_container_width=True)
+        if approximate:
+            st.caption("Exact in approximate mode too: the sample counts every comment of each party.")
+
+    if chart_choice == "Per Candidate":
+
+        count_all_leaders = st.checkbox(
+            "Count every candidate mentioned in a comment",
+            value=False,
+            help="By default each comment counts once, for the candidate it mentions most."
+        )
+        with profiling.timed_section("get_pie_chart_leader_distribution_data"):
+            chart_data2 = get_pie_chart_leader_distribution_data(data_source, dataset_version, count_all_leaders)
+        with profiling.timed_section("figure: candidate distribution"):
+            df2 = pd.DataFrame({
+                'Leader': chart_data2["labels"],
+                'Mentions': chart_data2["datasets"][0]["data"]
+            })
+
+            color_map = {leader: color for leader, color in zip(
+                chart_data2["labels"], 
+                chart_data2["datasets"][0]["backgroundColor"]
+            )}
+
+            # Create and display the Plotly pie chart
+            fig = px.pie(
+                df2, 
+                values='Mentions', 
+                names='Leader',
+                title='Distribution of Mentions per Candidate',
+                color='Leader',
+                color_discrete_map=color_map
+            )
+            fig.update_traces(textposition='inside', textinfo='percent+label')
+            fig.update_layout(
+                legend_title="Party Leader",
+                showlegend=True,
+                legend=dict(
+                    orientation="v",  # Changed from "h" to "v" for vertical orientation
+                    yanchor="middle",  # Anchor point for y
+                    y=0.5,  # Center vertically
+                    xanchor="right",  # Anchor point for x
+                    x=1.3  # Position slightly to the right of the plot
+                )
+            )
+        with profiling.timed_section("st.plotly_chart: candidate distribution"):
+            st.plotly_chart(fig, use_container_width=True)
+
+@st.fragment(run_every=refresh_interval)
+@profiling.section("section: Trendy Topics", enabled=profile_mode)
+def trendy_topics_section():
+    data_source, dataset_version = current_dataset()
+    st.subheader("Trendy Topics")
+
+    # The word cloud is the most expensive section (topic tables, layout and rendering),
+    # so nothing is computed until the reader opens it
+    topics_expander = st.expander("Show word cloud", expanded=False, key="trendy_topics", on_change="rerun")
+    if not topics_expander.open:
+        return
+
+    with topics_expander:
+        with profiling.timed_section("get_word_cloud_tables"):
+            word_cloud_tables = get_word_cloud_tables(data_source, dataset_version)
+        party_filter = st.selectbox(
+            "Topics mentioned in comments about:",
+            options=["overall"] + sorted(p for p in word_cloud_tables if p not in ("overall", "Undefined", "")),
+            format_func=lambda p: "All parties" if p == "overall" else p,
+            key="topics_party"
+        )
+        with profiling.timed_section("get_word_cloud_data"):
+            word_cloud_data = get_word_cloud_data(data_source, dataset_version, party_filter)
+        topic_freq = dict(zip(word_cloud_data["labels"], word_cloud_data["datasets"][0]["data"]))
+
+        # Check if we have topics to display
+        if topic_freq:
+            with profiling.timed_section("word cloud"):
+                st.image(
+                    render_word_cloud(party_filter, visualizations.frequency_hash(topic_freq), topic_freq),
+                    use_container_width=True,
+                    output_format="PNG"
+                )
+            
+        else:
+            st.warning("No topics found in the data.")
+
+portuguese_party_colors = [
+    "#F886A8",  # PS (Socialist Party) - rose/pink
+    "#F8812A",  # PSD (Social Democratic Party) - orange
+    "#0094D4",  # CDS-PP (People's Party) - blue
+    "#BE0019",  # BE (Left Bloc) - red
+    "#8C0013",  # PCP (Portuguese Communist Party) - dark red
+    "#00ADEF",  # IL (Liberal Initiative) - cyan/light blue
+    "#122B68",  # Chega - dark blue
+    "#009A49",  # Livre - green
+    "#005C35"   # PAN (People-Animals-Nature) - dark green
+]
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def render_word_cloud(party_filter, frequency_hash, _topic_freq):
+    """Renders the word cloud to PNG bytes; cached per filter and frequency hash."""
+    from wordcloud import WordCloud
+
+    # Seeded so a given set of frequencies always renders the same image
+    rng = random.Random(frequency_hash)
+
+    # Function to randomly select colors from the Portuguese party palette
+    def portuguese_party_color_func(word, font_size, position, orientation, random_state=None, **kwargs):
+        return rng.choice(portuguese_party_colors)
+
+    with profiling.timed_section("word cloud layout"):
+        wordcloud = WordCloud(
+            width=800, 
+            height=400, 
+            background_color='white', 
+            color_func=portuguese_party_color_func,
+            max_words=100,
+            normalize_plurals=False,
+            random_state=rng.randrange(2**32)
+        ).generate_from_frequencies(_topic_freq)
+
+    with profiling.timed_section("word cloud PNG encoding"):
+        buffer = io.BytesIO()
+        wordcloud.to_image().save(buffer, format="PNG")
+    return buffer.getvalue()
+
+if selected_elections == []:
+    st.info("Select at least one election to analyze.")
+else:
+    col1, col2 = st.columns([3, 2])
+
+    with col1:
+        sentiment_section()
+        mentions_over_time_section()
+
+    with col2:
+        mention_distribution_section()
+        trendy_topics_section()
+
+
+### Sidebar 
+
+@st.cache_resource
+def load_thumbnail(image_path, width, height):
+    """Encoded PNG bytes of a resized static image, resized once and kept in memory."""
+    return thumbnails.get_thumbnail(image_path, (width, height))
+
+st.sidebar.image(load_thumbnail("logo.jpg", 200, 200), use_container_width=False, output_format="PNG")
+st.sidebar.header("Political Parties")
+
+parties = {
+    "PS": {
+        "image": "ps.jpg",
+        "url": "https://ps.pt/"
+    },
+    "AD": {
+        "image": "ad.jpg",
+        "url": "https://ad2025.pt/"
+    },
+    "IL": {
+        "image": "il.jpg",
+        "url": "https://iniciativaliberal.pt/"
+    },
+    "CHEGA": {
+        "image": "chega.jpg",
+        "url": "https://partidochega.pt/"
+    },
+    "BE": {
+        "image": "be.jpg",
+        "url": "https://www.bloco.org/"
+    },
+    "Livre": {
+        "image": "livre.jpg",
+        "url": "https://partidolivre.pt/"
+    },
+    "PAN": {
+        "image": "pan.jpg",
+        "url": "https://www.pan.com.pt/"
+    },
+    "PCP": {
+        "image": "pcp.jpg",
+        "url": "https://www.pcp.pt/"
+    },
+}
+
+IMAGE_WIDTH = 100
+IMAGE_HEIGHT = 100
+
+# Create columns in the sidebar
+cols = st.sidebar.columns(2)  # 2 columns for the grid
+
+# Render each party with an image and make it clickable
+for i, (name, data) in enumerate(parties.items()):
+    col_idx = i % 2  # Alternate between columns
+    with cols[col_idx]:
+        try:
+            # Display the pre-resized image (consistent dimensions, decoded only once)
+            # output_format must match the cached bytes, otherwise Streamlit re-encodes them
+            st.image(load_thumbnail(data["image"], IMAGE_WIDTH, IMAGE_HEIGHT), use_container_width=False,
+                     output_format="PNG")
+
+        except Exception as e:
+            # If there's an issue loading the image, just use the original file
+            st.image(data["image"], width=IMAGE_WIDTH)
+
+        # Create a button with the party name that links to the website
+        if st.button(f"Visit {name}", key=f"btn_{name}"):
+            # This will open the URL when the button is clicked
+            import webbrowser
+            webbrowser.open_new_tab(data["url"])
+
+
+### Render timings (only with ?profile=1 or DASHBOARD_PROFILE)
+
+if profile_mode:
+    profile_path = profiling.stop_profiler(rerun_profiler)
+    timing_run = profiling.finish_run()
+    with st.sidebar.expander(f"Render timings ({timing_run['total_ms']:.0f} ms)", expanded=False):
+        st.dataframe(
+            pd.DataFrame({
+                "Section": ["\u2003" * t["depth"] + t["section"] for t in timing_run["timings"]],
+                "ms": [t.get("ms") for t in timing_run["timings"]],
+            }),
+            hide_index=True,
+            use_container_width=True
+        )
+        st.caption(
+            "Sections rerun on their own (fragments) are logged to "
+            f"{profiling.get_log_path()}, not shown here."
+        )
+        if profile_path:
+            st.caption(f"Profile of this rerun saved to {profile_path}")
@@ -0,0 +1,337 @@
+"""
+Benchmark suite for the visualization data-preparation functions.
+
+This script performs the following tasks:
+1.  Generates a reproducible synthetic corpus of Portuguese political comments, using
+    the real PARTY_KEYWORDS, trendy_topics and party_leaders_keywords vocabulary and
+    spreading the comments over the Legislativas 2025 campaign dates.
+2.  Streams the corpus into a temporary CSV and times `read_csv_data` on it.
+3.  Times every `visualizations.get_*_data` function, plus `identify_topics`,
+    `identify_party_leader` and `identify_party_in_comment` over every comment.
+4.  Measures peak Python memory (tracemalloc) of each call in a separate run, so the
+    tracing overhead does not distort the timings.
+5.  With --dashboard-memory, reports the memory the dashboard keeps for the comments
+    (row dictionaries + topics DataFrame vs. the compact representation).
+6.  With --compare-leaders, times the old per-keyword leader loop against the compiled
+    leader matcher on the shipped dataset.
+7.  Saves the results as JSON (by default under benchmark_results/<commit>.json), and
+    can compare two result files to spot regressions between commits.
+
+Usage:
+    python benchmark.py                         # 10k, 100k and 1M rows
+    python benchmark.py --sizes 10000 100000    # smaller run
+    python benchmark.py --sizes 10000000        # opt-in: ~10 GB of RAM (see run_benchmarks)
+    python benchmark.py --compare old.json new.json
+    python benchmark.py --dashboard-memory --sizes 18000 1000000
+    python benchmark.py --compare-leaders
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import data_processing
+import visualizations
+
+# --- Configuration & Constants ---
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]  # 10M rows is opt-in (--sizes): the row targets need ~10 GB
+DEFAULT_SEED = 2025
+RESULTS_DIR = "benchmark_results"
+
+# Campaign window covered by the shipped dataset
+CAMPAIGN_START = datetime(2025, 4, 7)
+CAMPAIGN_END = datetime(2025, 5, 12, 23, 59, 59)
+
+FILLER_WORDS = [
+    "o", "a", "os", "as", "de", "do", "da", "que", "não", "é", "um", "uma", "para", "com",
+    "mais", "mas", "se", "já", "muito", "isto", "isso", "quem", "vai", "votar", "voto",
+    "governo", "país", "eleições", "debate", "proposta", "programa", "sempre", "nunca",
+    "acho", "verdade", "problema", "pessoas", "anos", "agora", "depois", "ninguém",
+    "melhor", "pior", "ontem", "hoje", "maioria", "esquerda", "direita", "campanha",
+]
+
+# Roughly the label distribution of the shipped comments_with_sentiment.csv
+SENTIMENT_WEIGHTS = {"negative": 0.767, "positive": 0.228, "neutral": 0.005}
+UNDEFINED_SHARE = 0.55
+
+CSV_FIELDNAMES = [
+    "titulo_post", "texto_comentario", "data_comentario", "party",
+    "sentiment", "id_comentario", "score", "url_comentario",
+]
+
+# --- Synthetic Corpus ---
+
+def iter_synthetic_comments(n_rows, seed=DEFAULT_SEED):
+    """Yields n_rows synthetic comment dictionaries with the same columns as comments_with_sentiment.csv."""
+    rng = random.Random(seed)
+    parties = [p for p in data_processing.PARTY_KEYWORDS if p != "Other parties"]
+    topic_keywords = [kw for keywords in visualizations.trendy_topics.values() for kw in keywords]
+    leader_keywords = [kw for keywords in visualizations.party_leaders_keywords.values() for kw in keywords]
+    sentiments = list(SENTIMENT_WEIGHTS)
+    sentiment_weights = list(SENTIMENT_WEIGHTS.values())
+    span_seconds = int((CAMPAIGN_END - CAMPAIGN_START).total_seconds())
+    titles = [f"Debate {i}: {rng.choice(parties)} vs {rng.choice(parties)}" for i in range(200)]
+
+    for i in range(n_rows):
+        words = rng.choices(FILLER_WORDS, k=rng.randint(8, 40))
+        if rng.random() < UNDEFINED_SHARE:
+            party = "Undefined"
+        else:
+            party = rng.choice(parties + ["Other parties"])
+            words.insert(rng.randrange(len(words) + 1), rng.choice(data_processing.PARTY_KEYWORDS[party]))
+        if rng.random() < 0.3:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(topic_keywords))
+        if rng.random() < 0.2:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(leader_keywords))
+        comment_date = CAMPAIGN_START + timedelta(seconds=rng.randrange(span_seconds))
+        yield {
+            "titulo_post": rng.choice(titles),
+            "texto_comentario": " ".join(words).capitalize() + rng.choice([".", "!", "?", "..."]),
+            "data_comentario": comment_date.strftime("%Y-%m-%d %H:%M:%S"),
+            "party": party,
+            "sentiment": rng.choices(sentiments, sentiment_weights)[0],
+            "id_comentario": f"s{i:08x}",
+            "score": str(rng.randint(-20, 200)),
+            "url_comentario": "",
+        }
+
+def generate_synthetic_comments(n_rows, seed=DEFAULT_SEED):
+    """Returns n_rows synthetic comment dictionaries (see iter_synthetic_comments)."""
+    return list(iter_synthetic_comments(n_rows, seed))
+
+def write_csv(rows, file_path):
+    """Writes comment dictionaries (any iterable, e.g. a generator) to a CSV file with the dataset's columns."""
+    with open(file_path, mode="w", newline="", encoding="utf-8") as csv_out:
+        writer = csv.DictWriter(csv_out, fieldnames=CSV_FIELDNAMES, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+# --- Measurement ---
+
+CSV_TARGETS = ("read_csv_data",)  # Targets that read the CSV and ignore the rows
+
+def get_benchmark_targets():
+    """Returns {name: callable(rows, csv_path)} for every function under benchmark."""
+    targets = {
+        "read_csv_data": lambda rows, csv_path: visualizations.read_csv_data(csv_path),
+    }
+    for name in sorted(dir(visualizations)):
+        # The get_approximate_* functions read a stratified sample, not rows
+        if name.startswith("get_") and name.endswith("_data") and not name.startswith("get_approximate_"):
+            func = getattr(visualizations, name)
+            targets[name] = lambda rows, csv_path, func=func: func(rows)
+    for func in (visualizations.identify_topics,
+                 visualizations.identify_party_leader,
+                 data_processing.identify_party_in_comment):
+        targets[func.__name__] = lambda rows, csv_path, func=func: [func(r["texto_comentario"]) for r in rows]
+    return targets
+
+def measure(func, *args):
+    """Returns (seconds, peak_memory_bytes) of func(*args), timed and traced in separate calls."""
+    start = time.perf_counter()
+    func(*args)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+def get_git_commit():
+    """Returns the current git commit hash, or 'unknown' outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run_benchmarks(sizes, seed=DEFAULT_SEED, only=None):
+    """
+    Runs every benchmark target at each corpus size and returns the result records.
+
+    The corpus is streamed into the CSV, and the CSV targets run before any rows are held,
+    so only the row-based targets need the rows in memory (read back from the CSV, about
+    1 KB per row: ~10 GB at 10M rows).
+    """
+    targets = get_benchmark_targets()
+    if only:
+        targets = {name: func for name, func in targets.items() if name in only}
+    # CSV targets first, while no rows are held
+    ordered = sorted(targets, key=lambda name: name not in CSV_TARGETS)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_rows in sizes:
+            print(f"Generating {n_rows} synthetic comments...")
+            csv_path = os.path.join(tmp_dir, f"synthetic_{n_rows}.csv")
+            write_csv(iter_synthetic_comments(n_rows, seed), csv_path)
+
+            rows = None
+            for name in ordered:
+                if rows is None and name not in CSV_TARGETS:
+                    rows = visualizations.read_csv_data(csv_path)
+                seconds, peak = measure(targets[name], rows, csv_path)
+                results.append({
+                    "function": name,
+                    "rows": n_rows,
+                    "seconds": round(seconds, 6),
+                    "rows_per_second": round(n_rows / seconds, 1) if seconds > 0 else None,
+                    "peak_memory_bytes": peak,
+                })
+                print(f"  {name:<45} {n_rows:>10} rows  {seconds:10.3f} s  {peak / 2**20:10.1f} MiB")
+
+            del rows
+            os.remove(csv_path)
+    return results
+
+def measure_dashboard_memory(n_rows, seed=DEFAULT_SEED):
+    """
+    Returns the memory retained by the dashboard's comment data for an n_rows corpus:
+    the row dictionaries plus the topics DataFrame copy app.py used to build ("rows"),
+    versus the compact representation from load_compact_comments ("compact").
+    """
+    import pandas as pd
+
+    footprint = {"rows": n_rows}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, f"synthetic_{n_rows}.csv")
+        write_csv(iter_synthetic_comments(n_rows, seed), csv_path)
+
+        tracemalloc.start()
+        data = visualizations.read_csv_data(csv_path)
+        topics_frame = pd.DataFrame(data)
+        topics_frame["topics"] = topics_frame["texto_comentario"].apply(visualizations.identify_topics)
+        footprint["row_dicts_bytes"], _ = tracemalloc.get_traced_memory()
+        del data, topics_frame
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        compact = visualizations.load_compact_comments(csv_path)
+        footprint["compact_bytes"], _ = tracemalloc.get_traced_memory()
+        footprint["compact_frame_bytes"] = int(compact.memory_usage(deep=True).sum())
+        del compact
+        tracemalloc.stop()
+    print(f"  {n_rows:>10} rows  row dicts + topics frame: {footprint['row_dicts_bytes'] / 2**20:10.1f} MiB"
+          f"  compact: {footprint['compact_bytes'] / 2**20:8.1f} MiB")
+    return footprint
+
+def _identify_party_leader_legacy(comment):
+    """The per-keyword regex loop identify_party_leader used before the compiled matcher."""
+    import re
+    if not isinstance(comment, str):
+        return "Undefined"
+    comment = visualizations.strip_accents(re.sub(r'[^\w\s#]', '', comment.lower()))
+    for leader, keywords in visualizations.party_leaders_keywords.items():
+        for keyword in keywords:
+            pattern = r'\b' + re.escape(visualizations.strip_accents(keyword.lower())) + r'\b'
+            if re.search(pattern, comment):
+                return leader
+    return "Undefined"
+
+def compare_leader_matchers(csv_path=visualizations.INPUT_CSV_PATH):
+    """Times the legacy leader loop against the compiled matcher on a dataset and reports disagreements."""
+    texts = [row.get("texto_comentario", "") for row in visualizations.read_csv_data(csv_path)]
+    report = {"rows": len(texts)}
+    for name, func in (("legacy_identify_party_leader", _identify_party_leader_legacy),
+                       ("identify_party_leader", visualizations.identify_party_leader),
+                       ("count_party_leaders", visualizations.count_party_leaders)):
+        start = time.perf_counter()
+        labels = [func(text) for text in texts]
+        report[name + "_seconds"] = round(time.perf_counter() - start, 6)
+        report.setdefault("labels", {})[name] = labels
+
+    legacy, compiled = report["labels"]["legacy_identify_party_leader"], report["labels"]["identify_party_leader"]
+    report["reattributed_comments"] = sum(a != b for a, b in zip(legacy, compiled))
+    report["multi_leader_comments"] = sum(len(c) > 1 for c in report["labels"]["count_party_leaders"])
+    del report["labels"]
+    print(f"{report['rows']} comments: legacy {report['legacy_identify_party_leader_seconds']:.3f} s, "
+          f"compiled {report['identify_party_leader_seconds']:.3f} s "
+          f"({report['legacy_identify_party_leader_seconds'] / report['identify_party_leader_seconds']:.1f}x); "
+          f"{report['multi_leader_comments']} mention several leaders, "
+          f"{report['reattributed_comments']} change main leader.")
+    return report
+
+def compare_results(old_path, new_path, tolerance=0.10):
+    """Prints time/memory ratios between two result files and returns the regressed entries."""
+    with open(old_path, encoding="utf-8") as f:
+        old = {(r["function"], r["rows"]): r for r in json.load(f)["results"]}
+    with open(new_path, encoding="utf-8") as f:
+        new = {(r["function"], r["rows"]): r for r in json.load(f)["results"]}
+
+    regressions = []
+    print(f"{'function':<45} {'rows':>10} {'time x':>8} {'memory x':>9}")
+    for key in sorted(old.keys() & new.keys()):
+        old_r, new_r = old[key], new[key]
+        time_ratio = new_r["seconds"] / old_r["seconds"] if old_r["seconds"] else float("inf")
+        memory_ratio = (new_r["peak_memory_bytes"] / old_r["peak_memory_bytes"]
+                        if old_r["peak_memory_bytes"] else float("inf"))
+        flag = "  REGRESSION" if time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance else ""
+        print(f"{key[0]:<45} {key[1]:>10} {time_ratio:8.2f} {memory_ratio:9.2f}{flag}")
+        if flag:
+            regressions.append(key)
+    return regressions
+
+# --- Main Execution ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark visualization data-prep functions on synthetic corpora.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Corpus sizes (rows).")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Random seed for the synthetic corpus.")
+    parser.add_argument("--only", nargs="+", help="Only run these functions (e.g. read_csv_data identify_topics).")
+    parser.add_argument("--output", help=f"Result file (default: {RESULTS_DIR}/<commit>.json).")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files.")
+    parser.add_argument("--dashboard-memory", action="store_true",
+                        help="Report the dashboard's retained memory (row dicts vs compact) instead.")
+    parser.add_argument("--compare-leaders", nargs="?", const=visualizations.INPUT_CSV_PATH, metavar="CSV",
+                        help="Time the legacy vs. compiled leader matcher on a dataset (default: shipped CSV).")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown when comparing.")
+    args = parser.parse_args()
+
+    if args.compare_leaders:
+        compare_leader_matchers(args.compare_leaders)
+        return
+
+    if args.dashboard_memory:
+        footprints = [measure_dashboard_memory(n_rows, args.seed) for n_rows in args.sizes]
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"commit": get_git_commit(), "dashboard_memory": footprints}, f, indent=2)
+        return
+
+    if args.compare:
+        regressions = compare_results(*args.compare, tolerance=args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+    commit = get_git_commit()
+    results = run_benchmarks(args.sizes, args.seed, args.only)
+
+    output_path = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": commit,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "sizes": args.sizes,
+            "results": results,
+        }, f, indent=2)
+    print(f"Benchmark results saved to {output_path}")
+
+if __name__ == "__main__":
+    main()
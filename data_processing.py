@@ -4,7 +4,12 @@ Data processing script for Reddit comments related to Portuguese elections.
 This script performs the following tasks:
 1.  Connects to the Reddit API (credentials need to be provided).
 2.  Fetches posts from a specified subreddit with a given flair.
-3.  Fetches all comments from those posts.
+3.  Fetches the comments of those posts, expanding the "load more comments" stubs of
+    each post largest first within a request budget (MORE_COMMENTS_POLICY). Deferred
+    stubs are queued next to the outputs (see deferred_queue_path) for a later --revisit run.
+    Comments already fetched by an earlier run or another post (crossposts, repeated
+    search results) are dropped at fetch time, using a persistent index of the comment
+    ids seen (see seen_comments.py), and new ones are added to the earlier outputs.
 4.  Cleans the comments DataFrame by keeping relevant columns.
 5.  Identifies the political party mentioned in each comment based on keywords.
 6.  Calculates the count of comments per identified party.
@@ -16,7 +21,10 @@ and are therefore not implemented in this script.
 IMPORTANT: Replace placeholder Reddit API credentials before running.
 """
 
-import praw
+import os
+import heapq
+import itertools
+import json
 import pandas as pd
 from datetime import datetime
 import re
@@ -24,6 +32,9 @@ from collections import defaultdict
 import unicodedata
 import time # For potential rate limiting, though not strictly used in PRAW fetch here
 
+import profiling
+import seen_comments
+
 # --- Configuration & Constants ---
 
 # IMPORTANT: Replace with your actual Reddit API credentials
@@ -34,6 +45,17 @@ REDDIT_USER_AGENT = "[REDACTED]"
 SUBREDDIT_NAME = "portugal"
 FLAIR_TEXT = "Legislativas 2025"
 
+# Expansion of the "load more comments" stubs of each post (see expand_comment_tree). Each stub
+# costs an API request, which dominates crawl time on megathreads such as the debates post.
+MORE_COMMENTS_POLICY = {
+    "max_requests": 32,         # "load more" requests per post (None: expand every stub)
+    "max_depth": None,          # Stubs deeper in the tree are deferred (None: no cut-off)
+    "min_parent_score": None,   # Stubs under comments scoring less are deferred (None: no cut-off)
+}
+DEFERRED_MORE_NAME = "deferred_more_comments.json"  # Deferred stubs of an output, re-visited by --revisit runs
+SEEN_INDEX_NAME = seen_comments.DEFAULT_SEEN_PATH  # Ids of the comments already fetched, next to the outputs
+INFO_BATCH_SIZE = 100  # Comments fetched by id per API request
+
 PARTY_KEYWORDS = {
     "PS": [
         "ps", "partido socialista", "pedro nuno santos", "pedro nuno", "pns",
@@ -119,6 +141,8 @@ def initialize_reddit():
     # PRAW might show a warning about running in an async environment if not using Async PRAW.
     # For simplicity, this script uses synchronous PRAW as in the notebook.
     # Consider Async PRAW for production or asynchronous applications: https://asyncpraw.readthedocs.io
+    # Imported here so the annotation functions can be used without PRAW installed.
+    import praw
     reddit = praw.Reddit(
         client_id=REDDIT_CLIENT_ID,
         client_secret=REDDIT_CLIENT_SECRET,
@@ -154,25 +178,187 @@ def fetch_reddit_posts(reddit_instance, subreddit_name=SUBREDDIT_NAME, flair_tex
     print(f"Extracted {len(df_posts)} posts.")
     return df_posts, posts_data # Return DataFrame and the raw list for comment fetching
 
-def fetch_post_comments(reddit_instance, posts_metadata_list):
-    """Fetches all comments for a list of post metadata."""
+def comment_record(post_meta, comment):
+    """The row of a fetched comment."""
+    return {
+        'post_id': post_meta['post_id'],
+        'titulo_post': post_meta['titulo'],
+        'comentario_id': comment.id,
+        'autor_comentario': comment.author.name if comment.author else '[deleted]',
+        'texto_comentario': comment.body,
+        'data_comentario': datetime.fromtimestamp(comment.created_utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'score_comentario': comment.score
+    }
+
+def stub_record(stub):
+    """A "load more comments" stub as stored in the re-visit queue."""
+    return {
+        'parent_id': stub.parent_id,
+        'children': list(stub.children),  # Empty for "continue this thread" stubs
+        'count': stub.count,
+        'depth': getattr(stub, 'depth', 0),
+    }
+
+def expand_comment_tree(submission, policy=MORE_COMMENTS_POLICY):
+    """
+    Loads the comments of a submission, expanding its "load more comments" stubs largest
+    first (by the number of comments they hide) until policy's request budget is spent.
+    Stubs deeper than policy's max_depth, under a comment scoring less than its
+    min_parent_score, or left over when the budget runs out are deferred.
+
+    Returns (comments, deferred stubs as stub_record dictionaries, API requests made).
+    """
+    from praw.models import MoreComments
+
+    pending = submission.comments.list()  # Loads the submission's comment tree
+    requests = 1
+    comments = []
+    scores = {}  # Comment fullname -> score, for the parent score cut-off
+    stubs = []  # Heap of (-hidden comments, arrival, stub)
+    order = itertools.count()
+    deferred = []
+    while True:
+        for item in pending:
+            if isinstance(item, MoreComments):
+                # Stubs returned by an expansion don't know their submission; PRAW's replace_more
+                # sets it too, and loading them (or a "continue this thread" stub) needs it
+                item.submission = submission
+                heapq.heappush(stubs, (-item.count, next(order), item))
+            else:
+                comments.append(item)
+                scores[item.fullname] = item.score
+        if not stubs:
+            break
+        _, _, stub = heapq.heappop(stubs)
+        max_depth, min_score = policy.get('max_depth'), policy.get('min_parent_score')
+        if ((policy.get('max_requests') is not None and requests - 1 >= policy['max_requests'])
+                or (max_depth is not None and getattr(stub, 'depth', 0) > max_depth)
+                or (min_score is not None and scores.get(stub.parent_id, min_score) < min_score)):
+            deferred.append(stub_record(stub))
+            pending = []
+            continue
+        loaded = stub.comments(update=False)
+        requests += 1
+        # "load more" returns a flat list; "continue this thread" returns the parent's reply forest
+        pending = loaded.list() if hasattr(loaded, 'list') else list(loaded)
+    return comments, deferred, requests
+
+def revisit_stubs(reddit_instance, stubs, max_requests=None):
+    """
+    Fetches the comments hidden behind stubs deferred by an earlier run, largest first,
+    within max_requests: hidden comments by id (INFO_BATCH_SIZE per request), and
+    "continue this thread" stubs by loading their parent comment's replies.
+
+    Returns (comments, stubs still deferred, API requests made).
+    """
+    from praw.models import MoreComments
+
+    comments = []
+    deferred = []
+    requests = 0
+    for stub in sorted(stubs, key=lambda stub: -stub['count']):
+        needed = -(-len(stub['children']) // INFO_BATCH_SIZE) or 1
+        if max_requests is not None and requests + needed > max_requests:
+            deferred.append(stub)
+            continue
+        if stub['children']:
+            for start in range(0, len(stub['children']), INFO_BATCH_SIZE):
+                batch = stub['children'][start:start + INFO_BATCH_SIZE]
+                comments.extend(reddit_instance.info(fullnames=[f"t1_{comment_id}" for comment_id in batch]))
+        else:
+            parent = reddit_instance.comment(stub['parent_id'].split('_', 1)[1])
+            parent.refresh()
+            for item in parent.replies.list():
+                if isinstance(item, MoreComments):
+                    deferred.append(stub_record(item))  # Queued again rather than expanded here
+                else:
+                    comments.append(item)
+        requests += needed
+    return comments, deferred, requests
+
+def load_deferred_stubs(queue_path):
+    """The re-visit queue: {post_id: {"titulo": post title, "stubs": [stub_record, ...]}}."""
+    if not queue_path or not os.path.exists(queue_path):
+        return {}
+    try:
+        with open(queue_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: could not read deferred stubs from {queue_path}: {e}. Starting an empty queue.")
+        return {}
+
+def save_deferred_stubs(queue, queue_path):
+    """Atomically saves the re-visit queue."""
+    with open(queue_path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(queue, f, ensure_ascii=False)
+    os.replace(queue_path + ".tmp", queue_path)
+
+def print_fetch_stats(stats):
+    """Prints how many comments were retrieved per API request, and what was deferred."""
+    per_request = stats['comments'] / stats['requests'] if stats['requests'] else 0
+    print(f"Retrieved {stats['comments']} comments with {stats['requests']} API requests "
+          f"({per_request:.1f} comments per request).")
+    if stats.get('duplicates'):
+        print(f"Dropped {stats['duplicates']} comments already fetched (earlier runs or other posts).")
+    if stats['deferred_stubs']:
+        print(f"Deferred {stats['deferred_stubs']} 'load more' stubs (~{stats['deferred_comments']} comments) "
+              f"for a later --revisit run.")
+
+def drop_seen_comments(comments, fetched_ids, seen=None):
+    """
+    Returns the comments whose id is neither in fetched_ids (this run's comments so far,
+    updated in place) nor in the seen index (see seen_comments.py).
+    """
+    is_seen = seen_comments.seen_mask(seen, [comment.id for comment in comments]) if seen else [False] * len(comments)
+    new_comments = []
+    for comment, already_seen in zip(comments, is_seen):
+        if not already_seen and comment.id not in fetched_ids:
+            fetched_ids.add(comment.id)
+            new_comments.append(comment)
+    return new_comments
+
+def fetch_post_comments(reddit_instance, posts_metadata_list, policy=None, queue_path=None, seen=None):
+    """
+    Fetches the comments of a list of post metadata, expanding each post's "load more"
+    stubs as policy allows (default: MORE_COMMENTS_POLICY, see expand_comment_tree).
+    Deferred stubs replace the post's entry in the re-visit queue at queue_path (see
+    deferred_queue_path; None: not kept).
+
+    Posts listed twice are fetched once, and comments already fetched for another post
+    or in the seen index (from earlier runs; see seen_comments.py) are dropped.
+
+    The returned DataFrame's attrs["fetch_stats"] holds the API requests, comments,
+    duplicates dropped and deferred stubs, in total and per post.
+    """
+    policy = MORE_COMMENTS_POLICY if policy is None else policy
     print(f"Fetching comments for {len(posts_metadata_list)} posts...")
+    queue = load_deferred_stubs(queue_path)
+    stats = {'requests': 0, 'comments': 0, 'duplicates': 0, 'deferred_stubs': 0, 'deferred_comments': 0, 'posts': {}}
     all_comments_data = []
+    fetched_ids = set()
     fetched_count = 0
     for post_meta in posts_metadata_list:
+        if post_meta['post_id'] in stats['posts']:
+            continue  # Repeated search result
         try:
             submission = reddit_instance.submission(id=post_meta['post_id'])
-            submission.comments.replace_more(limit=None)  # Load all comments, can be slow
-            for comment in submission.comments.list():
-                all_comments_data.append({
-                    'post_id': post_meta['post_id'],
-                    'titulo_post': post_meta['titulo'],
-                    'comentario_id': comment.id,
-                    'autor_comentario': comment.author.name if comment.author else '[deleted]',
-                    'texto_comentario': comment.body,
-                    'data_comentario': datetime.fromtimestamp(comment.created_utc).strftime('%Y-%m-%d %H:%M:%S'),
-                    'score_comentario': comment.score
-                })
+            comments, deferred, requests = expand_comment_tree(submission, policy)
+            new_comments = drop_seen_comments(comments, fetched_ids, seen)
+            stats['duplicates'] += len(comments) - len(new_comments)
+            for comment in new_comments:
+                all_comments_data.append(comment_record(post_meta, comment))
+            if deferred:
+                queue[post_meta['post_id']] = {'titulo': post_meta['titulo'], 'stubs': deferred}
+            else:
+                queue.pop(post_meta['post_id'], None)
+            stats['posts'][post_meta['post_id']] = {
+                'requests': requests, 'comments': len(comments), 'duplicates': len(comments) - len(new_comments),
+                'deferred_stubs': len(deferred)
+            }
+            stats['requests'] += requests
+            stats['comments'] += len(comments)
+            stats['deferred_stubs'] += len(deferred)
+            stats['deferred_comments'] += sum(stub['count'] for stub in deferred)
             fetched_count += 1
             if fetched_count % 10 == 0: # Progress update
                  print(f"  Fetched comments for {fetched_count}/{len(posts_metadata_list)} posts.")
@@ -181,14 +367,63 @@ def fetch_post_comments(reddit_instance, posts_metadata_list):
             continue # Skip to next post if error
     
     print(f"Finished fetching comments. Total comments: {len(all_comments_data)}.")
+    print_fetch_stats(stats)
+    if queue_path:
+        save_deferred_stubs(queue, queue_path)
     df_comments = pd.DataFrame(all_comments_data)
+    df_comments.attrs['fetch_stats'] = stats
+    return df_comments
+
+def revisit_deferred_comments(reddit_instance, policy, queue_path, seen=None):
+    """
+    Fetches the comments behind the stubs earlier runs deferred (the queue at queue_path),
+    within policy's per-post request budget (None: MORE_COMMENTS_POLICY), and keeps the
+    rest queued. Returns them as fetch_post_comments does (without the comments in the
+    seen index).
+    """
+    policy = MORE_COMMENTS_POLICY if policy is None else policy
+    queue = load_deferred_stubs(queue_path)
+    print(f"Re-visiting deferred stubs of {len(queue)} posts...")
+    stats = {'requests': 0, 'comments': 0, 'duplicates': 0, 'deferred_stubs': 0, 'deferred_comments': 0, 'posts': {}}
+    all_comments_data = []
+    fetched_ids = set()
+    for post_id, entry in list(queue.items()):
+        post_meta = {'post_id': post_id, 'titulo': entry['titulo']}
+        try:
+            comments, deferred, requests = revisit_stubs(reddit_instance, entry['stubs'], policy.get('max_requests'))
+        except Exception as e:
+            print(f"Error re-visiting comments for post ID {post_id}: {e}")
+            continue
+        new_comments = drop_seen_comments(comments, fetched_ids, seen)
+        stats['duplicates'] += len(comments) - len(new_comments)
+        for comment in new_comments:
+            all_comments_data.append(comment_record(post_meta, comment))
+        if deferred:
+            entry['stubs'] = deferred
+        else:
+            del queue[post_id]
+        stats['posts'][post_id] = {'requests': requests, 'comments': len(comments),
+                                   'duplicates': len(comments) - len(new_comments), 'deferred_stubs': len(deferred)}
+        stats['requests'] += requests
+        stats['comments'] += len(comments)
+        stats['deferred_stubs'] += len(deferred)
+        stats['deferred_comments'] += sum(stub['count'] for stub in deferred)
+
+    print_fetch_stats(stats)
+    save_deferred_stubs(queue, queue_path)
+    df_comments = pd.DataFrame(all_comments_data)
+    df_comments.attrs['fetch_stats'] = stats
     return df_comments
 
 def clean_comments_dataframe(df_comments):
-    """Cleans the comments DataFrame by dropping specified irrelevant columns."""
+    """
+    Cleans the comments DataFrame by dropping specified irrelevant columns. The comment
+    id, the key that detects duplicates, is kept as id_comentario.
+    """
     print("Cleaning comments DataFrame...")
+    df_comments = df_comments.rename(columns={'comentario_id': 'id_comentario'})
     # Columns to drop as per notebook cell 6 and user request
-    columns_to_drop = ['post_id', 'comentario_id', 'autor_comentario', 'score_comentario']
+    columns_to_drop = ['post_id', 'autor_comentario', 'score_comentario']
     existing_columns_to_drop = [col for col in columns_to_drop if col in df_comments.columns]
     
     if existing_columns_to_drop:
@@ -252,52 +487,231 @@ def calculate_party_counts(df_comments_with_party):
     print("Party counts calculated.")
     return counts
 
+def seen_index_path(partition_root=None, subreddit_name=SUBREDDIT_NAME, flair_text=FLAIR_TEXT, db_path=None):
+    """Where the seen-comments index of an output lives: next to the database, the election's partitions or the CSV."""
+    if db_path:
+        return os.path.splitext(db_path)[0] + ".seen.npz"
+    if partition_root:
+        import partitions
+        return os.path.join(partitions.election_dir(partition_root, subreddit_name, flair_text), SEEN_INDEX_NAME)
+    return SEEN_INDEX_NAME
+
+def deferred_queue_path(partition_root=None, subreddit_name=SUBREDDIT_NAME, flair_text=FLAIR_TEXT, db_path=None,
+                        shard=None, shard_root="shards"):
+    """
+    Where the re-visit queue of an output lives: in the shard's directory, next to the
+    database, the election's partitions or the CSV (as the seen-comments index), so a
+    --revisit run only adds the stubs deferred for its own output.
+    """
+    if shard:
+        import sharding
+        return os.path.join(sharding.shard_dir(shard_root, shard), DEFERRED_MORE_NAME)
+    if db_path:
+        return os.path.splitext(db_path)[0] + ".deferred.json"
+    if partition_root:
+        import partitions
+        return os.path.join(partitions.election_dir(partition_root, subreddit_name, flair_text), DEFERRED_MORE_NAME)
+    return DEFERRED_MORE_NAME
+
+def load_seen_comments(seen_path, db_path=None, bloom_capacity=None):
+    """
+    Loads the seen-comments index at seen_path. A new index of a database that already
+    exists is filled with its comment ids; bloom_capacity makes a new index a Bloom filter.
+    """
+    if os.path.exists(seen_path):
+        return seen_comments.load_seen_index(seen_path)
+    seen = seen_comments.new_seen_index("bloom" if bloom_capacity else "set", bloom_capacity)
+    if db_path and os.path.exists(db_path):
+        import storage
+        connection = storage.connect(db_path)
+        try:
+            stored_ids = [row["id_comentario"] for row in storage.iter_comments(connection, ("id_comentario",))]
+        finally:
+            connection.close()
+        seen_comments.add_seen(seen, stored_ids)
+    return seen
+
 # --- Main Execution --- 
 
-def main():
-    """Main function to orchestrate the data processing pipeline."""
+def main(subreddit_name=SUBREDDIT_NAME, flair_text=FLAIR_TEXT, partition_root=None, db_path=None,
+         shard=None, shard_root="shards", from_csv=None, policy=None, revisit=False, ignore_seen=False,
+         seen_bloom=None):
+    """
+    Main function to orchestrate the data processing pipeline.
+
+    With partition_root, the processed comments are written to day partitions of
+    subreddit_name/flair_text under it (see partitions.py) instead of a single file.
+    With db_path, they are upserted into the comments database (see storage.py),
+    keyed on their comment id, which is kept for that purpose.
+    With shard=(index, count), only the posts hashing to that shard are processed and
+    the outputs go to the shard's directory under shard_root (see sharding.py).
+    With from_csv, comments are read from that CSV instead of being fetched.
+    policy is the comment tree expansion policy (default: MORE_COMMENTS_POLICY); with
+    revisit, only the comments behind the stubs earlier runs deferred are fetched, which
+    needs db_path (the other outputs would be replaced by just those comments).
+
+    Fetched comments whose id an earlier run stored (see seen_index_path) are dropped,
+    and the new ones are added to the earlier outputs. With ignore_seen, every comment
+    is fetched and the outputs and index are replaced instead, as are those of shards
+    and from_csv runs, which keep no index. seen_bloom is the capacity of a new index
+    kept as a Bloom filter (for very large archives).
+    """
     print("Starting data processing pipeline...")
-    
-    reddit = initialize_reddit()
-    if not reddit:
-        print("Failed to initialize Reddit instance. Exiting.")
-        return
-
-    df_posts, posts_metadata = fetch_reddit_posts(reddit)
-    
-    if df_posts.empty:
-        print("No posts fetched. Exiting.")
+    if shard:
+        import sharding
+
+    seen = None
+    appending = False  # Whether earlier runs' comments are kept in the outputs
+    if not shard and not from_csv:
+        seen_path = seen_index_path(partition_root, subreddit_name, flair_text, db_path)
+        if ignore_seen:
+            seen = seen_comments.new_seen_index("bloom" if seen_bloom else "set", seen_bloom)
+        else:
+            seen = load_seen_comments(seen_path, db_path, seen_bloom)
+        appending = seen_comments.seen_count(seen) > 0
+        if appending:
+            print(f"Skipping the {seen_comments.seen_count(seen)} comments already fetched ({seen_path}).")
+
+    if revisit and not db_path:
+        print("ERROR: --revisit adds comments to the stored ones, so it needs --db. Exiting.")
         return
 
-    df_all_comments = fetch_post_comments(reddit, posts_metadata)
-
-    if df_all_comments.empty:
-        print("No comments fetched. Exiting.")
+    queue_path = deferred_queue_path(partition_root, subreddit_name, flair_text, db_path, shard, shard_root)
+    if revisit:
+        reddit = initialize_reddit()
+        with profiling.timed_section("fetch comments", source=queue_path):
+            df_all_comments = revisit_deferred_comments(reddit, policy, queue_path, seen=seen)
+    elif from_csv:
+        print(f"Reading comments from {from_csv} instead of fetching them...")
+        with profiling.timed_section("fetch comments", source=from_csv):
+            df_all_comments = pd.read_csv(from_csv, dtype=str, keep_default_na=False)
+            if shard:
+                df_all_comments = df_all_comments[
+                    [sharding.in_shard(row, shard) for row in df_all_comments.to_dict("records")]
+                ].reset_index(drop=True)
+    else:
+        reddit = initialize_reddit()
+        if not reddit:
+            print("Failed to initialize Reddit instance. Exiting.")
+            return
+
+        with profiling.timed_section("fetch posts"):
+            df_posts, posts_metadata = fetch_reddit_posts(reddit, subreddit_name, flair_text)
+
+        if df_posts.empty:
+            print("No posts fetched. Exiting.")
+            return
+
+        if shard:
+            posts_metadata = [post for post in posts_metadata if sharding.in_shard(post, shard)]
+            print(f"Shard {shard[0]}/{shard[1]}: {len(posts_metadata)} of {len(df_posts)} posts.")
+
+        with profiling.timed_section("fetch comments", posts=len(posts_metadata)):
+            # Each output (shard, database, election) keeps its own queue of deferred stubs
+            if os.path.dirname(queue_path):
+                os.makedirs(os.path.dirname(queue_path), exist_ok=True)
+            df_all_comments = fetch_post_comments(reddit, posts_metadata, policy, queue_path, seen)
+
+    if df_all_comments.empty and not shard:  # An empty shard still writes its (empty) outputs for the merge
+        print("No new comments fetched. Exiting." if appending else "No comments fetched. Exiting.")
         return
     
-    df_comments_cleaned = df_all_comments.drop(columns=['post_id', 'comentario_id', 'autor_comentario', 'score_comentario'], errors='ignore')
+    with profiling.timed_section("clean", rows=len(df_all_comments)):
+        # The comment id is kept as the dataset's id_comentario: the key duplicates are detected on
+        df_all_comments = df_all_comments.rename(columns={'comentario_id': 'id_comentario'})
+        if db_path:
+            # Stored under the dataset's column names; the id is the upsert key, post_id is indexed for sharding
+            df_comments_cleaned = df_all_comments.rename(
+                columns={'score_comentario': 'score'}
+            ).drop(columns=['autor_comentario'], errors='ignore')
+        elif shard:
+            # post_id is kept so the merge can order the comments of all shards by post
+            df_comments_cleaned = df_all_comments.drop(columns=['autor_comentario', 'score_comentario'], errors='ignore')
+        else:
+            df_comments_cleaned = df_all_comments.drop(columns=['post_id', 'autor_comentario', 'score_comentario'], errors='ignore')
     print(f"Cleaned DataFrame columns: {df_comments_cleaned.columns.tolist()}")
 
-    df_comments_with_party = add_party_column(df_comments_cleaned.copy()) # Use copy to avoid SettingWithCopyWarning
+    with profiling.timed_section("add_party_column"):
+        df_comments_with_party = add_party_column(df_comments_cleaned.copy()) # Use copy to avoid SettingWithCopyWarning
     
-    party_comment_counts = calculate_party_counts(df_comments_with_party)
+    with profiling.timed_section("calculate_party_counts"):
+        party_comment_counts = calculate_party_counts(df_comments_with_party)
     
-    # Save the processed data (before sentiment analysis)
-    output_filename = "processed_comments_before_sentiment.csv"
-    try:
-        df_comments_with_party.to_csv(output_filename, index=False)
-        print(f"Processed comments (before sentiment) saved to {output_filename}")
-    except Exception as e:
-        print(f"Error saving processed comments: {e}")
-
-    counts_output_filename = "party_comment_counts.json"
-    import json
-    try:
-        with open(counts_output_filename, 'w', encoding='utf-8') as f:
-            json.dump(party_comment_counts, f, ensure_ascii=False, indent=4)
-        print(f"Party comment counts saved to {counts_output_filename}")
-    except Exception as e:
-        print(f"Error saving party counts: {e}")
+    with profiling.timed_section("write"):
+        # Save the processed data (before sentiment analysis)
+        output_filename = "processed_comments_before_sentiment.csv"
+        counts_output_filename = "party_comment_counts.json"
+        if shard:
+            directory = sharding.shard_dir(shard_root, shard)
+            os.makedirs(directory, exist_ok=True)
+            output_filename = os.path.join(directory, output_filename)
+            counts_output_filename = os.path.join(directory, counts_output_filename)
+        saved = False
+        if db_path:
+            import storage
+            try:
+                connection = storage.connect(db_path)
+                try:
+                    written = storage.upsert_comments(connection, df_comments_with_party.fillna("").to_dict("records"))
+                finally:
+                    connection.close()
+                print(f"Processed comments (before sentiment) upserted into {db_path} ({written} rows)")
+                saved = True
+            except Exception as e:
+                print(f"Error saving processed comments: {e}")
+        elif partition_root:
+            import partitions
+            try:
+                written = partitions.write_partitioned(
+                    df_comments_with_party.fillna("").to_dict("records"), partition_root, subreddit_name, flair_text,
+                    partitions.PROCESSED_FILE_NAME, df_comments_with_party.columns.tolist(), append=appending
+                )
+                print(f"Processed comments (before sentiment) saved to {len(written)} day partitions under "
+                      f"{partitions.election_dir(partition_root, subreddit_name, flair_text)}")
+                saved = True
+            except Exception as e:
+                print(f"Error saving processed comments: {e}")
+            counts_output_filename = os.path.join(
+                partitions.election_dir(partition_root, subreddit_name, flair_text), counts_output_filename
+            )
+        else:
+            try:
+                df_output = df_comments_with_party
+                if appending and os.path.exists(output_filename):
+                    # The earlier runs' comments stay ahead of the new ones
+                    df_output = pd.concat(
+                        [pd.read_csv(output_filename, dtype=str, keep_default_na=False), df_output], ignore_index=True
+                    )
+                df_output.to_csv(output_filename, index=False)
+                print(f"Processed comments (before sentiment) saved to {output_filename}")
+                saved = True
+                # Token index, so keyword edits only re-annotate the comments they affect (see reannotate.py)
+                import reannotate
+                index = reannotate.build_index(df_output['texto_comentario'].tolist())
+                reannotate.record_annotations(index, "party")
+                reannotate.save_index(index, reannotate.index_path(output_filename))
+            except Exception as e:
+                print(f"Error saving processed comments: {e}")
+
+        if seen is not None and saved:
+            # Only once they are stored, so comments of a failed run are fetched again
+            seen_comments.add_seen(seen, df_comments_with_party['id_comentario'].tolist())
+            seen_comments.save_seen_index(seen, seen_path)
+
+        import json
+        if appending and os.path.exists(counts_output_filename):
+            try:
+                with open(counts_output_filename, 'r', encoding='utf-8') as f:
+                    for party, count in json.load(f).items():
+                        party_comment_counts[party] = party_comment_counts.get(party, 0) + count
+            except (OSError, ValueError) as e:
+                print(f"Warning: could not add the earlier party counts of {counts_output_filename}: {e}")
+        try:
+            with open(counts_output_filename, 'w', encoding='utf-8') as f:
+                json.dump(party_comment_counts, f, ensure_ascii=False, indent=4)
+            print(f"Party comment counts saved to {counts_output_filename}")
+        except Exception as e:
+            print(f"Error saving party counts: {e}")
 
     print("Data processing pipeline finished.")
     print("--- Summary ---")
@@ -311,6 +725,52 @@ def main():
     print("\nReminder: 'trendy_topics', 'identity_topics fx', and 'topic_counts' functionalities \nwere requested but not found in the provided notebook, so they are not implemented here.")
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fetch and annotate Reddit comments about an election.")
+    parser.add_argument("--subreddit", default=SUBREDDIT_NAME, help="Subreddit to fetch posts from.")
+    parser.add_argument("--flair", default=FLAIR_TEXT, help="Flair of the election's posts.")
+    parser.add_argument("--partition-root", help="Write day partitions under this directory "
+                                                 "(e.g. datasets) instead of a single CSV.")
+    parser.add_argument("--db", help="Upsert into this comments database (e.g. comments.db) instead of a CSV.")
+    parser.add_argument("--shard", help="Only process the posts of shard I/N (e.g. 0/4); see sharding.py.")
+    parser.add_argument("--shard-root", default="shards", help="Where shard outputs are written.")
+    parser.add_argument("--from-csv", help="Annotate the comments of this CSV instead of fetching them (backfills).")
+    parser.add_argument("--more-budget", type=int, default=MORE_COMMENTS_POLICY["max_requests"],
+                        help="'load more comments' API requests per post; the remaining stubs are deferred.")
+    parser.add_argument("--expand-all", action="store_true", help="Expand every 'load more comments' stub.")
+    parser.add_argument("--more-max-depth", type=int, default=MORE_COMMENTS_POLICY["max_depth"],
+                        help="Defer stubs deeper than this in the comment tree.")
+    parser.add_argument("--more-min-score", type=int, default=MORE_COMMENTS_POLICY["min_parent_score"],
+                        help="Defer stubs under comments scoring less than this.")
+    parser.add_argument("--ignore-seen", action="store_true",
+                        help="Fetch every comment again, replacing the outputs and the index of seen comments.")
+    parser.add_argument("--seen-bloom", type=int, metavar="CAPACITY",
+                        help="Keep a new index of seen comments as a Bloom filter sized for this many comments.")
+    parser.add_argument("--revisit", action="store_true",
+                        help="Only fetch the comments behind the stubs earlier runs deferred for the database "
+                             "(queued next to it); needs --db.")
+    args = parser.parse_args()
+    policy = {
+        "max_requests": None if args.expand_all else args.more_budget,
+        "max_depth": args.more_max_depth,
+        "min_parent_score": args.more_min_score,
+    }
+    shard = None
+    if args.shard:
+        import sharding
+        try:
+            shard = sharding.parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+    # Run report: time and peak RSS per stage (extra captures with PIPELINE_PROFILE, see profiling.py)
+    profiling.start_batch_run("data_processing.py", subreddit=args.subreddit, flair=args.flair)
+    try:
+        main(args.subreddit, args.flair, args.partition_root, args.db, shard, args.shard_root, args.from_csv,
+             policy, args.revisit, args.ignore_seen, args.seen_bloom)
+    finally:
+        report_path = profiling.finish_batch_run()
+    if report_path:
+        print(f"Run report saved to {report_path}")
 
 
@@ -0,0 +1,120 @@
+"""
+Live mode for the dashboard: keeps the compact comments (see visualizations.py) in
+memory and folds in only the rows appended to the dataset since the last refresh.
+
+A live dataset is a plain dictionary shared by all dashboard sessions. Refreshing it
+tails the CSV from a byte watermark (aggregates.read_csv_tail), so the file is never
+reloaded in full, and a writer that is still appending is handled: a partially written
+last record is picked up on the next refresh. If the file is rewritten or truncated,
+the dataset is rebuilt from scratch.
+
+Refreshes swap in a new frame instead of modifying the current one, so sessions that
+are still drawing from the previous frame are unaffected.
+
+Enable it by setting LIVE_INTERVAL_ENV to the refresh interval in seconds, or with the
+"Live updates" toggle in the dashboard.
+"""
+
+import os
+import threading
+
+import aggregates
+import visualizations
+
+# --- Configuration & Constants ---
+
+LIVE_INTERVAL_ENV = "DASHBOARD_LIVE_INTERVAL"
+DEFAULT_LIVE_INTERVAL = 30  # Seconds
+LIVE_CHUNK_BYTES = 8 * 1024 * 1024  # Rows are parsed in chunks of about this size
+
+# --- Core Functions ---
+
+def get_live_interval():
+    """Returns the refresh interval (seconds) from LIVE_INTERVAL_ENV, or None when it is not set."""
+    value = os.environ.get(LIVE_INTERVAL_ENV)
+    if not value:
+        return None
+    try:
+        interval = float(value)
+    except ValueError:
+        print(f"Warning: {LIVE_INTERVAL_ENV}={value!r} is not a number of seconds. Live mode is off.")
+        return None
+    return interval if interval > 0 else None
+
+def new_live_dataset(file_path, annotate=True):
+    """Returns an empty live dataset for file_path; the first refresh loads it."""
+    return {
+        "source": file_path,
+        "annotate": annotate,
+        "lock": threading.Lock(),
+        "watermark": aggregates.new_watermark(),
+        "stat": None,
+        "generation": 0,
+        "restarts": 0,  # Times the file was (re)loaded from scratch
+        "frame": visualizations.build_compact_comments([], source=file_path, annotate=annotate),
+        "sample": None,  # See live_sample
+        "sample_restarts": 0,
+    }
+
+def refresh_live_dataset(dataset):
+    """
+    Folds the rows appended to the dataset's file since the last refresh into its frame.
+
+    Returns the number of rows added (all of them when the file was rewritten).
+    """
+    file_path = dataset["source"]
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return 0
+    stat_key = (stat.st_size, stat.st_mtime_ns)
+    if stat_key == dataset["stat"]:
+        return 0  # Nothing was written since the last refresh
+
+    with dataset["lock"]:
+        if stat_key == dataset["stat"]:
+            return 0  # Another session refreshed while we waited
+        frame = dataset["frame"]
+        chunks = []
+        while True:
+            rows, restarted = aggregates.read_csv_tail(dataset["watermark"], file_path, LIVE_CHUNK_BYTES)
+            if restarted:
+                if dataset["stat"] is not None:
+                    print(f"Dataset {file_path} was rewritten; reloading it.")
+                frame = visualizations.build_compact_comments([], source=file_path, annotate=dataset["annotate"])
+                chunks = []
+                dataset["restarts"] += 1
+            if not rows:
+                break
+            chunks.append(visualizations.build_compact_comments(
+                rows, source=file_path, annotate=dataset["annotate"]
+            ))
+
+        added = 0
+        for chunk in chunks:
+            frame = visualizations.append_compact_comments(frame, chunk)
+            added += len(chunk)
+        if added or frame is not dataset["frame"]:
+            dataset["frame"] = frame
+            dataset["generation"] += 1
+        dataset["stat"] = stat_key
+    return added
+
+def live_sample(dataset):
+    """
+    The stratified sample of the dataset's frame used by the approximate charts (see
+    visualizations.build_stratified_sample). Rows appended since the last call are folded
+    in by reservoir sampling, so keeping it current costs as much as the new rows; a
+    rewritten file starts a new sample.
+    """
+    with dataset["lock"]:
+        sample = dataset["sample"]
+        if sample is None or dataset["sample_restarts"] != dataset["restarts"]:
+            sample = visualizations.new_stratified_sample()
+        dataset["sample"] = visualizations.update_stratified_sample(sample, dataset["frame"])
+        dataset["sample_restarts"] = dataset["restarts"]
+        return dataset["sample"]
+
+def live_version(dataset):
+    """A key that changes whenever the dataset's frame does (used to key cached chart payloads)."""
+    return f"live-{dataset['generation']}"
@@ -0,0 +1,234 @@
+"""
+Datasets partitioned by subreddit, flair and day, so several elections and subreddits
+can be tracked side by side.
+
+Each partition is a directory holding the same CSV files as the single-file pipeline:
+
+    datasets/subreddit=portugal/flair=Legislativas%202025/day=2025-04-07/processed_comments_before_sentiment.csv
+    datasets/subreddit=portugal/flair=Legislativas%202025/day=2025-04-07/comments_with_sentiment.csv
+
+Values are URL-quoted in directory names; comments without a parseable date go to
+day=unknown. Readers list partitions with list_partitions, which prunes on the
+directory names (subreddit, flair, date range) without opening any file, so loading
+one election never touches the files of the others. load_partitions keeps the compact
+frame of each partition (see visualizations.build_compact_comments) and only reloads
+the partitions whose file changed.
+
+The pipeline also publishes the compact frame of each election as one Arrow file
+(PUBLISHED_FILE_NAME, next to its day partitions). While it is up to date with the
+election's partitions, load_partitions memory-maps it instead of reading the CSVs.
+
+Split an existing single-file dataset into partitions with:
+    python partitions.py comments_with_sentiment.csv --subreddit portugal --flair "Legislativas 2025"
+"""
+
+import csv
+import hashlib
+import os
+import threading
+from collections import defaultdict
+from datetime import date
+from urllib.parse import quote, unquote
+
+import visualizations
+
+# --- Configuration & Constants ---
+
+DEFAULT_PARTITION_ROOT = "datasets"
+UNKNOWN_DAY = "unknown"
+PROCESSED_FILE_NAME = "processed_comments_before_sentiment.csv"
+SENTIMENT_FILE_NAME = "comments_with_sentiment.csv"
+PUBLISHED_FILE_NAME = "comments_with_sentiment.arrow"  # Per election; see visualizations.open_compact_comments
+
+# --- Helper Functions ---
+
+def election_dir(root, subreddit, flair):
+    """Directory holding the day partitions of one subreddit/flair."""
+    return os.path.join(root, f"subreddit={quote(subreddit, safe='')}", f"flair={quote(flair, safe='')}")
+
+def partition_dir(root, subreddit, flair, day):
+    """Directory of one partition (day is a date, a YYYY-MM-DD string or UNKNOWN_DAY)."""
+    if isinstance(day, date):
+        day = day.isoformat()
+    return os.path.join(election_dir(root, subreddit, flair), f"day={quote(day, safe='')}")
+
+def _list_values(directory, key):
+    """Returns {value: path} for the key=value subdirectories of a directory."""
+    values = {}
+    try:
+        entries = os.scandir(directory)
+    except OSError:
+        return values
+    with entries:
+        for entry in entries:
+            name, sep, value = entry.name.partition("=")
+            if sep and name == key and entry.is_dir():
+                values[unquote(value)] = entry.path
+    return values
+
+def comment_day(row):
+    """The YYYY-MM-DD day partition of a comment row (UNKNOWN_DAY without a parseable date)."""
+    date_str = row.get("data_comentario")
+    return (visualizations.parse_comment_day(date_str) if date_str else None) or UNKNOWN_DAY
+
+# --- Core Functions ---
+
+def list_elections(root=DEFAULT_PARTITION_ROOT):
+    """Returns the sorted (subreddit, flair) pairs that have partitions under root."""
+    return sorted(
+        (subreddit, flair)
+        for subreddit, subreddit_path in _list_values(root, "subreddit").items()
+        for flair in _list_values(subreddit_path, "flair")
+    )
+
+def list_partitions(root=DEFAULT_PARTITION_ROOT, file_name=SENTIMENT_FILE_NAME, subreddits=None,
+                    flairs=None, elections=None, start_date=None, end_date=None):
+    """
+    Lists the partitions holding file_name, pruned on subreddit, flair, (subreddit, flair)
+    election pairs and an inclusive date range. Only directory names are read.
+
+    Returns dictionaries with subreddit, flair, day and path (of the file, or of the
+    partition directory when file_name is None), sorted by those keys.
+    Partitions of day UNKNOWN_DAY are dropped when a date bound is given.
+    """
+    elections = set(elections) if elections is not None else None
+    partitions = []
+    for subreddit, subreddit_path in _list_values(root, "subreddit").items():
+        if subreddits is not None and subreddit not in subreddits:
+            continue
+        for flair, flair_path in _list_values(subreddit_path, "flair").items():
+            if flairs is not None and flair not in flairs:
+                continue
+            if elections is not None and (subreddit, flair) not in elections:
+                continue
+            for day, day_path in _list_values(flair_path, "day").items():
+                if start_date or end_date:
+                    if day == UNKNOWN_DAY:
+                        continue
+                    if start_date and day < start_date.isoformat():
+                        continue
+                    if end_date and day > end_date.isoformat():
+                        continue
+                path = os.path.join(day_path, file_name) if file_name else day_path
+                if os.path.exists(path):
+                    partitions.append({"subreddit": subreddit, "flair": flair, "day": day, "path": path})
+    partitions.sort(key=lambda p: (p["subreddit"], p["flair"], p["day"]))
+    return partitions
+
+def write_partitioned(rows, root, subreddit, flair, file_name, fieldnames, append=False):
+    """
+    Writes comment rows (dictionaries) into their day partitions of one subreddit/flair.
+
+    Each day file that receives rows is replaced as a whole, atomically (written to a
+    temporary file, then renamed), so readers never see a half-written partition; days
+    without rows are left untouched. With append, the rows already in a day file are
+    kept ahead of the new ones (fields the new rows add are empty for them).
+    Returns {day: rows written}.
+    """
+    rows_by_day = defaultdict(list)
+    for row in rows:
+        rows_by_day[comment_day(row)].append(row)
+
+    written = {}
+    for day, day_rows in sorted(rows_by_day.items()):
+        directory = partition_dir(root, subreddit, flair, day)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, file_name)
+        temp_path = path + ".tmp"
+        day_fieldnames = list(fieldnames)
+        if append and os.path.exists(path):
+            with open(path, mode="r", newline="", encoding="utf-8") as csv_in:
+                reader = csv.DictReader(csv_in)
+                day_rows = list(reader) + day_rows
+                day_fieldnames = list(reader.fieldnames or []) + [
+                    name for name in fieldnames if name not in (reader.fieldnames or [])
+                ]
+        with open(temp_path, mode="w", newline="", encoding="utf-8") as csv_out:
+            writer = csv.DictWriter(csv_out, fieldnames=day_fieldnames, extrasaction="ignore", restval="")
+            writer.writeheader()
+            writer.writerows(day_rows)
+        os.replace(temp_path, path)
+        written[day] = len(day_rows)
+    return written
+
+def get_partitions_version(paths):
+    """A version key for a set of partition files; changes whenever any of them does."""
+    versions = "\n".join(f"{path}:{visualizations.get_dataset_version(path)}" for path in paths)
+    return hashlib.sha1(versions.encode("utf-8")).hexdigest()[:16]
+
+def new_partition_cache():
+    """Returns an empty cache of per-partition compact frames (shared by all sessions)."""
+    return {"lock": threading.Lock(), "frames": {}}
+
+def load_partitions(cache, paths, annotate=True):
+    """
+    Returns the compact frame of the union of the given partition files.
+
+    Elections whose published file is up to date with their partitions among `paths`
+    are memory-mapped as a whole. Other partitions are loaded one by one and kept in
+    `cache` with their file version, so only new or changed partitions are read; the
+    others are reused as they are. A single frame is returned as it is, without copying.
+    """
+    paths_by_election = defaultdict(list)
+    for path in paths:
+        paths_by_election[os.path.dirname(os.path.dirname(path))].append(path)
+
+    frames = []
+    for directory, election_paths in paths_by_election.items():
+        published = visualizations.open_compact_comments(
+            os.path.join(directory, PUBLISHED_FILE_NAME), annotate=annotate,
+            source_version=get_partitions_version(election_paths)
+        )
+        if published is not None:
+            frames.append(published)
+            continue
+        for path in election_paths:
+            version = visualizations.get_dataset_version(path)
+            cached = cache["frames"].get(path)
+            if cached is None or cached[0] != version:
+                with cache["lock"]:
+                    cached = cache["frames"].get(path)
+                    if cached is None or cached[0] != version:
+                        cached = (version, visualizations.load_compact_comments(path, annotate=annotate))
+                        cache["frames"][path] = cached
+            frames.append(cached[1])
+    if len(frames) == 1:
+        return frames[0]
+    return visualizations.concat_compact_comments(frames, annotate=annotate)
+
+def publish_partitions(paths, arrow_path):
+    """
+    Publishes the annotated compact frame of a set of partition files (e.g. every day of
+    an election) as one Arrow file, versioned with get_partitions_version. Returns False
+    when it couldn't be written.
+    """
+    version = get_partitions_version(paths)  # Taken first, so partitions rewritten meanwhile make it stale
+    frames = [visualizations._read_compact_comments(path) for path in paths]
+    return visualizations.save_compact_comments(visualizations.concat_compact_comments(frames), arrow_path, version)
+
+def split_csv_into_partitions(file_path, root, subreddit, flair, file_name=None):
+    """Splits a single-file dataset into day partitions of one subreddit/flair; returns {day: rows}."""
+    with open(file_path, mode="r", newline="", encoding="utf-8") as csv_in:
+        reader = csv.DictReader(csv_in)
+        rows = list(reader)
+        fieldnames = reader.fieldnames or []
+    return write_partitioned(rows, root, subreddit, flair, file_name or os.path.basename(file_path), fieldnames)
+
+# --- Main Execution ---
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Split a single-file dataset into subreddit/flair/day partitions.")
+    parser.add_argument("file", help="CSV to split (e.g. comments_with_sentiment.csv).")
+    parser.add_argument("--subreddit", required=True)
+    parser.add_argument("--flair", required=True)
+    parser.add_argument("--root", default=DEFAULT_PARTITION_ROOT, help="Root directory of the partitions.")
+    args = parser.parse_args()
+
+    written = split_csv_into_partitions(args.file, args.root, args.subreddit, args.flair)
+    print(f"Wrote {sum(written.values())} comments into {len(written)} day partitions "
+          f"of r/{args.subreddit} '{args.flair}' under {args.root}.")
+
+if __name__ == "__main__":
+    main()
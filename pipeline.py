@@ -0,0 +1,550 @@
+"""
+Stage-aware runner for the data pipeline, replacing running data_processing.py and
+sentiment_analysis.py by hand.
+
+The pipeline works on the partitioned datasets of partitions.py. Stages declare the
+files they read and write inside each day partition (or, for fetch and merge, the
+election as a whole):
+
+    fetch      Reddit                                 -> raw_comments.csv (per day)
+    clean      raw_comments.csv                       -> cleaned_comments.csv
+    party      cleaned_comments.csv                   -> processed_comments_before_sentiment.csv
+    topics     processed_comments_before_sentiment.csv -> comment_topics.csv (topics, main and all leaders)
+    sentiment  processed_comments_before_sentiment.csv -> comments_with_sentiment.csv
+    aggregate  comments_with_sentiment.csv (+ comment_topics.csv) -> chart_aggregates.json (per day)
+    merge      the days' chart_aggregates.json        -> chart_aggregates.json (per election)
+    publish    the days' comments_with_sentiment.csv  -> comments_with_sentiment.arrow (per election)
+
+publish writes the dashboard's compact frame of the whole election as a memory-mapped
+Arrow file (see partitions.publish_partitions), swapped in atomically, so dashboard
+processes open it without parsing any CSV.
+
+Each stage run is keyed by a hash of the content of its inputs and of its code and
+configuration: the source of every function, class and constant of the project's
+modules that its entry point uses, directly or through other ones (keywords, date
+formats, model, prompt), found by following names through the module files. Keys are
+recorded in a .pipeline.json manifest next to the outputs, and a stage is skipped where
+its key is unchanged, so editing the topic keywords re-runs topics, aggregate and merge
+but not the sentiment calls, and a new day only runs the stages for that day. Partitions without a stage's inputs
+(e.g. ones split from an existing file with partitions.py) are skipped for that stage.
+
+Fetching can't tell whether Reddit has new comments, so it only runs for an election
+named on the command line that was never fetched, or with --refetch.
+
+Example:
+    python pipeline.py --subreddit portugal --flair "Legislativas 2025"
+    python pipeline.py --force topics
+"""
+
+import ast
+import hashlib
+import json
+import os
+import time
+
+import aggregates
+import partitions
+import profiling
+import visualizations
+
+# --- Configuration & Constants ---
+
+MANIFEST_NAME = ".pipeline.json"
+RAW_FILE_NAME = "raw_comments.csv"
+CLEANED_FILE_NAME = "cleaned_comments.csv"
+TOPICS_FILE_NAME = "comment_topics.csv"
+INDEX_FILE_NAME = "comment_tokens.npz"  # Token index of the partition's comments, see reannotate.py
+AGGREGATES_FILE_NAME = "chart_aggregates.json"
+LIST_SEPARATOR = ";"  # Separates the topics and leaders of a comment in TOPICS_FILE_NAME
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+BOOKKEEPING_NAMES = ("STAGES", "STAGE_NAMES")  # Not part of any stage's code, though run_sentiment reads them
+
+# --- Helper Functions ---
+
+_module_cache = {}
+
+def module_definitions(module_file):
+    """
+    Parses a module file of the project once. Returns {name: (source, node)} of its
+    top-level functions, classes and assignments, and {alias: (module file, name or None)}
+    of the project modules it imports (anywhere in the file).
+    """
+    if module_file not in _module_cache:
+        with open(os.path.join(SOURCE_DIR, module_file), mode="r", encoding="utf-8") as f:
+            source = f.read()
+        tree = ast.parse(source)
+        definitions = {}
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+                definitions[node.name] = (ast.get_source_segment(source, node), node)
+            elif isinstance(node, ast.Assign):
+                for target in node.targets:
+                    for name in ast.walk(target):  # Also each name of "a, b = ..."
+                        if isinstance(name, ast.Name):
+                            definitions[name.id] = (ast.get_source_segment(source, node), node)
+        imports = {}
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    if os.path.exists(os.path.join(SOURCE_DIR, alias.name + ".py")):
+                        imports[alias.asname or alias.name] = (alias.name + ".py", None)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                if os.path.exists(os.path.join(SOURCE_DIR, node.module + ".py")):
+                    for alias in node.names:
+                        imports[alias.asname or alias.name] = (node.module + ".py", alias.name)
+        _module_cache[module_file] = (definitions, imports)
+    return _module_cache[module_file]
+
+def source_segments(module_file, names):
+    """Returns the source of the named top-level functions and assignments of a module file."""
+    definitions, _ = module_definitions(module_file)
+    missing = [name for name in names if name not in definitions]
+    if missing:
+        raise KeyError(f"{module_file} has no {', '.join(missing)}")
+    return [definitions[name][0] for name in names]
+
+def code_closure(code):
+    """
+    The (module file, name) pairs a stage's code uses: its entry points ({module file:
+    [names]}) and every top-level function, class or constant of the project's modules
+    they reference, by name or as module.attribute, followed transitively.
+    """
+    for module_file, names in code.items():
+        source_segments(module_file, names)  # Raises KeyError for unknown entry points
+    pending = [(module_file, name) for module_file, names in code.items() for name in names]
+    closure = set()
+    while pending:
+        module_file, name = pending.pop()
+        if (module_file, name) in closure:
+            continue
+        closure.add((module_file, name))
+        definitions, imports = module_definitions(module_file)
+        definition = definitions[name][1]
+        for node in ast.walk(definition.value if isinstance(definition, ast.Assign) else definition):
+            reference = None
+            if isinstance(node, ast.Name):
+                if node.id in definitions:
+                    reference = (module_file, node.id)
+                elif imports.get(node.id, (None, None))[1] is not None:
+                    reference = imports[node.id]
+            elif isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+                target, imported_name = imports.get(node.value.id, (None, None))
+                if target is not None and imported_name is None:
+                    reference = (target, node.attr)
+            if reference is None or (reference[0] == "pipeline.py" and reference[1] in BOOKKEEPING_NAMES):
+                continue
+            if reference[1] in module_definitions(reference[0])[0]:
+                pending.append(reference)
+    return sorted(closure)
+
+def code_hash(code):
+    """Hash of the source of a stage's code: its entry points and everything they use (see code_closure)."""
+    digest = hashlib.sha1()
+    for module_file, name in code_closure(code):
+        digest.update(f"{module_file}:{name}\0".encode("utf-8"))
+        digest.update(source_segments(module_file, [name])[0].encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def segments_hash(code):
+    """Hash of the source of just the named functions and constants ({module file: [names]})."""
+    digest = hashlib.sha1()
+    for module_file in sorted(code):
+        for segment in source_segments(module_file, code[module_file]):
+            digest.update(segment.encode("utf-8"))
+            digest.update(b"\0")
+    return digest.hexdigest()
+
+def file_hash(path, known=None):
+    """
+    Returns (sha1 of a file's content, its stat key). `known` is a previous result for the
+    same file; when its size and modification time still match, the file is not read again.
+    """
+    stat = os.stat(path)
+    stat_key = [stat.st_size, stat.st_mtime_ns]
+    if known and known[1] == stat_key:
+        return known
+    digest = hashlib.sha1()
+    with open(path, mode="rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return [digest.hexdigest(), stat_key]
+
+def load_manifest(directory):
+    """Reads the manifest of a partition or election directory ({} when there is none)."""
+    path = os.path.join(directory, MANIFEST_NAME)
+    try:
+        with open(path, mode="r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(directory, manifest):
+    """Atomically writes the manifest of a partition or election directory."""
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path + ".tmp", mode="w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+
+def read_csv_frame(path):
+    """Reads a stage's CSV input as strings (empty fields stay empty strings)."""
+    import pandas as pd
+
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+def write_csv_frame(frame, path):
+    """Atomically writes a stage's CSV output."""
+    frame.to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+# --- Stages ---
+# run functions get the partition (or election) directory; inputs and outputs are
+# file names inside it
+
+def run_clean(directory, args):
+    import data_processing
+
+    frame = data_processing.clean_comments_dataframe(read_csv_frame(os.path.join(directory, RAW_FILE_NAME)))
+    write_csv_frame(frame, os.path.join(directory, CLEANED_FILE_NAME))
+
+def run_party(directory, args):
+    import reannotate
+
+    frame = read_csv_frame(os.path.join(directory, CLEANED_FILE_NAME))
+    output_path = os.path.join(directory, partitions.PROCESSED_FILE_NAME)
+    previous = read_csv_frame(output_path)["party"].tolist() if os.path.exists(output_path) else None
+    # After a keyword edit, only the comments containing added/removed keywords are matched again
+    texts = frame["texto_comentario"].tolist()
+    index = reannotate.load_index(os.path.join(directory, INDEX_FILE_NAME), texts)
+    frame["party"], _ = reannotate.annotate("party", texts, previous, index)
+    write_csv_frame(frame, output_path)
+    reannotate.save_index(index, os.path.join(directory, INDEX_FILE_NAME))
+
+def run_topics(directory, args):
+    import pandas as pd
+    import reannotate
+
+    texts = read_csv_frame(os.path.join(directory, partitions.PROCESSED_FILE_NAME))["texto_comentario"].tolist()
+    output_path = os.path.join(directory, TOPICS_FILE_NAME)
+    previous = None
+    if os.path.exists(output_path):
+        stored = read_csv_frame(output_path)
+        previous = [
+            (topics.split(LIST_SEPARATOR), leader, leaders.split(LIST_SEPARATOR))
+            for topics, leader, leaders in zip(stored["topics"], stored["leader"], stored["leaders"])
+        ]
+    index = reannotate.load_index(os.path.join(directory, INDEX_FILE_NAME), texts)
+    annotations, _ = reannotate.annotate("topics", texts, previous, index)
+    frame = pd.DataFrame({
+        "topics": [LIST_SEPARATOR.join(topics) for topics, _, _ in annotations],
+        "leader": [leader for _, leader, _ in annotations],
+        "leaders": [LIST_SEPARATOR.join(leaders) for _, _, leaders in annotations],
+    })
+    write_csv_frame(frame, output_path)
+    reannotate.save_index(index, os.path.join(directory, INDEX_FILE_NAME))
+
+def run_sentiment(directory, args):
+    import sentiment_analysis  # Needs the openai package
+
+    output_file = os.path.join(directory, partitions.SENTIMENT_FILE_NAME)
+    # When the classifier is unchanged (e.g. re-annotated parties, or a helper edited), comments with
+    # the same text keep their sentiment; a new model or prompt classifies everything again. Manifests
+    # written before the classifier was recorded hold the same hash as their "code".
+    known_sentiments = None
+    previous = load_manifest(directory).get("sentiment", {})
+    classifier = segments_hash(STAGES[STAGE_NAMES.index("sentiment")]["classifier"])
+    if previous.get("classifier", previous.get("code")) == classifier:
+        known_sentiments = sentiment_analysis.read_known_sentiments(output_file)
+    sentiment_analysis.process_comments_for_sentiment(
+        os.path.join(directory, partitions.PROCESSED_FILE_NAME), output_file + ".tmp", known_sentiments
+    )
+    os.replace(output_file + ".tmp", output_file)
+
+def read_topic_annotations(path, expected_rows):
+    """Reads TOPICS_FILE_NAME as row annotations for aggregates.apply_delta (None if it doesn't match)."""
+    if not os.path.exists(path):
+        return None
+    frame = read_csv_frame(path)
+    if len(frame) != expected_rows:
+        print(f"Warning: {path} has {len(frame)} rows, expected {expected_rows}; matching keywords instead.")
+        return None
+    return [
+        {"topics": topics.split(LIST_SEPARATOR), "leader": leader, "leaders": leaders.split(LIST_SEPARATOR)}
+        for topics, leader, leaders in zip(frame["topics"], frame["leader"], frame["leaders"])
+    ]
+
+def run_aggregate(directory, args):
+    rows = visualizations.read_csv_data(os.path.join(directory, partitions.SENTIMENT_FILE_NAME))
+    annotations = read_topic_annotations(os.path.join(directory, TOPICS_FILE_NAME), len(rows))
+    state = aggregates.new_aggregates()
+    aggregates.apply_delta(state, rows, annotations)
+    aggregates.save_aggregates(state, os.path.join(directory, AGGREGATES_FILE_NAME))
+
+def run_fetch(directory, args, subreddit, flair):
+    import data_processing  # fetch_* need the praw package
+
+    reddit = data_processing.initialize_reddit()
+    df_posts, posts_metadata = data_processing.fetch_reddit_posts(reddit, subreddit, flair)
+    if df_posts.empty:
+        raise RuntimeError(f"no posts found in r/{subreddit} with flair '{flair}'")
+    # Deferred "load more" stubs aren't queued and no seen-comments index is kept: --refetch loads
+    # every post's comment tree again and rewrites the raw partitions (duplicates across posts are dropped)
+    df_comments = data_processing.fetch_post_comments(reddit, posts_metadata, queue_path=None)
+    partitions.write_partitioned(
+        df_comments.fillna("").to_dict("records"), args.root, subreddit, flair,
+        RAW_FILE_NAME, df_comments.columns.tolist()
+    )
+
+def run_merge(directory, args, day_dirs):
+    states = [
+        aggregates.load_aggregates(os.path.join(day_dir, AGGREGATES_FILE_NAME))
+        for day_dir in day_dirs
+        if os.path.exists(os.path.join(day_dir, AGGREGATES_FILE_NAME))
+    ]
+    aggregates.save_aggregates(aggregates.merge_aggregates(states), os.path.join(directory, AGGREGATES_FILE_NAME))
+
+def run_publish(directory, args, day_dirs):
+    paths = [os.path.join(day_dir, partitions.SENTIMENT_FILE_NAME) for day_dir in day_dirs]
+    if not partitions.publish_partitions(paths, os.path.join(directory, partitions.PUBLISHED_FILE_NAME)):
+        raise RuntimeError("pyarrow is needed to publish")
+
+def published_is_current(directory, day_dirs):
+    """
+    True when the published file matches the days' files as the dashboard checks them
+    (modification times, not content), e.g. not after a day was rewritten unchanged.
+    """
+    paths = [os.path.join(day_dir, partitions.SENTIMENT_FILE_NAME) for day_dir in day_dirs]
+    published = visualizations.open_compact_comments(
+        os.path.join(directory, partitions.PUBLISHED_FILE_NAME), source_version=partitions.get_partitions_version(paths)
+    )
+    return published is not None
+
+STAGES = [
+    {
+        "name": "fetch",
+        "scope": "election",
+        "inputs": [],
+        "outputs": [],  # Day partitions of RAW_FILE_NAME
+        "code": {"pipeline.py": ["run_fetch"]},
+        "run": run_fetch,
+    },
+    {
+        "name": "clean",
+        "scope": "partition",
+        "inputs": [RAW_FILE_NAME],
+        "outputs": [CLEANED_FILE_NAME],
+        "code": {"pipeline.py": ["run_clean"]},
+        "run": run_clean,
+    },
+    {
+        "name": "party",
+        "scope": "partition",
+        "inputs": [CLEANED_FILE_NAME],
+        "outputs": [partitions.PROCESSED_FILE_NAME],
+        "code": {"pipeline.py": ["run_party"]},
+        "run": run_party,
+    },
+    {
+        "name": "topics",
+        "scope": "partition",
+        "inputs": [partitions.PROCESSED_FILE_NAME],
+        "outputs": [TOPICS_FILE_NAME],
+        "code": {"pipeline.py": ["run_topics"]},
+        "run": run_topics,
+    },
+    {
+        "name": "sentiment",
+        "scope": "partition",
+        "inputs": [partitions.PROCESSED_FILE_NAME],
+        "outputs": [partitions.SENTIMENT_FILE_NAME],
+        "code": {"pipeline.py": ["run_sentiment"]},
+        # What decides a comment's label: while it is unchanged, stored sentiments are reused
+        "classifier": {"sentiment_analysis.py": [
+            "SENTIMENT_MODEL", "SENTIMENT_PROMPT_TEMPLATE", "get_sentiment_from_llm", "process_comments_for_sentiment"
+        ]},
+        "run": run_sentiment,
+    },
+    {
+        "name": "aggregate",
+        "scope": "partition",
+        "inputs": [partitions.SENTIMENT_FILE_NAME],
+        "optional_inputs": [TOPICS_FILE_NAME],  # Without it, topics and leaders are matched here
+        "outputs": [AGGREGATES_FILE_NAME],
+        "code": {"pipeline.py": ["run_aggregate"]},
+        "run": run_aggregate,
+    },
+    {
+        "name": "merge",
+        "scope": "election",
+        "inputs": [],
+        "day_input": AGGREGATES_FILE_NAME,  # Read from every day partition
+        "outputs": [AGGREGATES_FILE_NAME],
+        "code": {"pipeline.py": ["run_merge"]},
+        "run": run_merge,
+    },
+    {
+        "name": "publish",
+        "scope": "election",
+        "inputs": [],
+        "day_input": partitions.SENTIMENT_FILE_NAME,
+        "outputs": [partitions.PUBLISHED_FILE_NAME],
+        "outputs_current": published_is_current,
+        "code": {"pipeline.py": ["run_publish", "published_is_current"]},
+        "run": run_publish,
+    },
+]
+STAGE_NAMES = [stage["name"] for stage in STAGES]
+
+def stage_key(stage, input_hashes, config=None):
+    """The cache key of one stage run: a hash of its code, its configuration and its inputs' content."""
+    key = {
+        "stage": stage["name"],
+        "code": code_hash(stage["code"]),
+        "config": config,
+        "inputs": {name: known[0] for name, known in sorted(input_hashes.items())},
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+# --- Core Functions ---
+
+def new_report():
+    """Per-stage counts of runs, skips, missing inputs and failures, and time spent (seconds)."""
+    return {name: {"ran": 0, "skipped": 0, "no input": 0, "failed": 0, "seconds": 0.0} for name in STAGE_NAMES}
+
+def run_recorded(stage, directory, key, outputs_exist, args, report, run_args=(), record=None):
+    """
+    Runs a stage in a directory unless the key recorded in its manifest is unchanged and
+    its outputs exist; records the new key (and `record` fields) when it runs. Returns True when it ran.
+    """
+    stats = report[stage["name"]]
+    manifest = load_manifest(directory)
+    previous = manifest.get(stage["name"], {})
+    if previous.get("key") == key and outputs_exist and stage["name"] not in args.force:
+        stats["skipped"] += 1
+        if record and previous.get("inputs") != record.get("inputs"):
+            # Same content, new modification times: saved so the inputs aren't hashed again next time
+            manifest[stage["name"]] = dict(previous, **record)
+            save_manifest(directory, manifest)
+        return False
+
+    start = time.perf_counter()
+    try:
+        with profiling.timed_section(stage["name"], directory=directory):
+            stage["run"](directory, args, *run_args)
+    except Exception as e:
+        print(f"Error in stage {stage['name']} for {directory}: {e}")
+        stats["failed"] += 1
+        return False
+    finally:
+        stats["seconds"] += time.perf_counter() - start
+    manifest = load_manifest(directory)  # Read again: fetch writes into the election's partitions
+    manifest[stage["name"]] = dict(record or {}, key=key)
+    save_manifest(directory, manifest)
+    stats["ran"] += 1
+    return True
+
+def run_partition_stage(stage, directory, args, report):
+    """Runs one stage in one day partition if its inputs, code or configuration changed."""
+    known_inputs = load_manifest(directory).get(stage["name"], {}).get("inputs", {})
+    input_hashes = {}
+    for name in stage["inputs"] + stage.get("optional_inputs", []):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            input_hashes[name] = file_hash(path, known_inputs.get(name))
+        elif name in stage["inputs"]:
+            report[stage["name"]]["no input"] += 1
+            return False
+    outputs_exist = all(os.path.exists(os.path.join(directory, name)) for name in stage["outputs"])
+    record = {"inputs": input_hashes, "code": code_hash(stage["code"])}
+    if "classifier" in stage:
+        record["classifier"] = segments_hash(stage["classifier"])
+    return run_recorded(stage, directory, stage_key(stage, input_hashes), outputs_exist, args, report,
+                        record=record)
+
+def run_election(subreddit, flair, args, report, fetch=False):
+    """Runs the selected stages for one election (subreddit/flair)."""
+    election_dir = partitions.election_dir(args.root, subreddit, flair)
+    print(f"--- r/{subreddit} '{flair}' ---")
+    for stage in STAGES:
+        if stage["name"] not in args.stages:
+            continue
+        if stage["name"] == "fetch":
+            fetched = "fetch" in load_manifest(election_dir)
+            if not (args.refetch or "fetch" in args.force or (fetch and not fetched)):
+                report["fetch"]["skipped"] += 1
+                continue
+            os.makedirs(election_dir, exist_ok=True)
+            key = stage_key(stage, {}, {"subreddit": subreddit, "flair": flair})
+            run_recorded(stage, election_dir, key, False, args, report, (subreddit, flair),
+                         record={"fetched_at": time.strftime("%Y-%m-%d %H:%M:%S")})
+        elif stage["scope"] == "partition":
+            for partition in partitions.list_partitions(args.root, file_name=None, elections=[(subreddit, flair)]):
+                run_partition_stage(stage, partition["path"], args, report)
+        else:  # merge, publish: their inputs are one file of every day
+            day_input = stage["day_input"]
+            day_dirs = [
+                os.path.dirname(p["path"])
+                for p in partitions.list_partitions(args.root, day_input, elections=[(subreddit, flair)])
+            ]
+            if not day_dirs:
+                report[stage["name"]]["no input"] += 1
+                continue
+            input_hashes = {
+                os.path.basename(day_dir): file_hash(os.path.join(day_dir, day_input))
+                for day_dir in day_dirs
+            }
+            outputs_exist = all(os.path.exists(os.path.join(election_dir, output)) for output in stage["outputs"])
+            if outputs_exist and "outputs_current" in stage:
+                outputs_exist = stage["outputs_current"](election_dir, day_dirs)
+            run_recorded(stage, election_dir, stage_key(stage, input_hashes), outputs_exist, args, report, (day_dirs,))
+
+def print_report(report, elapsed):
+    """Prints the per-stage timing report."""
+    print("--- Pipeline report ---")
+    print(f"{'stage':<10} {'ran':>5} {'skipped':>8} {'no input':>9} {'failed':>7} {'seconds':>9}")
+    for name, stats in report.items():
+        print(f"{name:<10} {stats['ran']:>5} {stats['skipped']:>8} {stats['no input']:>9} "
+              f"{stats['failed']:>7} {stats['seconds']:>9.2f}")
+    print(f"Total: {elapsed:.2f} s")
+
+# --- Main Execution ---
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the pipeline stages that are out of date.")
+    parser.add_argument("--root", default=partitions.DEFAULT_PARTITION_ROOT, help="Root of the partitioned datasets.")
+    parser.add_argument("--subreddit", help="Election to run (with --flair); default: every election under --root.")
+    parser.add_argument("--flair")
+    parser.add_argument("--stages", nargs="+", choices=STAGE_NAMES, default=STAGE_NAMES, help="Stages to run.")
+    parser.add_argument("--force", nargs="+", choices=STAGE_NAMES, default=[], help="Re-run these stages everywhere.")
+    parser.add_argument("--refetch", action="store_true", help="Fetch the comments from Reddit again.")
+    args = parser.parse_args(argv)
+
+    if bool(args.subreddit) != bool(args.flair):
+        parser.error("--subreddit and --flair go together")
+    if args.subreddit:
+        elections = [(args.subreddit, args.flair)]
+    else:
+        elections = partitions.list_elections(args.root)
+        if not elections:
+            print(f"No datasets under {args.root}. Name an election to fetch with --subreddit and --flair.")
+            return None
+
+    report = new_report()
+    start = time.perf_counter()
+    # Run report: time and peak RSS of every stage run (extra captures with PIPELINE_PROFILE, see profiling.py)
+    profiling.start_batch_run("pipeline.py", root=args.root)
+    try:
+        for subreddit, flair in elections:
+            run_election(subreddit, flair, args, report, fetch=bool(args.subreddit))
+    finally:
+        report_path = profiling.finish_batch_run()
+    print_report(report, time.perf_counter() - start)
+    if report_path:
+        print(f"Run report saved to {report_path}")
+    return report
+
+if __name__ == "__main__":
+    main()
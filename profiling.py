@@ -0,0 +1,334 @@
+"""
+Opt-in timing instrumentation for the dashboard, and run reports for the batch scripts.
+
+A "run" (a dashboard rerun, or a fragment rerun) collects the time spent in named,
+possibly nested sections:
+
+    profiling.start_run("rerun")
+    with profiling.timed_section("get_paired_bar_plot_data"):
+        ...
+    run = profiling.finish_run()  # Also appended as one JSON line to the timings log
+
+timed_section is a no-op when no run is active, so instrumented code costs nothing when
+profiling is off. Runs are per thread, and Streamlit runs each session's script in its
+own thread. Optionally, a whole run can also be profiled with cProfile (or pyinstrument,
+when installed) and saved to PROFILE_DIR.
+
+Enable it with the DASHBOARD_PROFILE environment variable or the `profile` query
+parameter of the dashboard URL (e.g. ?profile=1 or ?profile=cprofile). Values:
+1/timings, cprofile, pyinstrument.
+
+The batch scripts (data_processing.py, sentiment_analysis.py, pipeline.py) use the
+same sections as spans, with memory tracking: each span also records the RSS at its
+start and end and its peak RSS (the kernel's high-water mark, reset at every span on
+Linux). start_batch_run/finish_batch_run write one JSON report per run to REPORT_DIR
+(or BATCH_REPORT_ENV). BATCH_PROFILE_ENV opts in to more: "cprofile" (or
+"pyinstrument") saves a profile of the run to PROFILE_DIR and "tracemalloc" adds each
+span's peak Python allocations and the lines holding the most memory at the end, e.g.
+PIPELINE_PROFILE=cprofile,tracemalloc python data_processing.py
+"""
+
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- Configuration & Constants ---
+
+PROFILE_ENV = "DASHBOARD_PROFILE"
+PROFILE_LOG_ENV = "DASHBOARD_PROFILE_LOG"
+DEFAULT_PROFILE_LOG = "dashboard_timings.jsonl"
+PROFILE_DIR = "profiles"
+PROFILE_MODES = ("timings", "cprofile", "pyinstrument")
+
+BATCH_PROFILE_ENV = "PIPELINE_PROFILE"
+BATCH_REPORT_ENV = "PIPELINE_REPORT"
+REPORT_DIR = "run_reports"
+BATCH_PROFILE_OPTIONS = ("cprofile", "pyinstrument", "tracemalloc")
+TRACEMALLOC_TOP_LINES = 15
+
+_local = threading.local()
+
+# --- Memory Helpers ---
+
+def _status_kb(field):
+    """A memory field of /proc/self/status (e.g. VmRSS, VmHWM) in KiB, or None where unavailable."""
+    try:
+        with open("/proc/self/status", mode="r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+def current_rss_kb():
+    """Resident set size of the process in KiB (None where /proc is unavailable)."""
+    return _status_kb("VmRSS")
+
+def peak_rss_kb():
+    """Peak resident set size in KiB since the last reset_peak_rss (or since the process started)."""
+    peak = _status_kb("VmHWM")
+    if peak is None:
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on Linux; never reset
+        except (ImportError, OSError):
+            return None
+    return peak
+
+def reset_peak_rss():
+    """Resets the kernel's RSS high-water mark (Linux); returns False where that isn't possible."""
+    try:
+        with open("/proc/self/clear_refs", mode="w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def _observe_memory(run):
+    """Folds the peaks since the last reset into every open span and the run, then resets them."""
+    rss_peak = peak_rss_kb()
+    py_peak = tracemalloc.get_traced_memory()[1] // 1024 if tracemalloc.is_tracing() else None
+    for holder in [run] + run["open"]:
+        if rss_peak is not None:
+            holder["peak_rss_kb"] = max(holder.get("peak_rss_kb") or 0, rss_peak)
+        if py_peak is not None:
+            holder["peak_py_kb"] = max(holder.get("peak_py_kb") or 0, py_peak)
+    reset_peak_rss()
+    if py_peak is not None:
+        tracemalloc.reset_peak()
+
+# --- Core Functions ---
+
+def get_profile_mode(query_value=None):
+    """Returns the profiling mode from the `profile` query parameter or PROFILE_ENV, or None when off."""
+    value = (query_value or os.environ.get(PROFILE_ENV) or "").strip().lower()
+    if value in ("", "0", "false", "no", "off"):
+        return None
+    if value in ("1", "true", "yes", "on"):
+        return "timings"
+    if value not in PROFILE_MODES:
+        print(f"Warning: unknown profiling mode {value!r}; expected one of {', '.join(PROFILE_MODES)}.")
+        return "timings"
+    return value
+
+def get_log_path():
+    """Where finished runs are logged (PROFILE_LOG_ENV, or DEFAULT_PROFILE_LOG)."""
+    return os.environ.get(PROFILE_LOG_ENV) or DEFAULT_PROFILE_LOG
+
+def start_run(kind="rerun", track_memory=False, **fields):
+    """
+    Starts collecting timings for the current thread (replacing any unfinished run).
+    With track_memory, sections also record RSS (and Python allocations when
+    tracemalloc is tracing), at the cost of reading /proc at every section.
+    """
+    _local.run = {
+        "kind": kind,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "start": time.perf_counter(),
+        "depth": 0,
+        "timings": [],
+        "open": [] if track_memory else None,
+        **fields,
+    }
+    if track_memory:
+        _observe_memory(_local.run)
+
+def is_running():
+    """True when the current thread is collecting timings."""
+    return getattr(_local, "run", None) is not None
+
+@contextmanager
+def timed_section(name, **fields):
+    """Times the enclosed block as `name` in the current run; does nothing when no run is active."""
+    run = getattr(_local, "run", None)
+    if run is None:
+        yield
+        return
+    depth = run["depth"]
+    entry = {"section": name, "depth": depth, **fields}
+    run["timings"].append(entry)  # Appended first, so nested sections are listed after their parent
+    run["depth"] = depth + 1
+    track_memory = run["open"] is not None
+    if track_memory:
+        _observe_memory(run)  # Peaks so far belong to the enclosing sections
+        entry["rss_start_kb"] = current_rss_kb()
+        run["open"].append(entry)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry["ms"] = round((time.perf_counter() - start) * 1000, 3)
+        run["depth"] = depth
+        if track_memory:
+            _observe_memory(run)
+            entry["rss_end_kb"] = current_rss_kb()
+            run["open"].remove(entry)
+
+def _end_run():
+    """Ends the current thread's run and returns it (None if no run)."""
+    run = getattr(_local, "run", None)
+    _local.run = None
+    if run is None:
+        return None
+    if run["open"] is not None:
+        _observe_memory(run)
+    run["total_ms"] = round((time.perf_counter() - run.pop("start")) * 1000, 3)
+    run.pop("depth")
+    run.pop("open")
+    return run
+
+def finish_run(log_path=None):
+    """Ends the current thread's run, appends it to the timings log and returns it (None if no run)."""
+    run = _end_run()
+    if run is None:
+        return None
+    log_path = log_path or get_log_path()
+    try:
+        with open(log_path, mode="a", encoding="utf-8") as f:
+            f.write(json.dumps(run, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"Warning: could not write timings to {log_path}: {e}")
+    return run
+
+def section(name, enabled=True):
+    """
+    Decorator timing every call of a function as section `name`.
+
+    When no run is active (e.g. a Streamlit fragment rerunning on its own), the call
+    becomes a run of its own, which is logged when it ends.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            own_run = not is_running()
+            if own_run:
+                start_run("section", section=name)
+            try:
+                with timed_section(name):
+                    return func(*args, **kwargs)
+            finally:
+                if own_run:
+                    finish_run()
+        return wrapper
+    return decorator
+
+def start_profiler(mode):
+    """Starts a cProfile or pyinstrument profiler for the given mode; returns it (None for other modes)."""
+    if mode == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("Warning: pyinstrument is not installed; profiling with cProfile instead.")
+            mode = "cprofile"
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    return None
+
+def stop_profiler(profiler, name="rerun"):
+    """Stops a profiler from start_profiler and saves it to PROFILE_DIR; returns the file path."""
+    if profiler is None:
+        return None
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        path = os.path.join(PROFILE_DIR, f"{name}-{stamp}.prof")  # Open with snakeviz or pstats
+        profiler.dump_stats(path)
+    else:
+        profiler.stop()
+        path = os.path.join(PROFILE_DIR, f"{name}-{stamp}.html")
+        with open(path, mode="w", encoding="utf-8") as f:
+            f.write(profiler.output_html())
+    return path
+
+# --- Batch Script Runs ---
+
+def get_batch_profile_options():
+    """The extra captures requested in BATCH_PROFILE_ENV (comma-separated BATCH_PROFILE_OPTIONS)."""
+    options = set()
+    for value in (os.environ.get(BATCH_PROFILE_ENV) or "").lower().split(","):
+        value = value.strip()
+        if value in ("", "0", "1", "timings", "off"):
+            continue
+        if value not in BATCH_PROFILE_OPTIONS:
+            print(f"Warning: unknown {BATCH_PROFILE_ENV} option {value!r}; expected {', '.join(BATCH_PROFILE_OPTIONS)}.")
+            continue
+        options.add(value)
+    return options
+
+def start_batch_run(script, **fields):
+    """
+    Starts the run report of a batch script: timed_section spans then record time and
+    memory. Starts cProfile/pyinstrument and tracemalloc when BATCH_PROFILE_ENV asks.
+    """
+    options = get_batch_profile_options()
+    if "tracemalloc" in options and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    start_run("batch", track_memory=True, script=script, **fields)
+    mode = "pyinstrument" if "pyinstrument" in options else "cprofile" if "cprofile" in options else None
+    _local.profiler = start_profiler(mode)
+
+def finish_batch_run(report_path=None):
+    """
+    Ends the batch run and writes its report (one JSON document) to report_path,
+    BATCH_REPORT_ENV or REPORT_DIR/<script>-<timestamp>.json. Returns the report path.
+    """
+    profiler = getattr(_local, "profiler", None)
+    _local.profiler = None
+    run = _end_run()
+    if run is None:
+        return None
+    if profiler is not None:
+        run["profile"] = stop_profiler(profiler, run["script"])
+    if tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ])
+        run["top_allocations"] = [
+            {"line": str(stat.traceback[0]), "kb": round(stat.size / 1024, 1), "blocks": stat.count}
+            for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP_LINES]
+        ]
+        tracemalloc.stop()
+
+    if not report_path:
+        report_path = os.environ.get(BATCH_REPORT_ENV)
+    if not report_path:
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        report_path = os.path.join(REPORT_DIR, f"{os.path.splitext(run['script'])[0]}-{stamp}.json")
+    try:
+        with open(report_path, mode="w", encoding="utf-8") as f:
+            json.dump(run, f, ensure_ascii=False, indent=1)
+    except OSError as e:
+        print(f"Warning: could not write the run report to {report_path}: {e}")
+        return None
+    return report_path
+
+def print_run_summary(report_path):
+    """Prints the spans of a run report: time, and peak RSS where recorded."""
+    with open(report_path, mode="r", encoding="utf-8") as f:
+        run = json.load(f)
+    print(f"--- Run report ({report_path}) ---")
+    for entry in run["timings"]:
+        peak = entry.get("peak_rss_kb")
+        memory = f"  peak RSS {peak / 1024:.1f} MiB" if peak else ""
+        print(f"{'  ' * entry['depth']}{entry['section']}: {entry.get('ms', 0):.1f} ms{memory}")
+    peak = run.get("peak_rss_kb")
+    print(f"Total: {run['total_ms'] / 1000:.2f} s" + (f", peak RSS {peak / 1024:.1f} MiB" if peak else ""))
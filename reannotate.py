@@ -0,0 +1,297 @@
+"""
+Incremental re-annotation when the keyword dictionaries change.
+
+PARTY_KEYWORDS (data_processing.py), trendy_topics and party_leaders_keywords
+(visualizations.py) are edited often during a campaign. Rather than matching every
+comment again, a token index is kept next to each annotated dataset: for every token
+of the normalized comments (visualizations.normalize_comment), the rows containing it.
+Keywords match whole words, so a keyword can only match a comment containing all of
+its tokens. The index also records, per annotation kind, the dictionaries the stored
+annotations were built with. The diff of added/removed keywords then gives the only
+rows whose annotation can have changed:
+
+    party   PARTY_KEYWORDS                           -> party
+    topics  trendy_topics, party_leaders_keywords    -> topics, main leader, all leaders
+
+Everything is annotated again when the matching code changes, when labels are added,
+removed or reordered (ties go to the first label), or when the index doesn't match
+the comments (e.g. new comments).
+
+The pipeline's party and topics stages use it for each day partition. For the
+single-file dataset, update the party column of comments_with_sentiment.csv, the
+aggregates and the published dashboard frame in place with:
+    python reannotate.py
+"""
+
+import csv
+import hashlib
+import inspect
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+
+import aggregates
+import visualizations
+
+# --- Configuration & Constants ---
+
+INDEX_SUFFIX = ".tokens.npz"  # comments_with_sentiment.csv -> comments_with_sentiment.tokens.npz
+KINDS = ("party", "topics")
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# --- Helper Functions ---
+
+def index_path(file_path):
+    """Path of the token index of a dataset file."""
+    return os.path.splitext(file_path)[0] + INDEX_SUFFIX
+
+def keyword_dictionaries(kind):
+    """The {label: [keywords]} dictionaries an annotation kind is matched with."""
+    if kind == "party":
+        import data_processing
+        return [data_processing.PARTY_KEYWORDS]
+    return [visualizations.trendy_topics, visualizations.party_leaders_keywords]
+
+def annotate_comment(kind, text):
+    """
+    Annotates one comment: its party, or (topics, main leader, all leaders) for "topics"
+    (["Undefined"] and "Undefined" when there are none).
+    """
+    if kind == "party":
+        import data_processing
+        return data_processing.identify_party_in_comment(text)
+    leader_counts = visualizations.count_party_leaders(text)
+    leader = max(leader_counts, key=leader_counts.get) if leader_counts else "Undefined"
+    return visualizations.identify_topics(text), leader, list(leader_counts) or ["Undefined"]
+
+def annotation_code_hash(kind):
+    """Hash of the source of the functions an annotation kind is computed with."""
+    import data_processing
+
+    if kind == "party":
+        functions = [data_processing.strip_accents, data_processing.identify_party_in_comment]
+    else:
+        functions = [visualizations.strip_accents, visualizations.normalize_comment, visualizations.identify_topics,
+                     visualizations.build_keyword_matcher, visualizations.count_party_leaders]
+    digest = hashlib.sha1()
+    for function in functions + [annotate_comment]:
+        digest.update(inspect.getsource(function).encode("utf-8"))
+    return digest.hexdigest()
+
+def texts_hash(texts):
+    """Hash of a sequence of comment texts (order included)."""
+    digest = hashlib.sha1()
+    for text in texts:
+        digest.update((text if isinstance(text, str) else "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def normalize_keyword(keyword):
+    """A keyword as it is matched against normalized comments."""
+    return visualizations.strip_accents(keyword.lower())
+
+def changed_keywords(old_dictionaries, new_dictionaries):
+    """
+    Returns the normalized keywords added to or removed from any label, or None when
+    labels were added, removed or reordered (which can change any comment's annotation).
+    """
+    changed = set()
+    for old, new in zip(old_dictionaries, new_dictionaries):
+        if list(old) != list(new):
+            return None
+        for label in new:
+            old_keywords = [normalize_keyword(k) for k in old[label]]
+            new_keywords = [normalize_keyword(k) for k in new[label]]
+            # Counted, since a keyword listed twice counts twice towards a party's score
+            changed.update(k for k in set(old_keywords) | set(new_keywords)
+                           if old_keywords.count(k) != new_keywords.count(k))
+    return changed
+
+# --- Token Index ---
+
+def build_index(texts):
+    """Builds the token index of a sequence of comment texts: {token: sorted array of row numbers}."""
+    postings = {}
+    for row, text in enumerate(texts):
+        for token in set(TOKEN_PATTERN.findall(visualizations.normalize_comment(text) if isinstance(text, str) else "")):
+            postings.setdefault(token, []).append(row)
+    return {
+        "texts": texts_hash(texts),
+        "rows": len(texts),
+        "postings": {token: np.array(rows, dtype=np.int32) for token, rows in postings.items()},
+        "annotations": {},  # kind -> {"texts", "keywords", "code"} the stored annotations were built with
+    }
+
+def save_index(index, path):
+    """Atomically saves a token index (as flat arrays, without pickling)."""
+    tokens = sorted(index["postings"])
+    lengths = [len(index["postings"][token]) for token in tokens]
+    meta = {key: index[key] for key in ("texts", "rows", "annotations")}
+    with open(path + ".tmp", mode="wb") as f:
+        np.savez(
+            f,
+            tokens=np.array(tokens, dtype=str),
+            offsets=np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]),
+            rows=np.concatenate([index["postings"][token] for token in tokens]) if tokens else np.array([], np.int32),
+            meta=np.array(json.dumps(meta, ensure_ascii=False)),
+        )
+    os.replace(path + ".tmp", path)
+
+def load_index(path, texts):
+    """
+    Loads the token index of `texts` from path; builds a new one (without recorded
+    annotations) when there is none or it was built from other texts.
+    """
+    if os.path.exists(path):
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta["texts"] == texts_hash(texts):
+                    offsets = data["offsets"]
+                    rows = data["rows"]
+                    postings = {
+                        str(token): rows[offsets[i]:offsets[i + 1]] for i, token in enumerate(data["tokens"])
+                    }
+                    return dict(meta, postings=postings)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: could not read token index {path}: {e}. Rebuilding it.")
+    return build_index(texts)
+
+def copy_index(source_file, target_file):
+    """
+    Gives target_file the token index of source_file, which holds the same comments in
+    the same order (e.g. the output of the sentiment analysis); load_index checks that.
+    """
+    if os.path.exists(index_path(source_file)):
+        shutil.copyfile(index_path(source_file), index_path(target_file))
+
+def affected_rows(index, kind):
+    """
+    Sorted row numbers whose `kind` annotation can differ from the recorded one, given
+    the current dictionaries; None when every row has to be annotated again.
+    """
+    recorded = index["annotations"].get(kind)
+    if recorded is None or recorded["texts"] != index["texts"] or recorded["code"] != annotation_code_hash(kind):
+        return None
+    keywords = changed_keywords(recorded["keywords"], keyword_dictionaries(kind))
+    if keywords is None:
+        return None
+    rows = [np.array([], dtype=np.int32)]
+    for keyword in keywords:
+        tokens = TOKEN_PATTERN.findall(keyword)
+        if not tokens:
+            return None  # Not a whole-word keyword; can't be looked up
+        matches = index["postings"].get(tokens[0], rows[0])
+        for token in tokens[1:]:
+            matches = np.intersect1d(matches, index["postings"].get(token, rows[0]), assume_unique=True)
+        rows.append(matches)
+    return np.unique(np.concatenate(rows)).tolist()
+
+def record_annotations(index, kind):
+    """Records that the stored `kind` annotations now match the current dictionaries and code."""
+    index["annotations"][kind] = {
+        "texts": index["texts"],
+        "keywords": keyword_dictionaries(kind),
+        "code": annotation_code_hash(kind),
+    }
+
+def annotate(kind, texts, previous, index):
+    """
+    Returns (annotations of texts, rows annotated again or None for all of them).
+
+    previous holds the stored annotations of the same texts (or None); only the rows
+    the keyword diff affects are annotated again, the others are kept. The index is
+    updated, but not saved: save it once the annotations are stored.
+    """
+    rows = None
+    if previous is not None and len(previous) == len(texts):
+        rows = affected_rows(index, kind)
+    if rows is None:
+        annotations = [annotate_comment(kind, text) for text in texts]
+    else:
+        annotations = list(previous)
+        for row in rows:
+            annotations[row] = annotate_comment(kind, texts[row])
+    record_annotations(index, kind)
+    return annotations, rows
+
+# --- Single-File Dataset ---
+
+def reannotate_dataset(file_path=visualizations.INPUT_CSV_PATH, state_path=aggregates.AGGREGATES_STATE_PATH):
+    """
+    Brings the annotations of a single-file dataset up to date with the dictionaries:
+    the party column of the CSV, the aggregates at state_path and the published
+    dashboard frame (see visualizations.publish_compact_comments), each updated in
+    place for the affected rows only. Returns {"party": rows, "topics": rows} re-annotated.
+    """
+    with open(file_path, mode="r", newline="", encoding="utf-8") as csv_in:
+        reader = csv.DictReader(csv_in)
+        rows = list(reader)
+        fieldnames = reader.fieldnames or []
+    texts = [row.get("texto_comentario") or "" for row in rows]
+    path = index_path(file_path)
+    index = load_index(path, texts)
+    old_version = visualizations.get_dataset_version(file_path)
+
+    parties, party_rows = annotate("party", texts, [row.get("party") or "" for row in rows], index)
+    # Topics and leaders aren't stored in the CSV; the aggregates and the published frame hold them
+    topic_rows = affected_rows(index, "topics")
+    record_annotations(index, "topics")
+
+    changed = [i for i, row in enumerate(rows) if (row.get("party") or "") != parties[i]]
+    for i in changed:
+        rows[i]["party"] = parties[i]
+    if changed or "party" not in fieldnames:
+        with open(file_path + ".tmp", mode="w", newline="", encoding="utf-8") as csv_out:
+            writer = csv.DictWriter(csv_out, fieldnames=fieldnames + ["party"] * ("party" not in fieldnames))
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(file_path + ".tmp", file_path)
+    new_version = visualizations.get_dataset_version(file_path)
+
+    if party_rows is None or topic_rows is None:
+        updated = None
+    else:
+        updated = sorted(set(party_rows) | set(topic_rows))
+
+    if os.path.exists(state_path):
+        state = aggregates.load_aggregates(state_path)
+        aggregates.apply_delta(state, rows if updated is None else [rows[i] for i in updated])
+        watermark = state["watermark"]
+        if changed and watermark["source"] == os.path.abspath(file_path) and watermark["rows"] == len(rows):
+            aggregates.advance_watermark(watermark, file_path, len(rows))  # Every row is folded in
+        aggregates.save_aggregates(state, state_path)
+
+    arrow_path = visualizations.published_path(file_path)
+    if os.path.exists(arrow_path):
+        frame = visualizations.open_compact_comments(arrow_path, source_version=old_version)
+        if frame is None or updated is None:
+            visualizations.publish_compact_comments(file_path, arrow_path)
+        elif updated:
+            replacement = visualizations.build_compact_comments([rows[i] for i in updated])
+            frame = visualizations.replace_compact_rows(frame, updated, replacement)
+            visualizations.save_compact_comments(frame, arrow_path, new_version)
+
+    save_index(index, path)
+    return {"party": party_rows, "topics": topic_rows}
+
+# --- Main Execution ---
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Re-annotate the comments affected by keyword dictionary edits.")
+    parser.add_argument("--data", default=visualizations.INPUT_CSV_PATH, help="Dataset CSV to update.")
+    parser.add_argument("--state", default=aggregates.AGGREGATES_STATE_PATH, help="Aggregates to update, if present.")
+    args = parser.parse_args()
+
+    rows = reannotate_dataset(args.data, args.state)
+    for kind in KINDS:
+        count = "all" if rows[kind] is None else len(rows[kind])
+        print(f"{kind}: re-annotated {count} comments")
+
+if __name__ == "__main__":
+    main()
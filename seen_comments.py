@@ -0,0 +1,128 @@
+"""
+Persistent index of the comment ids already fetched, so comments that come back
+(crossposts, repeated search results, reruns) are dropped at fetch time, before they
+are annotated, classified and counted again.
+
+Reddit comment ids are base-36 strings, stored as exact 64-bit integers (other ids
+are hashed into the negative range). The index is either:
+
+    set    a sorted NumPy array of the ids: exact, 8 bytes per comment
+    bloom  a Bloom filter sized for a capacity and false-positive rate, for very large
+           archives: 100M comments at 1e-6 take ~360 MB instead of 800 MB. A false
+           positive drops a new comment as already seen, so keep the rate low.
+
+data_processing.py keeps it next to its outputs (seen_comments.npz) and only adds the
+ids of comments once they are written.
+"""
+
+import hashlib
+import math
+import os
+import re
+
+import numpy as np
+
+# --- Configuration & Constants ---
+
+DEFAULT_SEEN_PATH = "seen_comments.npz"
+DEFAULT_ERROR_RATE = 1e-6
+BASE36_ID = re.compile(r"[0-9a-z]{1,12}")  # Up to 36**12 < 2**63
+
+# --- Helper Functions ---
+
+def id_values(comment_ids):
+    """Int64 values of comment ids (with or without the t1_ prefix); 0 for empty ids."""
+    values = np.zeros(len(comment_ids), dtype=np.int64)
+    for i, comment_id in enumerate(comment_ids):
+        comment_id = str(comment_id or "").strip().lower()
+        if comment_id.startswith("t1_"):
+            comment_id = comment_id[3:]
+        if not comment_id:
+            continue
+        if BASE36_ID.fullmatch(comment_id):
+            values[i] = int(comment_id, 36) + 1  # Keeps 0 for "no id"
+        else:
+            digest = hashlib.blake2b(comment_id.encode("utf-8"), digest_size=8).digest()
+            values[i] = int.from_bytes(digest, "big") % 2**63 - 2**63  # Negative: can't collide with base 36
+    return values
+
+def _mix(values):
+    """SplitMix64 finalizer of uint64 values (wrapping arithmetic)."""
+    z = values + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def _bloom_positions(index, values):
+    """Bit positions of values in a Bloom filter, one row of `hashes` positions per value (double hashing)."""
+    h1 = _mix(values.view(np.uint64))
+    h2 = _mix(h1) | np.uint64(1)
+    steps = np.arange(index["hashes"], dtype=np.uint64)
+    return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(index["bits"].size * 8)
+
+# --- Core Functions ---
+
+def new_seen_index(kind="set", capacity=None, error_rate=DEFAULT_ERROR_RATE):
+    """An empty index: kind "set", or "bloom" sized for capacity ids at error_rate false positives."""
+    if kind == "set":
+        return {"kind": "set", "ids": np.array([], dtype=np.int64)}
+    if kind != "bloom" or not capacity:
+        raise ValueError("a seen index is a 'set', or a 'bloom' filter with a capacity")
+    bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    return {
+        "kind": "bloom",
+        "bits": np.zeros(-(-bits // 8), dtype=np.uint8),
+        "hashes": max(1, round(bits / capacity * math.log(2))),
+        "capacity": int(capacity),
+        "count": 0,
+    }
+
+def seen_mask(index, comment_ids):
+    """Boolean array: which comment ids are in the index (never empty ids)."""
+    values = id_values(comment_ids)
+    if index["kind"] == "set":
+        ids = index["ids"]
+        positions = np.minimum(np.searchsorted(ids, values), max(ids.size - 1, 0))
+        mask = ids[positions] == values if ids.size else np.zeros(values.size, dtype=bool)
+    else:
+        positions = _bloom_positions(index, values)
+        mask = ((index["bits"][positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1).all(axis=1)
+    return mask & (values != 0)
+
+def add_seen(index, comment_ids):
+    """Adds comment ids (empty ones are ignored) to the index."""
+    values = np.unique(id_values(comment_ids))
+    values = values[values != 0]
+    if index["kind"] == "set":
+        index["ids"] = np.union1d(index["ids"], values)
+        return
+    positions = _bloom_positions(index, values).ravel()
+    np.bitwise_or.at(index["bits"], positions >> np.uint64(3),
+                     np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+    index["count"] += int(values.size)  # Upper bound: ids added twice are counted twice
+    if index["count"] > index["capacity"]:
+        print(f"Warning: the seen-comments Bloom filter holds ~{index['count']} ids, over its capacity of "
+              f"{index['capacity']}; its false-positive rate is rising. Rebuild it with a larger capacity.")
+
+def seen_count(index):
+    """Number of ids in the index (an upper bound for a Bloom filter)."""
+    return int(index["ids"].size) if index["kind"] == "set" else index["count"]
+
+def load_seen_index(path=DEFAULT_SEEN_PATH, kind="set", capacity=None, error_rate=DEFAULT_ERROR_RATE):
+    """Loads the index at path; a new one (see new_seen_index) when there is none or it can't be read."""
+    if os.path.exists(path):
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["kind"]) == "set":
+                    return {"kind": "set", "ids": data["ids"]}
+                return {"kind": "bloom", "bits": data["bits"], "hashes": int(data["hashes"]),
+                        "capacity": int(data["capacity"]), "count": int(data["count"])}
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: could not read seen-comments index {path}: {e}. Starting a new one.")
+    return new_seen_index(kind, capacity, error_rate)
+
+def save_seen_index(index, path=DEFAULT_SEEN_PATH):
+    """Atomically saves the index."""
+    with open(path + ".tmp", mode="wb") as f:
+        np.savez(f, **{key: np.asarray(value) for key, value in index.items()})
+    os.replace(path + ".tmp", path)
@@ -17,6 +17,8 @@ import pandas as pd
 import time
 from openai import OpenAI # Assuming OpenAI, as per the notebook
 
+import profiling
+
 # --- Configuration & Constants ---
 
 # IMPORTANT: Replace with your actual OpenAI API key
@@ -30,6 +32,7 @@ SENTIMENT_PROMPT_TEMPLATE = (
     "Only reply with one of those two words.\n\n{}\n")
 
 DELAY_BETWEEN_REQUESTS = 1  # seconds between API calls
+DB_COMMIT_EVERY = 50  # In database mode, sentiments are stored every this many comments
 
 
 # --- Helper Functions ---
@@ -64,8 +67,28 @@ def get_sentiment_from_llm(comment_text):
         print(f"Error calling OpenAI API: {e}")
         return "error_api" # Indicate an API error
 
-def process_comments_for_sentiment(input_file, output_file):
-    """Reads comments, gets sentiment, and writes to a new CSV."""
+def read_known_sentiments(output_file):
+    """
+    Returns {comment key: (text, sentiment)} of the comments an earlier run classified
+    (without API errors), to reuse for comments whose text hasn't changed.
+    """
+    import aggregates
+
+    if not os.path.exists(output_file):
+        return {}
+    known = {}
+    with open(output_file, mode="r", newline='', encoding="utf-8") as csv_in:
+        for row in csv.DictReader(csv_in):
+            if row.get("sentiment") and row["sentiment"] != "error_api":
+                known[aggregates.comment_key(row)] = (row.get("texto_comentario", ""), row["sentiment"])
+    return known
+
+def process_comments_for_sentiment(input_file, output_file, known_sentiments=None):
+    """
+    Reads comments, gets sentiment, and writes to a new CSV.
+    known_sentiments (see read_known_sentiments) are reused for comments with the same key and text.
+    """
+    import aggregates
     comments_with_sentiment = []
     fieldnames_input = []
     
@@ -78,40 +101,44 @@ def process_comments_for_sentiment(input_file, output_file):
             writer_out.writeheader()
         return
 
-    try:
-        with open(input_file, mode="r", newline='', encoding="utf-8") as csv_in:
-            reader = csv.DictReader(csv_in)
-            fieldnames_input = reader.fieldnames if reader.fieldnames else []
-            if not fieldnames_input:
-                print(f"Error: Input CSV {input_file} is empty or has no header.")
-                return
-
-            print(f"Processing comments from {input_file} for sentiment analysis...")
-            count = 0
-            for row in reader:
-                count += 1
-                comment_text = row.get("texto_comentario", "")
-                if not comment_text.strip():
-                    sentiment = "neutral" # Or skip, or mark as error
-                else:
-                    print(f"Analyzing comment {count}: {comment_text[:50]}...")
-                    sentiment = get_sentiment_from_llm(comment_text)
-                    time.sleep(DELAY_BETWEEN_REQUESTS) # Respect API rate limits
+    with profiling.timed_section("classify", source=input_file):
+        try:
+            with open(input_file, mode="r", newline='', encoding="utf-8") as csv_in:
+                reader = csv.DictReader(csv_in)
+                fieldnames_input = reader.fieldnames if reader.fieldnames else []
+                if not fieldnames_input:
+                    print(f"Error: Input CSV {input_file} is empty or has no header.")
+                    return
+
+                print(f"Processing comments from {input_file} for sentiment analysis...")
+                count = 0
+                for row in reader:
+                    count += 1
+                    comment_text = row.get("texto_comentario", "")
+                    known = known_sentiments.get(aggregates.comment_key(row)) if known_sentiments else None
+                    if known and known[0] == comment_text:
+                        sentiment = known[1]
+                    elif not comment_text.strip():
+                        sentiment = "neutral" # Or skip, or mark as error
+                    else:
+                        print(f"Analyzing comment {count}: {comment_text[:50]}...")
+                        sentiment = get_sentiment_from_llm(comment_text)
+                        time.sleep(DELAY_BETWEEN_REQUESTS) # Respect API rate limits
                 
-                # Prepare the output row, keeping all original columns
-                output_row = {key: row.get(key, "") for key in fieldnames_input}
-                output_row["sentiment"] = sentiment
-                comments_with_sentiment.append(output_row)
+                    # Prepare the output row, keeping all original columns
+                    output_row = {key: row.get(key, "") for key in fieldnames_input}
+                    output_row["sentiment"] = sentiment
+                    comments_with_sentiment.append(output_row)
                 
-                if count % 10 == 0:
-                    print(f"Processed {count} comments so far...")
+                    if count % 10 == 0:
+                        print(f"Processed {count} comments so far...")
 
-    except IOError as e:
-        print(f"Error reading input CSV file {input_file}: {e}")
-        return
-    except Exception as e:
-        print(f"An unexpected error occurred during processing: {e}")
-        return
+        except IOError as e:
+            print(f"Error reading input CSV file {input_file}: {e}")
+            return
+        except Exception as e:
+            print(f"An unexpected error occurred during processing: {e}")
+            return
 
     # Define output fieldnames: input fieldnames + new sentiment column
     fieldnames_output = fieldnames_input + ["sentiment"] if "sentiment" not in fieldnames_input else fieldnames_input
@@ -126,23 +153,161 @@ def process_comments_for_sentiment(input_file, output_file):
     seen = set()
     fieldnames_output = [x for x in fieldnames_output if not (x in seen or seen.add(x))]
 
-    # Save comments with sentiment to the output CSV
+    with profiling.timed_section("write", rows=len(comments_with_sentiment)):
+        # Save comments with sentiment to the output CSV
+        try:
+            with open(output_file, mode="w", newline='', encoding="utf-8") as csv_out:
+                writer_out = csv.DictWriter(csv_out, fieldnames=fieldnames_output, extrasaction="ignore"
+                ) # ignore extra fields if any
+                writer_out.writeheader()
+                writer_out.writerows(comments_with_sentiment)
+            print(f"Successfully saved {len(comments_with_sentiment)} comments with sentiment to {output_file}")
+        except IOError as e:
+            print(f"Error writing output CSV file {output_file}: {e}")
+
+def process_database_for_sentiment(db_path):
+    """
+    Classifies the comments of the database (see storage.py) that have no sentiment yet,
+    or whose classification failed, storing the results every DB_COMMIT_EVERY comments.
+    An interrupted run resumes where it stopped.
+    """
+    import storage
+
+    connection = storage.connect(db_path)
     try:
-        with open(output_file, mode="w", newline='', encoding="utf-8") as csv_out:
-            writer_out = csv.DictWriter(csv_out, fieldnames=fieldnames_output, extrasaction="ignore"
-            ) # ignore extra fields if any
-            writer_out.writeheader()
-            writer_out.writerows(comments_with_sentiment)
-        print(f"Successfully saved {len(comments_with_sentiment)} comments with sentiment to {output_file}")
-    except IOError as e:
-        print(f"Error writing output CSV file {output_file}: {e}")
+        pending = list(storage.iter_comments(connection, ("id_comentario", "texto_comentario"), unclassified=True))
+        print(f"Processing {len(pending)} comments without a sentiment from {db_path}...")
+        results = []
+        # The periodic writes are listed as "write" spans nested in "classify"
+        with profiling.timed_section("classify", source=db_path, rows=len(pending)):
+            for count, row in enumerate(pending, start=1):
+                comment_text = row["texto_comentario"]
+                if not comment_text.strip():
+                    sentiment = "neutral"
+                else:
+                    print(f"Analyzing comment {count}: {comment_text[:50]}...")
+                    sentiment = get_sentiment_from_llm(comment_text)
+                    time.sleep(DELAY_BETWEEN_REQUESTS) # Respect API rate limits
+                results.append((row["id_comentario"], sentiment))
+                if len(results) >= DB_COMMIT_EVERY:
+                    with profiling.timed_section("write", rows=len(results)):
+                        storage.set_sentiments(connection, results)
+                    results = []
+                    print(f"Processed {count} comments so far...")
+            if results:
+                with profiling.timed_section("write", rows=len(results)):
+                    storage.set_sentiments(connection, results)
+        print(f"Successfully stored the sentiment of {len(pending)} comments in {db_path}")
+    finally:
+        connection.close()
+
+def process_shard_for_sentiment(shard, shard_root="shards"):
+    """
+    Classifies the comments of one shard (see sharding.py) and builds the shard's
+    aggregates, which mark the shard as finished for the merge.
+    """
+    import aggregates
+    import sharding
+    import visualizations
+
+    directory = sharding.shard_dir(shard_root, shard)
+    output_file = os.path.join(directory, sharding.SENTIMENT_FILE_NAME)
+    process_comments_for_sentiment(os.path.join(directory, sharding.PROCESSED_FILE_NAME), output_file)
+    with profiling.timed_section("aggregate"):
+        state = aggregates.new_aggregates()
+        aggregates.apply_delta(state, visualizations.read_csv_data(output_file))
+        aggregates.save_aggregates(state, os.path.join(directory, sharding.AGGREGATES_FILE_NAME))
+    print(f"Shard {shard[0]}/{shard[1]}: aggregates of {state['comments']} comments saved.")
+
+def process_partitions_for_sentiment(partition_root, subreddits=None, flairs=None, force=False):
+    """
+    Runs the sentiment analysis on each day partition under partition_root (see partitions.py).
+
+    Partitions whose output is newer than their processed comments are skipped unless
+    force is set, so adding an election or a day only classifies the new comments, and
+    without force, comments whose text didn't change keep their sentiment. Each
+    output is written to a temporary file first, so the dashboard never reads a partial one.
+    Elections with new outputs are then published for the dashboard (see partitions.py).
+    """
+    import partitions
+
+    selected = partitions.list_partitions(
+        partition_root, partitions.PROCESSED_FILE_NAME, subreddits=subreddits, flairs=flairs
+    )
+    print(f"Found {len(selected)} partitions under {partition_root}.")
+    updated = set()
+    for partition in selected:
+        input_file = partition["path"]
+        output_file = os.path.join(os.path.dirname(input_file), partitions.SENTIMENT_FILE_NAME)
+        if not force and os.path.exists(output_file) and os.path.getmtime(output_file) >= os.path.getmtime(input_file):
+            continue
+        print(f"Partition r/{partition['subreddit']} '{partition['flair']}' {partition['day']}:")
+        with profiling.timed_section("partition", subreddit=partition["subreddit"], flair=partition["flair"],
+                                     day=partition["day"]):
+            known_sentiments = None if force else read_known_sentiments(output_file)
+            process_comments_for_sentiment(input_file, output_file + ".tmp", known_sentiments)
+            if os.path.exists(output_file + ".tmp"):
+                os.replace(output_file + ".tmp", output_file)
+                updated.add((partition["subreddit"], partition["flair"]))
+
+    for subreddit, flair in sorted(updated):
+        paths = [p["path"] for p in partitions.list_partitions(partition_root, elections=[(subreddit, flair)])]
+        published_file = os.path.join(partitions.election_dir(partition_root, subreddit, flair), partitions.PUBLISHED_FILE_NAME)
+        with profiling.timed_section("publish", subreddit=subreddit, flair=flair):
+            if partitions.publish_partitions(paths, published_file):
+                print(f"Published {published_file}")
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Classify the sentiment of processed comments.")
+    parser.add_argument("--partition-root", help="Process the day partitions under this directory "
+                                                 "(e.g. datasets) instead of a single CSV.")
+    parser.add_argument("--db", help="Classify the unclassified comments of this database (e.g. comments.db).")
+    parser.add_argument("--subreddit", action="append", dest="subreddits", help="Only this subreddit (repeatable).")
+    parser.add_argument("--flair", action="append", dest="flairs", help="Only this flair (repeatable).")
+    parser.add_argument("--force", action="store_true",
+                        help="Reprocess partitions that are up to date, and classify comments whose sentiment is known again.")
+    parser.add_argument("--shard", help="Classify the comments of shard I/N (e.g. 0/4); see sharding.py.")
+    parser.add_argument("--shard-root", default="shards", help="Where shard outputs are kept.")
+    args = parser.parse_args()
+
     print("Starting sentiment analysis script (Standard Python version)...")
     if OPENAI_API_KEY == "your_openai_api_key_placeholder":
         print("--- USING DUMMY SENTIMENT ANALYSIS AS OPENAI_API_KEY IS NOT SET ---")
     
-    process_comments_for_sentiment(INPUT_CSV_PATH, OUTPUT_CSV_PATH)
+    shard = None
+    if args.shard:
+        import sharding
+        try:
+            shard = sharding.parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+    # Run report: time and peak RSS per stage (extra captures with PIPELINE_PROFILE, see profiling.py)
+    profiling.start_batch_run("sentiment_analysis.py")
+    try:
+        if shard:
+            process_shard_for_sentiment(shard, args.shard_root)
+        elif args.db:
+            process_database_for_sentiment(args.db)
+        elif args.partition_root:
+            process_partitions_for_sentiment(args.partition_root, args.subreddits, args.flairs, args.force)
+        else:
+            import reannotate
+            import visualizations
+
+            # Comments carried over from earlier runs (see data_processing.py) keep their sentiment
+            known_sentiments = None if args.force else read_known_sentiments(OUTPUT_CSV_PATH)
+            process_comments_for_sentiment(INPUT_CSV_PATH, OUTPUT_CSV_PATH, known_sentiments)
+            reannotate.copy_index(INPUT_CSV_PATH, OUTPUT_CSV_PATH)
+            with profiling.timed_section("publish"):
+                published_file = visualizations.publish_compact_comments(OUTPUT_CSV_PATH)
+            if published_file:
+                print(f"Published {published_file} for the dashboard")
+    finally:
+        report_path = profiling.finish_batch_run()
     print("Sentiment analysis script finished.")
+    if report_path:
+        print(f"Run report saved to {report_path}")
 
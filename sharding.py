@@ -0,0 +1,174 @@
+"""
+Shard mode for large backfills: N workers (machines, or local processes) each process
+the posts whose post_id hashes to their shard, and a merge step combines their outputs.
+
+Each worker runs the usual scripts with --shard I/N (0 <= I < N):
+
+    python data_processing.py --shard 0/4        # Fetches and annotates shard 0's posts only
+    python sentiment_analysis.py --shard 0/4     # Classifies them and builds the shard's aggregates
+
+and writes shard-local outputs to shards/shard-0-of-4/. Posts are assigned with a
+stable hash (SHA-1, not Python's per-process hash()), so every worker agrees on the
+assignment. Comments without a post_id (e.g. older CSVs) are assigned by post title.
+
+When every shard is done, the merge combines them deterministically: comments are
+ordered by date, post and comment key (so the result doesn't depend on the number of
+shards or on which worker finished first), party counts are summed and aggregates
+merged with aggregates.merge_aggregates:
+
+    python sharding.py merge --count 4
+
+To try it with local processes standing in for the machines, re-annotating an
+existing CSV instead of fetching from Reddit:
+
+    python sharding.py local --count 4 --input comments_with_sentiment.csv
+"""
+
+import csv
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+import aggregates
+import visualizations
+
+# --- Configuration & Constants ---
+
+DEFAULT_SHARD_ROOT = "shards"
+PROCESSED_FILE_NAME = "processed_comments_before_sentiment.csv"
+SENTIMENT_FILE_NAME = "comments_with_sentiment.csv"
+COUNTS_FILE_NAME = "party_comment_counts.json"
+AGGREGATES_FILE_NAME = "chart_aggregates.json"
+
+# --- Helper Functions ---
+
+def parse_shard(value):
+    """Parses "I/N" into (index, count); raises ValueError unless 0 <= I < N."""
+    index, sep, count = str(value).partition("/")
+    if not sep:
+        raise ValueError(f"shard must look like I/N (e.g. 0/4), not {value!r}")
+    index, count = int(index), int(count)
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"shard index must be between 0 and {count - 1}, not {index}")
+    return index, count
+
+def post_key(row):
+    """The value a comment is sharded on: its post_id, or its post title when it has none."""
+    return str(row.get("post_id") or row.get("titulo_post") or "")
+
+def shard_of(key, count):
+    """The shard (0..count-1) of a post key; stable across processes and machines."""
+    return int(hashlib.sha1(key.encode("utf-8")).hexdigest()[:8], 16) % count
+
+def in_shard(row, shard):
+    """True when a post or comment row belongs to shard (index, count)."""
+    index, count = shard
+    return shard_of(post_key(row), count) == index
+
+def shard_dir(root, shard):
+    """Directory of a shard's outputs."""
+    index, count = shard
+    return os.path.join(root, f"shard-{index}-of-{count}")
+
+def merge_order(row):
+    """Sort key of the merged comments: date, post, then comment key."""
+    return (row.get("data_comentario") or "", post_key(row), aggregates.comment_key(row))
+
+# --- Core Functions ---
+
+def merge_shards(root=DEFAULT_SHARD_ROOT, count=None, output_dir="."):
+    """
+    Merges the outputs of shards 0..count-1 under root into output_dir:
+    comments_with_sentiment.csv (and its published copy for the dashboard, see
+    visualizations.publish_compact_comments), party_comment_counts.json and chart_aggregates.json.
+
+    Raises FileNotFoundError when a shard hasn't finished. Returns the number of comments.
+    """
+    shards = [(index, count) for index in range(count)]
+    missing = [shard_dir(root, shard) for shard in shards
+               if not os.path.exists(os.path.join(shard_dir(root, shard), AGGREGATES_FILE_NAME))]
+    if missing:
+        raise FileNotFoundError(f"Shards not finished: {', '.join(missing)}")
+
+    rows = []
+    fieldnames = []
+    party_counts = {}
+    states = []
+    for shard in shards:
+        directory = shard_dir(root, shard)
+        with open(os.path.join(directory, SENTIMENT_FILE_NAME), mode="r", newline="", encoding="utf-8") as csv_in:
+            reader = csv.DictReader(csv_in)
+            fieldnames += [name for name in reader.fieldnames or [] if name not in fieldnames]
+            rows.extend(reader)
+        counts_path = os.path.join(directory, COUNTS_FILE_NAME)
+        if os.path.exists(counts_path):
+            with open(counts_path, mode="r", encoding="utf-8") as f:
+                for party, party_count in json.load(f).items():
+                    party_counts[party] = party_counts.get(party, 0) + party_count
+        states.append(aggregates.load_aggregates(os.path.join(directory, AGGREGATES_FILE_NAME)))
+
+    rows.sort(key=merge_order)
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, SENTIMENT_FILE_NAME)
+    with open(output_path + ".tmp", mode="w", newline="", encoding="utf-8") as csv_out:
+        writer = csv.DictWriter(csv_out, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(output_path + ".tmp", output_path)
+    visualizations.publish_compact_comments(output_path)
+    with open(os.path.join(output_dir, COUNTS_FILE_NAME), mode="w", encoding="utf-8") as f:
+        json.dump(dict(sorted(party_counts.items())), f, ensure_ascii=False, indent=4)
+    aggregates.save_aggregates(aggregates.merge_aggregates(states), os.path.join(output_dir, AGGREGATES_FILE_NAME))
+    return len(rows)
+
+def run_local(count, input_csv, root=DEFAULT_SHARD_ROOT, output_dir="."):
+    """
+    Runs every shard of a backfill as a local process (annotation, then classification),
+    then merges them. Returns the number of merged comments.
+    """
+    steps = [
+        ["data_processing.py", "--from-csv", input_csv],
+        ["sentiment_analysis.py"],
+    ]
+    for step in steps:
+        start = time.perf_counter()
+        processes = [
+            subprocess.Popen([sys.executable, *step, "--shard", f"{index}/{count}", "--shard-root", root],
+                             stdout=subprocess.DEVNULL)
+            for index in range(count)
+        ]
+        failed = [index for index, process in enumerate(processes) if process.wait() != 0]
+        if failed:
+            raise RuntimeError(f"{step[0]} failed for shard(s) {', '.join(map(str, failed))}")
+        print(f"{step[0]}: {count} shards in {time.perf_counter() - start:.2f} s")
+    return merge_shards(root, count, output_dir)
+
+# --- Main Execution ---
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Merge sharded outputs, or run a sharded backfill locally.")
+    parser.add_argument("command", choices=["merge", "local"])
+    parser.add_argument("--count", type=int, required=True, help="Number of shards.")
+    parser.add_argument("--shard-root", default=DEFAULT_SHARD_ROOT, help="Directory holding the shard outputs.")
+    parser.add_argument("--output-dir", default=".", help="Where the merged outputs are written.")
+    parser.add_argument("--input", help="For local: CSV of comments to re-annotate instead of fetching.")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "local":
+            if not args.input:
+                parser.error("local needs --input")
+            count = run_local(args.count, args.input, args.shard_root, args.output_dir)
+        else:
+            count = merge_shards(args.shard_root, args.count, args.output_dir)
+    except (FileNotFoundError, RuntimeError) as e:
+        parser.exit(1, f"Error: {e}\n")
+    print(f"Merged {count} comments from {args.count} shards into {args.output_dir}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""
+SQLite storage for the comments, shared by data_processing.py, sentiment_analysis.py
+and the dashboard instead of rewriting and re-parsing whole CSV files.
+
+The comments table is indexed on id_comentario (unique), party, data_comentario and
+sentiment. Writes are upserts keyed on id_comentario: a comment that is already stored
+is updated in place (keeping its position), and fields a row doesn't have (e.g.
+sentiment, for comments that were only annotated) keep their stored value. Comments
+without an id are keyed on a hash of their content (aggregates.comment_key), which
+is stored as their id.
+
+Post titles and comment bodies, which make up most of the bytes, are kept apart from
+the label columns: titles are dictionary-encoded (one titles row per post, referenced by
+title_id), and comment bodies are stored in compressed blocks of TEXT_BLOCK_ROWS comments
+(zstd when the zstandard package is installed, zlib otherwise), referenced by block and
+position. Reading labels never touches them; iter_comments only joins the titles or
+decompresses the blocks holding the selected comments when those columns are asked for.
+Databases written with the text inline are converted when they are opened.
+
+Every write bumps a version counter, which the dashboard uses as the dataset version.
+
+CSV import/export remains available for compatibility:
+    python storage.py import comments_with_sentiment.csv
+    python storage.py export comments_with_sentiment.csv
+"""
+
+import csv
+import json
+import os
+import sqlite3
+import zlib
+from collections import Counter
+from contextlib import closing
+from datetime import timedelta
+
+import aggregates
+import visualizations
+
+# --- Configuration & Constants ---
+
+DEFAULT_DB_PATH = "comments.db"
+DATABASE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+COMMENT_COLUMNS = (
+    "id_comentario", "post_id", "titulo_post", "texto_comentario", "data_comentario",
+    "party", "sentiment", "score", "url_comentario",
+)
+TEXT_COLUMNS = ("titulo_post", "texto_comentario")  # Stored apart from the label columns
+LABEL_COLUMNS = tuple(column for column in COMMENT_COLUMNS[1:] if column not in TEXT_COLUMNS)
+INDEXED_COLUMNS = ("party", "data_comentario", "sentiment")  # id_comentario is indexed as unique
+BATCH_SIZE = 5000  # Rows per executemany call when streaming large imports
+UNCLASSIFIED_SENTIMENTS = ("", "error_api")  # Classified again (error_api: the API call failed)
+TEXT_BLOCK_ROWS = 256  # Comment bodies per compressed block
+TEXT_CACHE_BLOCKS = 4  # Decompressed blocks kept while reading
+ZSTD_LEVEL = 3
+ZLIB_LEVEL = 6
+SQL_VARIABLES = 900  # Ids per "IN (...)" lookup, under SQLite's oldest variable limit
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS comments ("
+    "seq INTEGER PRIMARY KEY, "
+    "id_comentario TEXT NOT NULL UNIQUE, "
+    + ", ".join(f"{column} TEXT" for column in LABEL_COLUMNS)
+    + ", title_id INTEGER, text_block INTEGER, text_index INTEGER)",
+    *[f"CREATE INDEX IF NOT EXISTS comments_{column} ON comments ({column})" for column in INDEXED_COLUMNS],
+    "CREATE TABLE IF NOT EXISTS titles (title_id INTEGER PRIMARY KEY, titulo_post TEXT NOT NULL UNIQUE)",
+    # live: comments whose body is still this block's; blocks are deleted when it drops to 0
+    "CREATE TABLE IF NOT EXISTS text_blocks ("
+    "block INTEGER PRIMARY KEY, codec TEXT NOT NULL, live INTEGER NOT NULL, data BLOB NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)",
+]
+
+# --- Helper Functions ---
+
+def is_database(path):
+    """True when a dataset path names a database rather than a CSV file."""
+    return str(path).lower().endswith(DATABASE_SUFFIXES)
+
+def connect(db_path=DEFAULT_DB_PATH):
+    """Opens (creating if needed) the comments database, converting one with the text stored inline."""
+    connection = sqlite3.connect(db_path, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")  # Readers (the dashboard) don't block the writer
+    connection.execute("PRAGMA synchronous=NORMAL")
+    if "texto_comentario" in _table_columns(connection):
+        _move_text_to_blocks(connection, db_path)
+    with connection:
+        for statement in SCHEMA:
+            connection.execute(statement)
+    return connection
+
+def _table_columns(connection, table="comments"):
+    return [row[1] for row in connection.execute(f"PRAGMA table_info({table})")]
+
+def _move_text_to_blocks(connection, db_path):
+    """Converts a database written with the titles and comment bodies inline (in comment order), in one transaction."""
+    with connection:
+        connection.execute("BEGIN IMMEDIATE")
+        if "texto_comentario" not in _table_columns(connection):
+            return  # Another process converted it while we waited
+        connection.execute("ALTER TABLE comments RENAME TO comments_inline")
+        for column in INDEXED_COLUMNS:
+            connection.execute(f"DROP INDEX IF EXISTS comments_{column}")
+        for statement in SCHEMA:
+            connection.execute(statement)
+        cursor = connection.execute(f"SELECT {', '.join(COMMENT_COLUMNS)} FROM comments_inline ORDER BY seq")
+        count = _upsert_rows(connection, (dict(zip(COMMENT_COLUMNS, values)) for values in iter(cursor.fetchone, None)))
+        connection.execute("DROP TABLE comments_inline")
+    connection.execute("VACUUM")
+    print(f"Moved the titles and comment text of {count} comments in {db_path} to compressed storage.")
+
+def _comment_values(row):
+    """The id and LABEL_COLUMNS values of a row (None for fields it doesn't have), keyed on its comment key."""
+    values = [aggregates.comment_key(row)]
+    for column in LABEL_COLUMNS:
+        value = row.get(column)
+        values.append(None if value is None else str(value))
+    return values
+
+def _bump_version(connection):
+    connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+def _zstd():
+    """The zstandard module, or None when it is not installed."""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+def _compress_texts(texts, live):
+    """Returns (codec, live, data): a text_blocks row of comment bodies, compressed with zstd when available."""
+    data = json.dumps(texts, ensure_ascii=False).encode("utf-8")
+    zstandard = _zstd()
+    if zstandard is not None:
+        return "zstd", live, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return "zlib", live, zlib.compress(data, ZLIB_LEVEL)
+
+def _decompress_texts(codec, data):
+    """The comment bodies of a block written by _compress_texts."""
+    if codec == "zstd":
+        zstandard = _zstd()
+        if zstandard is None:
+            raise RuntimeError("This database's comment text is zstd-compressed; install zstandard to read it.")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        data = zlib.decompress(data)
+    return json.loads(data.decode("utf-8"))
+
+def _text_reader(connection):
+    """
+    Returns text(block, index), the comment body at a position of a text block. Blocks
+    are decompressed on first use and the last TEXT_CACHE_BLOCKS are kept, so reading
+    comments in order decompresses each block once.
+    """
+    cache = {}
+
+    def text(block, index):
+        if block is None:
+            return None
+        if block not in cache:
+            if len(cache) >= TEXT_CACHE_BLOCKS:
+                del cache[next(iter(cache))]
+            codec, data = connection.execute(
+                "SELECT codec, data FROM text_blocks WHERE block = ?", (block,)
+            ).fetchone()
+            cache[block] = _decompress_texts(codec, data)
+        return cache[block][index]
+
+    return text
+
+def _chunks(values, size=SQL_VARIABLES):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _title_ids(connection, titles, known):
+    """Adds the titles that are new to the titles table; `known` maps every title to its title_id."""
+    missing = sorted(set(titles) - set(known))
+    connection.executemany("INSERT OR IGNORE INTO titles (titulo_post) VALUES (?)", [(t,) for t in missing])
+    for chunk in _chunks(missing):
+        known.update(connection.execute(
+            f"SELECT titulo_post, title_id FROM titles WHERE titulo_post IN ({', '.join('?' for _ in chunk)})", chunk
+        ))
+
+def _write_texts(connection, batch, texts):
+    """
+    Stores the comment bodies of a batch (texts[i] for batch[i], None when the row has
+    none) in new text blocks, skipping those equal to the stored text. Returns each row's
+    (text_block, text_index), (None, None) to keep the stored one, and the number of
+    bodies replaced per block.
+    """
+    stored = {}
+    ids = [values[0] for values, text in zip(batch, texts) if text is not None]
+    for chunk in _chunks(ids):
+        stored.update((comment_id, (block, index)) for comment_id, block, index in connection.execute(
+            f"SELECT id_comentario, text_block, text_index FROM comments "
+            f"WHERE text_block IS NOT NULL AND id_comentario IN ({', '.join('?' for _ in chunk)})", chunk
+        ))
+    stored_text = _text_reader(connection)
+    pending = []
+    replaced = Counter()
+    for i, (values, text) in enumerate(zip(batch, texts)):
+        if text is None:
+            continue
+        reference = stored.get(values[0])
+        if reference is not None:
+            if stored_text(*reference) == text:
+                continue
+            replaced[reference[0]] += 1
+        pending.append(i)
+
+    references = [(None, None)] * len(batch)
+    for chunk in _chunks(pending, TEXT_BLOCK_ROWS):
+        cursor = connection.execute(
+            "INSERT INTO text_blocks (codec, live, data) VALUES (?, ?, ?)",
+            _compress_texts([texts[i] for i in chunk], len(chunk))
+        )
+        for index, i in enumerate(chunk):
+            references[i] = (cursor.lastrowid, index)
+    return references, replaced
+
+# --- Core Functions ---
+
+def upsert_comments(connection, rows):
+    """
+    Inserts or updates comments (dictionaries with COMMENT_COLUMNS fields) in one transaction.
+
+    Stored comments keep their position and the fields the new row doesn't have.
+    Returns the number of rows written.
+    """
+    with connection:
+        written = _upsert_rows(connection, rows)
+        _bump_version(connection)
+    return written
+
+def _upsert_rows(connection, rows):
+    """upsert_comments within the caller's transaction; titles and bodies go to their own tables."""
+    columns = ("id_comentario",) + LABEL_COLUMNS + ("title_id", "text_block", "text_index")
+    updates = ", ".join(
+        f"{column} = COALESCE(excluded.{column}, comments.{column})" for column in columns[1:]
+    )
+    statement = (
+        f"INSERT INTO comments ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' for _ in columns)}) "
+        f"ON CONFLICT (id_comentario) DO UPDATE SET {updates}"
+    )
+    title_ids = {}
+    written = 0
+    batch, titles, texts = [], [], []
+    positions = {}  # Comment id -> its row in the batch
+
+    def flush():
+        _title_ids(connection, [title for title in titles if title is not None], title_ids)
+        references, replaced = _write_texts(connection, batch, texts)
+        connection.executemany(statement, [
+            values + [title_ids.get(title), *reference]
+            for values, title, reference in zip(batch, titles, references)
+        ])
+        connection.executemany("UPDATE text_blocks SET live = live - ? WHERE block = ?",
+                               [(count, block) for block, count in replaced.items()])
+        connection.executemany("DELETE FROM text_blocks WHERE block = ? AND live <= 0", [(b,) for b in replaced])
+        return len(batch)
+
+    for row in rows:
+        values = _comment_values(row)
+        title = None if row.get("titulo_post") is None else str(row["titulo_post"])
+        text = None if row.get("texto_comentario") is None else str(row["texto_comentario"])
+        if values[0] in positions:
+            # A comment repeated in the batch (e.g. overlapping shards) is merged into one row, as
+            # consecutive upserts would be, so each stored body is referenced by exactly one comment
+            i = positions[values[0]]
+            batch[i] = [new if new is not None else old for old, new in zip(batch[i], values)]
+            titles[i] = title if title is not None else titles[i]
+            texts[i] = text if text is not None else texts[i]
+            written += 1
+            continue
+        positions[values[0]] = len(batch)
+        batch.append(values)
+        titles.append(title)
+        texts.append(text)
+        if len(batch) >= BATCH_SIZE:
+            written += flush()
+            batch, titles, texts = [], [], []
+            positions = {}
+    if batch:
+        written += flush()
+    return written
+
+def set_sentiments(connection, sentiments):
+    """Stores classified sentiments, given as (id_comentario, sentiment) pairs, in one transaction."""
+    with connection:
+        connection.executemany(
+            "UPDATE comments SET sentiment = ? WHERE id_comentario = ?",
+            [(sentiment, comment_id) for comment_id, sentiment in sentiments],
+        )
+        _bump_version(connection)
+
+def iter_comments(connection, columns=COMMENT_COLUMNS, parties=None, start_date=None, end_date=None,
+                  unclassified=False):
+    """
+    Yields stored comments as dictionaries (the row format of visualizations.read_csv_data),
+    in insertion order. Filters use the indexes: parties, an inclusive date range (on
+    the stored YYYY-MM-DD HH:MM:SS timestamps) and, with unclassified=True, only
+    comments without a sentiment (or whose classification failed). Missing fields are "".
+    Titles are only looked up, and text blocks only decompressed, when their columns
+    are asked for.
+    """
+    conditions, parameters = [], []
+    if parties:
+        conditions.append(f"party IN ({', '.join('?' for _ in parties)})")
+        parameters.extend(parties)
+    if start_date:
+        conditions.append("data_comentario >= ?")
+        parameters.append(start_date.isoformat())
+    if end_date:
+        conditions.append("data_comentario < ?")  # Timestamps of end_date sort before the next day
+        parameters.append((end_date + timedelta(days=1)).isoformat())
+    if unclassified:
+        conditions.append(f"(sentiment IS NULL OR sentiment IN ({', '.join('?' for _ in UNCLASSIFIED_SENTIMENTS)}))")
+        parameters.extend(UNCLASSIFIED_SENTIMENTS)
+    selected = [
+        "titles.titulo_post" if column == "titulo_post"
+        else "comments.text_block" if column == "texto_comentario"
+        else f"comments.{column}"
+        for column in columns
+    ]
+    text_position = columns.index("texto_comentario") if "texto_comentario" in columns else None
+    if text_position is not None:
+        selected.append("comments.text_index")  # Last, popped when the text is read
+    query = f"SELECT {', '.join(selected)} FROM comments"
+    if "titulo_post" in columns:
+        query += " LEFT JOIN titles ON titles.title_id = comments.title_id"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    cursor = connection.execute(query + " ORDER BY seq", parameters)
+    text = _text_reader(connection)
+    while True:
+        batch = cursor.fetchmany(BATCH_SIZE)
+        if not batch:
+            break
+        for values in batch:
+            if text_position is not None:
+                values = list(values)
+                values[text_position] = text(values[text_position], values.pop())
+            yield {column: "" if value is None else value for column, value in zip(columns, values)}
+
+def get_storage_version(db_path=DEFAULT_DB_PATH):
+    """Version key of the database (changes with every write); None if it doesn't exist."""
+    if not os.path.exists(db_path):
+        return None
+    try:
+        with closing(sqlite3.connect(db_path, timeout=30)) as connection:
+            (version,) = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    except sqlite3.Error as e:
+        print(f"Error reading database {db_path}: {e}")
+        return None
+    return f"db-{version}"
+
+def load_compact_comments(db_path=DEFAULT_DB_PATH, annotate=True):
+    """Builds the compact dashboard frame (see visualizations.build_compact_comments) from the database."""
+    columns = ("party", "sentiment", "data_comentario") + (("texto_comentario",) if annotate else ())
+    if not os.path.exists(db_path):
+        print(f"Warning: Database {db_path} not found.")
+        return visualizations.build_compact_comments([], annotate=annotate)
+    with closing(connect(db_path)) as connection:
+        # Row numbers aren't CSV record numbers, so there is no source to read details back from
+        return visualizations.build_compact_comments(iter_comments(connection, columns), annotate=annotate)
+
+def import_csv(db_path, csv_path):
+    """Upserts the comments of a CSV file into the database; returns the number of rows."""
+    with open(csv_path, mode="r", newline="", encoding="utf-8") as csv_in, closing(connect(db_path)) as connection:
+        return upsert_comments(connection, csv.DictReader(csv_in))
+
+def export_csv(db_path, csv_path, columns=COMMENT_COLUMNS):
+    """Writes the stored comments to a CSV file (atomically); returns the number of rows."""
+    count = 0
+    with closing(connect(db_path)) as connection, open(csv_path + ".tmp", mode="w", newline="", encoding="utf-8") as csv_out:
+        writer = csv.DictWriter(csv_out, fieldnames=list(columns))
+        writer.writeheader()
+        for row in iter_comments(connection, columns):
+            writer.writerow(row)
+            count += 1
+    os.replace(csv_path + ".tmp", csv_path)
+    return count
+
+# --- Main Execution ---
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import comments from, or export them to, CSV.")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("csv", help="CSV file to import or export to.")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Database file.")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        count = import_csv(args.db, args.csv)
+        print(f"Imported {count} comments from {args.csv} into {args.db}.")
+    else:
+        count = export_csv(args.db, args.csv)
+        print(f"Exported {count} comments from {args.db} to {args.csv}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import golden
+import visualizations
+
+@pytest.fixture(scope="session")
+def data_rows():
+    """Row dictionaries of the shipped dataset."""
+    return visualizations.read_csv_data(golden.DATASET_PATH)
+
+@pytest.fixture(scope="session")
+def compact_frame():
+    """Compact dashboard frame of the shipped dataset, parsed from the CSV (not a published copy)."""
+    return visualizations._read_compact_comments(golden.DATASET_PATH)
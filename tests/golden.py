@@ -0,0 +1,199 @@
+"""
+Golden outputs and performance budgets for the regression tests.
+
+The golden files pin what the dashboard shows for the shipped comments_with_sentiment.csv:
+the party, topics and leaders of every comment (golden/annotations.csv) and every chart
+payload (golden/payloads.json). budgets.json holds the time and peak memory of each
+benchmark target (see benchmark.py) on a fixed synthetic corpus, measured on the
+machine that recorded them together with a calibration workload, so the budgets can
+be scaled to the speed of the machine running the tests.
+
+When a change is meant to change the numbers (e.g. new keywords), regenerate them and
+review the diff:
+    python tests/golden.py              # annotations.csv and payloads.json
+    python tests/golden.py --budgets    # budgets.json, after a deliberate speed/memory trade-off
+"""
+
+import csv
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+import benchmark
+import data_processing
+import visualizations
+
+# --- Configuration & Constants ---
+
+DATASET_PATH = os.path.join(REPO_DIR, "comments_with_sentiment.csv")
+ANNOTATIONS_PATH = os.path.join(TESTS_DIR, "golden", "annotations.csv")
+PAYLOADS_PATH = os.path.join(TESTS_DIR, "golden", "payloads.json")
+BUDGETS_PATH = os.path.join(TESTS_DIR, "budgets.json")
+ANNOTATION_FIELDS = ["comment_key", "party", "topics", "leader", "leaders"]
+LIST_SEPARATOR = ";"
+
+BUDGET_ROWS = 1000  # identify_party_in_comment alone takes ~2 ms per comment
+BUDGET_SEED = benchmark.DEFAULT_SEED
+BUDGET_TOLERANCE = {"seconds": 0.5, "peak_memory_bytes": 0.2}  # Allowed regression, as a fraction of the budget
+MIN_SECONDS = 0.005  # Budgets below these are compared against them (timer noise, small allocations)
+MIN_MEMORY_BYTES = 64 * 1024
+TIMING_REPEATS = 3
+CALIBRATION_ROWS = 5000
+CALIBRATION_REPEATS = 5
+
+# --- Golden Outputs ---
+
+def annotate_rows(data_rows):
+    """Returns the golden annotation record of each comment (lists joined with LIST_SEPARATOR)."""
+    import aggregates
+
+    records = []
+    for row in data_rows:
+        text = row.get("texto_comentario") or ""
+        leader_counts = visualizations.count_party_leaders(text)
+        records.append({
+            "comment_key": aggregates.comment_key(row),
+            "party": data_processing.identify_party_in_comment(text),
+            "topics": LIST_SEPARATOR.join(visualizations.identify_topics(text)),
+            "leader": visualizations.identify_party_leader(text),
+            "leaders": LIST_SEPARATOR.join(leader_counts),
+        })
+    return records
+
+def chart_payloads(data):
+    """
+    Returns every chart payload of the dashboard for data (row dictionaries or a compact
+    frame), keyed by chart, in their JSON form.
+    """
+    payloads = {
+        "paired_bar": visualizations.get_paired_bar_plot_data(data),
+        "party_distribution": visualizations.get_pie_chart_party_distribution_data(data),
+        "leader_distribution": visualizations.get_pie_chart_leader_distribution_data(data),
+        "leader_distribution_all": visualizations.get_pie_chart_leader_distribution_data(data, count_all=True),
+    }
+    for granularity in ("hour", "day", "week"):
+        payloads[f"time_series_{granularity}"] = visualizations.get_time_series_party_mentions_data(
+            data, granularity=granularity
+        )
+    tables = visualizations.get_word_cloud_tables(data)
+    for party_filter in sorted(tables):
+        payloads[f"word_cloud_{party_filter}"] = visualizations.get_word_cloud_data(None, party_filter, tables=tables)
+    # Round-tripped, so tuples and NumPy arrays compare equal to the stored JSON
+    return json.loads(json.dumps(visualizations.to_json_compatible(payloads), ensure_ascii=False))
+
+def read_annotations(path=ANNOTATIONS_PATH):
+    with open(path, mode="r", newline="", encoding="utf-8") as csv_in:
+        return list(csv.DictReader(csv_in))
+
+def read_payloads(path=PAYLOADS_PATH):
+    with open(path, mode="r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_golden():
+    """Regenerates annotations.csv and payloads.json from the shipped dataset."""
+    data_rows = visualizations.read_csv_data(DATASET_PATH)
+    os.makedirs(os.path.dirname(ANNOTATIONS_PATH), exist_ok=True)
+    with open(ANNOTATIONS_PATH, mode="w", newline="", encoding="utf-8") as csv_out:
+        writer = csv.DictWriter(csv_out, fieldnames=ANNOTATION_FIELDS)
+        writer.writeheader()
+        writer.writerows(annotate_rows(data_rows))
+    with open(PAYLOADS_PATH, mode="w", encoding="utf-8") as f:
+        json.dump(chart_payloads(data_rows), f, ensure_ascii=False, indent=1)
+    print(f"Wrote golden outputs of {len(data_rows)} comments to {os.path.dirname(ANNOTATIONS_PATH)}")
+
+# --- Performance Budgets ---
+
+def calibration_workload():
+    """Fixed pure-Python work (the kind the annotators do) timed to compare machine speeds."""
+    rows = benchmark.generate_synthetic_comments(CALIBRATION_ROWS, BUDGET_SEED)
+    return [visualizations.strip_accents(row["texto_comentario"].lower()).split() for row in rows]
+
+def calibration_seconds():
+    return best_seconds(calibration_workload, repeats=CALIBRATION_REPEATS)
+
+def best_seconds(func, *args, repeats=TIMING_REPEATS):
+    """
+    Fastest of `repeats` calls of func(*args), in CPU seconds of this process (time
+    spent waiting for a busy CPU isn't counted).
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.process_time()
+        func(*args)
+        seconds = time.process_time() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+def peak_memory(func, *args):
+    """Peak Python memory (tracemalloc) of func(*args), in bytes."""
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def budget_corpus(directory):
+    """Returns (rows, csv_path) of the fixed synthetic corpus, written under directory."""
+    rows = benchmark.generate_synthetic_comments(BUDGET_ROWS, BUDGET_SEED)
+    csv_path = os.path.join(directory, f"synthetic_{BUDGET_ROWS}.csv")
+    benchmark.write_csv(rows, csv_path)
+    return rows, csv_path
+
+def measure_budgets(directory):
+    """Measures every benchmark target on the budget corpus: {name: {"seconds", "peak_memory_bytes"}}."""
+    rows, csv_path = budget_corpus(directory)
+    measured = {}
+    for name, func in benchmark.get_benchmark_targets().items():
+        measured[name] = {
+            "seconds": round(best_seconds(func, rows, csv_path), 6),
+            "peak_memory_bytes": peak_memory(func, rows, csv_path),
+        }
+    return measured
+
+def read_budgets(path=BUDGETS_PATH):
+    with open(path, mode="r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_budgets():
+    """Re-measures budgets.json on this machine."""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        functions = measure_budgets(tmp_dir)
+    budgets = {
+        "rows": BUDGET_ROWS,
+        "seed": BUDGET_SEED,
+        "calibration_seconds": round(calibration_seconds(), 6),  # Measured warm, as in the tests
+        "functions": functions,
+    }
+    with open(BUDGETS_PATH, mode="w", encoding="utf-8") as f:
+        json.dump(budgets, f, indent=4)
+    for name, budget in budgets["functions"].items():
+        print(f"  {name:<45} {budget['seconds']:10.4f} s  {budget['peak_memory_bytes'] / 2**20:8.2f} MiB")
+    print(f"Wrote budgets for {BUDGET_ROWS} synthetic comments to {BUDGETS_PATH}")
+
+# --- Main Execution ---
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Regenerate the golden outputs or performance budgets of the tests.")
+    parser.add_argument("--budgets", action="store_true", help="Re-measure the performance budgets instead.")
+    args = parser.parse_args()
+
+    if args.budgets:
+        write_budgets()
+    else:
+        write_golden()
+
+if __name__ == "__main__":
+    main()
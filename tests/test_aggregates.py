@@ -0,0 +1,108 @@
+"""
+Saved chart aggregates (aggregates.save_aggregates / load_aggregates): totals as JSON,
+per-comment contributions in an indexed file updated with the delta only.
+"""
+
+import json
+import os
+
+import aggregates
+
+def comment(comment_id, party, sentiment, text="debate"):
+    return {"id_comentario": comment_id, "party": party, "sentiment": sentiment,
+            "data_comentario": "2025-05-01 10:00:00", "texto_comentario": text}
+
+def test_refresh_reads_and_writes_only_the_delta(tmp_path, data_rows):
+    state_path = str(tmp_path / "chart_aggregates.json")
+    state = aggregates.new_aggregates()
+    aggregates.apply_delta(state, data_rows)
+    aggregates.save_aggregates(state, state_path)
+    with open(state_path, encoding="utf-8") as f:
+        assert "contributions" not in json.load(f)  # The totals file doesn't grow with the corpus
+
+    state = aggregates.load_aggregates(state_path)
+    assert state["comments"] == len({aggregates.comment_key(row) for row in data_rows})
+    assert state["contributions"] == {}
+    first = data_rows[0]
+    flipped = dict(first, sentiment="negative" if first["sentiment"] == "positive" else "positive")
+    stats = aggregates.apply_delta(state, [flipped, comment("new", "PS", "positive")])
+    assert stats == {"added": 1, "replaced": 1, "unchanged": 0}
+    assert set(state["contributions"]) == {aggregates.comment_key(first), "new"}
+    aggregates.save_aggregates(state, state_path)
+
+    reloaded = aggregates.load_aggregates(state_path)
+    rebuilt = aggregates.new_aggregates()
+    aggregates.apply_delta(rebuilt, data_rows + [flipped, comment("new", "PS", "positive")])
+    for table in ("comments", "party_sentiment", "day_party", "party_topics", "leaders"):
+        assert reloaded[table] == rebuilt[table]
+    assert dict(aggregates.iter_contributions(reloaded)) == dict(aggregates.iter_contributions(rebuilt))
+
+def test_merged_states_are_saved_anew(tmp_path):
+    paths = [str(tmp_path / f"day{day}.json") for day in (1, 2)]
+    for day, path in enumerate(paths):
+        state = aggregates.new_aggregates()
+        aggregates.apply_delta(state, [comment(f"c{day}", "PS", "positive"), comment("shared", "AD", "negative")])
+        aggregates.save_aggregates(state, path)
+    merged_path = str(tmp_path / "merged.json")
+    aggregates.save_aggregates(aggregates.new_aggregates(), merged_path)  # Replaced, not added to
+
+    aggregates.save_aggregates(aggregates.merge_aggregates([aggregates.load_aggregates(p) for p in paths]),
+                               merged_path)
+
+    merged = aggregates.load_aggregates(merged_path)
+    assert merged["comments"] == 3
+    assert merged["party_sentiment"] == {"PS": {"positive": 2}, "AD": {"negative": 1}}
+    assert sorted(key for key, _ in aggregates.iter_contributions(merged)) == ["c0", "c1", "shared"]
+
+def test_totals_out_of_step_with_contributions_start_over(tmp_path):
+    state_path = str(tmp_path / "chart_aggregates.json")
+    state = aggregates.new_aggregates()
+    aggregates.apply_delta(state, [comment("a", "PS", "positive")])
+    aggregates.save_aggregates(state, state_path)
+    os.remove(aggregates.contributions_path(state_path))  # E.g. lost, or the totals were saved elsewhere
+
+    state = aggregates.load_aggregates(state_path)
+
+    assert state["comments"] == 0
+    assert state["watermark"]["source"] is None  # The next refresh reads the dataset from the start
+
+def write_csv(path, sentiments, mode="w"):
+    with open(path, mode=mode, encoding="utf-8", newline="") as f:
+        if mode == "w":
+            f.write("id_comentario,party,sentiment\n")
+        for position, sentiment in enumerate(sentiments):
+            f.write(f"{mode}{position},PS,{sentiment}\n")
+
+def test_tail_restarts_after_a_same_length_edit(tmp_path):
+    path = str(tmp_path / "comments.csv")
+    write_csv(path, ["positive", "negative"])
+    watermark = aggregates.new_watermark()
+    rows, restarted = aggregates.read_csv_tail(watermark, path)
+    assert len(rows) == 2 and restarted
+
+    write_csv(path, ["positive"], mode="a")  # Appended: only the new row is read
+    rows, restarted = aggregates.read_csv_tail(watermark, path)
+    assert [row["id_comentario"] for row in rows] == ["a0"] and not restarted
+
+    with open(path, mode="r+b") as f:  # The first label flipped in place, same length
+        f.seek(f.read().index(b"positive"))
+        f.write(b"negative")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, watermark["mtime"] + 1_000_000))
+    rows, restarted = aggregates.read_csv_tail(watermark, path)
+    assert restarted and [row["sentiment"] for row in rows] == ["negative", "negative", "positive"]
+
+    rows, restarted = aggregates.read_csv_tail(watermark, path)
+    assert rows == [] and not restarted
+
+def test_tail_restarts_for_a_replaced_file(tmp_path):
+    path = str(tmp_path / "comments.csv")
+    write_csv(path, ["positive"])
+    watermark = aggregates.new_watermark()
+    aggregates.read_csv_tail(watermark, path)
+    write_csv(str(tmp_path / "new.csv"), ["negative", "positive"])
+    os.replace(str(tmp_path / "new.csv"), path)
+
+    rows, restarted = aggregates.read_csv_tail(watermark, path)
+
+    assert restarted and len(rows) == 2
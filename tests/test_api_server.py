@@ -0,0 +1,76 @@
+"""
+Data source of the JSON API (api_server.current_source): partitioned elections, then
+the comments database, then the CSV, as in the dashboard; responses are cached per
+source and version.
+"""
+
+import csv
+import json
+from contextlib import closing
+
+import pytest
+
+import api_server
+import partitions
+import storage
+
+FIELDS = ["titulo_post", "texto_comentario", "data_comentario", "party", "sentiment", "id_comentario"]
+
+def comment(comment_id, day, party, sentiment):
+    return {"titulo_post": "Debate", "texto_comentario": "debate", "data_comentario": f"{day} 10:00:00",
+            "party": party, "sentiment": sentiment, "id_comentario": comment_id}
+
+def write_csv(path, rows):
+    with open(path, mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def sentiment_counts(state, query=""):
+    body, _, _ = api_server.get_response(state, "/api/sentiment", query)
+    payload = json.loads(body)
+    return {label: [dataset["data"][i] for dataset in payload["datasets"]]
+            for i, label in enumerate(payload["labels"])}
+
+@pytest.fixture
+def api_state(tmp_path):
+    csv_path = str(tmp_path / "comments_with_sentiment.csv")
+    write_csv(csv_path, [comment("c1", "2025-05-01", "PS", "positive")])
+    return api_server.new_api_state(csv_path, str(tmp_path / "datasets"), str(tmp_path / "comments.db"))
+
+def test_csv_is_served_without_partitions_or_database(api_state):
+    assert api_server.version_payload(api_state)["kind"] == "csv"
+    assert sentiment_counts(api_state) == {"PS": [1, 0]}
+
+def test_database_is_preferred_to_the_csv(api_state):
+    with closing(storage.connect(api_state["db_path"])) as connection:
+        storage.upsert_comments(connection, [comment("d1", "2025-05-01", "AD", "negative")])
+    assert api_server.version_payload(api_state)["kind"] == "database"
+    assert sentiment_counts(api_state) == {"AD": [0, 1]}
+
+    with closing(storage.connect(api_state["db_path"])) as connection:
+        storage.upsert_comments(connection, [comment("d2", "2025-05-01", "AD", "negative")])
+    assert sentiment_counts(api_state) == {"AD": [0, 2]}  # A new version isn't answered from the cache
+
+def test_partitioned_elections_are_selected_like_the_dashboard(api_state):
+    root = api_state["partition_root"]
+    partitions.write_partitioned([comment("a1", "2024-03-01", "PS", "positive")], root, "portugal",
+                                 "Legislativas 2024", partitions.SENTIMENT_FILE_NAME, FIELDS)
+    partitions.write_partitioned([comment("b1", "2025-05-01", "AD", "negative")], root, "portugal",
+                                 "Legislativas 2025", partitions.SENTIMENT_FILE_NAME, FIELDS)
+
+    version = api_server.version_payload(api_state)
+    assert (version["kind"], version["elections"], version["rows"]) == ("partitions", ["portugal/Legislativas 2025"], 1)
+    assert sentiment_counts(api_state) == {"AD": [0, 1]}
+    assert sentiment_counts(api_state, "election=portugal/Legislativas 2024") == {"PS": [1, 0]}
+    both = "election=portugal/Legislativas 2024&election=portugal/Legislativas 2025"
+    assert sentiment_counts(api_state, both) == {"AD": [0, 1], "PS": [1, 0]}
+
+    partitions.write_partitioned([comment("b2", "2025-05-02", "AD", "positive")], root, "portugal",
+                                 "Legislativas 2025", partitions.SENTIMENT_FILE_NAME, FIELDS)
+    assert sentiment_counts(api_state) == {"AD": [1, 1]}  # A new day changes the version
+
+    with pytest.raises(api_server.BadRequest, match="Unknown election"):
+        api_server.get_response(api_state, "/api/sentiment", "election=portugal/Autárquicas")
+    with pytest.raises(api_server.BadRequest, match="SUBREDDIT/FLAIR"):
+        api_server.get_response(api_state, "/api/sentiment", "election=portugal")
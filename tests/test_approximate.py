@@ -0,0 +1,91 @@
+"""
+Approximate dashboard mode (visualizations.build_stratified_sample): the stratified
+sample, its reservoir updates, and the estimates and confidence intervals of the charts.
+"""
+
+import numpy as np
+import pandas as pd
+
+import visualizations
+
+def payload_values(payload):
+    return payload["labels"], [dataset["data"] for dataset in payload["datasets"]]
+
+def test_sampling_every_comment_gives_the_exact_charts(compact_frame):
+    sample = visualizations.build_stratified_sample(compact_frame, per_stratum=len(compact_frame))
+
+    approximate = visualizations.get_approximate_paired_bar_data(sample)
+    assert payload_values(approximate) == payload_values(visualizations.get_paired_bar_plot_data(compact_frame))
+    assert not any(any(dataset["ci"]) or any(dataset["percentage_ci"]) for dataset in approximate["datasets"])
+    for granularity in visualizations.TIME_SERIES_GRANULARITIES:
+        approximate = visualizations.get_approximate_time_series_data(sample, granularity=granularity)
+        exact = visualizations.get_time_series_party_mentions_data(compact_frame, granularity=granularity)
+        assert payload_values(approximate) == payload_values(exact)
+        assert not any(any(dataset["ci"]) for dataset in approximate["datasets"])
+
+def test_strata_are_bounded_and_counted_exactly(compact_frame):
+    sample = visualizations.build_stratified_sample(compact_frame, per_stratum=5)
+
+    assert np.bincount(sample["stratum"]).max() == 5
+    defined = compact_frame[visualizations._defined_party_mask(compact_frame["party"])]
+    counts = defined.groupby(["party", "day"], observed=True).size()
+    assert {key: int(count) for key, count in counts.items()} == {
+        key: int(sample["count"][stratum]) for key, stratum in sample["strata"].items()
+    }
+    approximate = visualizations.get_approximate_party_distribution_data(sample)
+    exact = visualizations.get_pie_chart_party_distribution_data(compact_frame)
+    assert dict(zip(approximate["labels"], approximate["datasets"][0]["data"])) == dict(
+        zip(exact["labels"], exact["datasets"][0]["data"])
+    )
+
+def test_appended_rows_are_folded_in(compact_frame):
+    half = len(compact_frame) // 2
+    sample = visualizations.build_stratified_sample(compact_frame.iloc[:half], per_stratum=5)
+    updated = visualizations.update_stratified_sample(sample, compact_frame)
+    full = visualizations.build_stratified_sample(compact_frame, per_stratum=5)
+
+    assert updated["rows"] == len(compact_frame) and sample["rows"] == half
+    assert set(updated["strata"]) == set(full["strata"])
+    assert updated["count"].sum() == full["count"].sum()
+    sampled = np.bincount(updated["stratum"], minlength=updated["count"].size)
+    assert (sampled == np.minimum(updated["count"], 5)).all()
+    assert visualizations.update_stratified_sample(updated, compact_frame) is updated
+
+def test_reservoir_keeps_every_comment_equally_likely():
+    # One stratum of 100 comments appended in batches of 10; the hour marks each comment
+    frame = pd.DataFrame({
+        "party": pd.Categorical(["PS"] * 100), "sentiment": pd.Categorical(["positive"] * 100),
+        "day": np.full(100, 739348, dtype=np.int32), "hour": np.arange(100, dtype=np.uint8),
+    })
+    kept = np.zeros(100)
+    for seed in range(400):
+        sample = visualizations.new_stratified_sample(per_stratum=10, seed=seed)
+        for end in range(10, 101, 10):
+            sample = visualizations.update_stratified_sample(sample, frame.iloc[:end])
+        kept[sample["hour"]] += 1
+    # Each comment is kept with probability 0.1: 40 of 400 times (sd ~6)
+    first, last = kept[:50].mean(), kept[50:].mean()
+    assert 35 < first < 45 and 35 < last < 45
+    assert kept.min() > 15 and kept.max() < 70
+
+def test_confidence_intervals_cover_the_exact_counts(compact_frame):
+    exact = visualizations.get_paired_bar_plot_data(compact_frame)
+    covered = total = 0
+    for seed in range(20):
+        sample = visualizations.build_stratified_sample(compact_frame, per_stratum=10, seed=seed)
+        approximate = visualizations.get_approximate_paired_bar_data(sample)
+        assert approximate["labels"] == exact["labels"]
+        for estimated, actual in zip(approximate["datasets"], exact["datasets"]):
+            for value, ci, exact_value in zip(estimated["data"], estimated["ci"], actual["data"]):
+                covered += abs(value - exact_value) <= ci + 0.5  # Estimates are rounded
+                total += 1
+    assert covered / total >= 0.85
+
+def test_date_filter_keeps_confidence_intervals_aligned(compact_frame):
+    sample = visualizations.build_stratified_sample(compact_frame, per_stratum=10)
+    hourly = visualizations.get_approximate_time_series_data(sample, granularity="hour")
+    start = hourly["dates"][len(hourly["dates"]) // 2].astype("datetime64[D]").item()
+    filtered = visualizations.filter_time_series_by_date_range(hourly, start, start)
+    offset = hourly["labels"].index(filtered["labels"][0])
+    for dataset, full in zip(filtered["datasets"], hourly["datasets"]):
+        assert dataset["ci"] == full["ci"][offset:offset + len(filtered["labels"])]
@@ -0,0 +1,40 @@
+"""
+Performance budgets: each benchmark target (see benchmark.py) must stay within its
+recorded time and peak memory on the fixed synthetic corpus, plus a tolerance
+(golden.BUDGET_TOLERANCE). Time budgets are scaled by how much slower or faster this
+machine runs the calibration workload than the one that recorded them.
+"""
+
+import pytest
+
+import benchmark
+import golden
+
+BUDGETS = golden.read_budgets()
+
+@pytest.fixture(scope="module")
+def measured(tmp_path_factory):
+    return golden.measure_budgets(tmp_path_factory.mktemp("budgets"))
+
+@pytest.fixture(scope="module")
+def speed_ratio():
+    """This machine's calibration time over the recorded one (> 1: slower machine)."""
+    return golden.calibration_seconds() / BUDGETS["calibration_seconds"]
+
+def test_budgets_cover_every_benchmark_target():
+    assert sorted(BUDGETS["functions"]) == sorted(benchmark.get_benchmark_targets())
+    assert (BUDGETS["rows"], BUDGETS["seed"]) == (golden.BUDGET_ROWS, golden.BUDGET_SEED)
+
+@pytest.mark.parametrize("name", sorted(BUDGETS["functions"]))
+def test_time_budget(name, measured, speed_ratio):  # speed_ratio after measured: both warm
+    budget = max(BUDGETS["functions"][name]["seconds"], golden.MIN_SECONDS) * speed_ratio
+    limit = budget * (1 + golden.BUDGET_TOLERANCE["seconds"])
+    seconds = measured[name]["seconds"]
+    assert seconds <= limit, f"{name}: {seconds:.4f} s, budget {budget:.4f} s (limit {limit:.4f} s)"
+
+@pytest.mark.parametrize("name", sorted(BUDGETS["functions"]))
+def test_memory_budget(name, measured):
+    budget = max(BUDGETS["functions"][name]["peak_memory_bytes"], golden.MIN_MEMORY_BYTES)
+    limit = budget * (1 + golden.BUDGET_TOLERANCE["peak_memory_bytes"])
+    peak = measured[name]["peak_memory_bytes"]
+    assert peak <= limit, f"{name}: {peak / 2**20:.2f} MiB, budget {budget / 2**20:.2f} MiB"
@@ -0,0 +1,183 @@
+"""
+Comment tree expansion (data_processing.expand_comment_tree and the re-visit queue),
+against fake PRAW objects: largest stubs first, request budget, cut-offs and deferral.
+"""
+
+import sys
+import types
+
+import pytest
+
+import data_processing
+
+class FakeMoreComments:
+    def __init__(self, count, parent_id, loaded, depth=0, children=None):
+        self.count = count
+        self.parent_id = parent_id
+        self.depth = depth
+        self.children = children if children is not None else [f"c{count}_{i}" for i in range(count)]
+        self.loaded = loaded
+        self.requested = False
+        self.submission = None  # Set by PRAW for stubs of a submission's tree, not for ones an expansion returns
+
+    def comments(self, update=True):
+        assert self.submission, "MoreComments has no submission"  # As PRAW asserts
+        self.requested = True
+        return self.loaded
+
+class FakeComment:
+    def __init__(self, comment_id, score=1, depth=0):
+        self.id = comment_id
+        self.fullname = f"t1_{comment_id}"
+        self.score = score
+        self.depth = depth
+        self.body = f"comment {comment_id}"
+        self.author = None
+        self.created_utc = 1745000000
+
+class FakeForest:
+    def __init__(self, items):
+        self.items = items
+
+    def list(self):
+        return list(self.items)
+
+class FakeSubmission:
+    def __init__(self, items):
+        self.comments = FakeForest(items)
+
+class FakeReddit:
+    def __init__(self, submissions):
+        self.submissions = submissions
+        self.info_requests = []
+
+    def submission(self, id):
+        return self.submissions[id]
+
+    def info(self, fullnames):
+        self.info_requests.append(fullnames)
+        return [FakeComment(fullname.split("_", 1)[1]) for fullname in fullnames]
+
+@pytest.fixture(autouse=True)
+def fake_praw(monkeypatch):
+    praw = types.ModuleType("praw")
+    praw.models = types.ModuleType("praw.models")
+    praw.models.MoreComments = FakeMoreComments
+    monkeypatch.setitem(sys.modules, "praw", praw)
+    monkeypatch.setitem(sys.modules, "praw.models", praw.models)
+
+def policy(max_requests=None, max_depth=None, min_parent_score=None):
+    return {"max_requests": max_requests, "max_depth": max_depth, "min_parent_score": min_parent_score}
+
+def test_expands_largest_stubs_first_within_budget():
+    small = FakeMoreComments(5, "t3_post", [FakeComment("s")])
+    large = FakeMoreComments(50, "t3_post", [FakeComment("l")])
+    medium = FakeMoreComments(20, "t3_post", [FakeComment("m")])
+    submission = FakeSubmission([FakeComment("a"), small, large, medium])
+
+    comments, deferred, requests = data_processing.expand_comment_tree(submission, policy(max_requests=2))
+
+    assert [comment.id for comment in comments] == ["a", "l", "m"]
+    assert (large.requested, medium.requested, small.requested) == (True, True, False)
+    assert [stub["count"] for stub in deferred] == [5]
+    assert requests == 3  # The tree itself, then two stubs
+
+def test_stubs_found_while_expanding_are_prioritized_with_the_rest():
+    nested = FakeMoreComments(40, "t1_l", [FakeComment("n")], depth=1)
+    large = FakeMoreComments(50, "t3_post", [FakeComment("l"), nested])
+    small = FakeMoreComments(30, "t3_post", [FakeComment("s")])
+    submission = FakeSubmission([large, small])
+
+    comments, deferred, _ = data_processing.expand_comment_tree(submission, policy(max_requests=2))
+
+    assert [comment.id for comment in comments] == ["l", "n"]
+    assert [stub["count"] for stub in deferred] == [30]
+
+def test_stubs_revealed_by_an_expansion_are_expanded_with_their_submission():
+    thread = FakeMoreComments(0, "t1_n", [FakeComment("t")], depth=2, children=[])  # "Continue this thread"
+    nested = FakeMoreComments(40, "t1_l", [FakeComment("n"), thread], depth=1)
+    submission = FakeSubmission([FakeMoreComments(50, "t3_post", [FakeComment("l"), nested])])
+
+    comments, deferred, requests = data_processing.expand_comment_tree(submission, policy())
+
+    assert [comment.id for comment in comments] == ["l", "n", "t"]
+    assert (nested.submission, thread.submission) == (submission, submission)
+    assert deferred == [] and requests == 4
+
+def test_depth_and_parent_score_cut_offs_defer_stubs():
+    deep = FakeMoreComments(10, "t1_a", [FakeComment("d")], depth=5)
+    low = FakeMoreComments(10, "t1_b", [FakeComment("x")], depth=1)
+    kept = FakeMoreComments(10, "t1_a", [FakeComment("k")], depth=1)
+    submission = FakeSubmission([FakeComment("a", score=10), FakeComment("b", score=-3), deep, low, kept])
+
+    comments, deferred, requests = data_processing.expand_comment_tree(
+        submission, policy(max_depth=3, min_parent_score=0)
+    )
+
+    assert [comment.id for comment in comments] == ["a", "b", "k"]
+    assert sorted(stub["parent_id"] for stub in deferred) == ["t1_a", "t1_b"]
+    assert requests == 2
+
+def test_deferred_stubs_are_queued_and_revisited(tmp_path):
+    queue_path = str(tmp_path / "deferred.json")
+    stub = FakeMoreComments(150, "t3_p1", [], children=[f"x{i}" for i in range(150)])
+    reddit = FakeReddit({"p1": FakeSubmission([FakeComment("a"), stub])})
+    posts = [{"post_id": "p1", "titulo": "Debate"}]
+
+    fetched = data_processing.fetch_post_comments(reddit, posts, policy(max_requests=0), queue_path)
+    assert fetched["comentario_id"].tolist() == ["a"]
+    assert fetched.attrs["fetch_stats"]["deferred_comments"] == 150
+    assert list(data_processing.load_deferred_stubs(queue_path)) == ["p1"]
+
+    revisited = data_processing.revisit_deferred_comments(reddit, policy(max_requests=2), queue_path)
+    assert len(revisited) == 150
+    assert set(revisited["titulo_post"]) == {"Debate"}
+    assert revisited.attrs["fetch_stats"]["requests"] == 2  # 100 comments per request
+    assert data_processing.load_deferred_stubs(queue_path) == {}
+
+def test_revisit_keeps_stubs_beyond_the_budget_queued(tmp_path):
+    queue_path = str(tmp_path / "deferred.json")
+    data_processing.save_deferred_stubs({"p1": {"titulo": "Debate", "stubs": [
+        {"parent_id": "t3_p1", "children": [f"x{i}" for i in range(150)], "count": 150, "depth": 0},
+    ]}}, queue_path)
+
+    revisited = data_processing.revisit_deferred_comments(FakeReddit({}), policy(max_requests=1), queue_path)
+
+    assert revisited.empty
+    assert data_processing.load_deferred_stubs(queue_path)["p1"]["stubs"][0]["count"] == 150
+
+def test_each_output_keeps_its_own_queue(tmp_path):
+    root = str(tmp_path / "datasets")
+    paths = {
+        data_processing.deferred_queue_path(db_path="legislativas.db"),
+        data_processing.deferred_queue_path(db_path="autarquicas.db"),
+        data_processing.deferred_queue_path(root, "portugal", "Legislativas 2025"),
+        data_processing.deferred_queue_path(root, "portugal", "Autárquicas 2025"),
+        data_processing.deferred_queue_path(shard=(0, 2), shard_root=str(tmp_path / "shards")),
+    }
+    assert len(paths) == 5
+    assert data_processing.deferred_queue_path(db_path="legislativas.db") == "legislativas.deferred.json"
+
+def test_revisiting_a_shard_writes_its_outputs(tmp_path, monkeypatch):
+    import pandas as pd
+
+    import storage
+
+    shard_root = str(tmp_path / "shards")
+    queue_path = data_processing.deferred_queue_path(db_path=str(tmp_path / "x.db"), shard=(0, 2),
+                                                     shard_root=shard_root)
+    revisited = pd.DataFrame([data_processing.comment_record({"post_id": "p1", "titulo": "Debate"},
+                                                             FakeComment("x1"))])
+    calls = []
+    monkeypatch.setattr(data_processing, "initialize_reddit", lambda: FakeReddit({}))
+    monkeypatch.setattr(data_processing, "revisit_deferred_comments",
+                        lambda reddit, policy, path, seen=None: calls.append(path) or revisited)
+
+    data_processing.main(db_path=str(tmp_path / "x.db"), shard=(0, 2), shard_root=shard_root, revisit=True)
+
+    assert calls == [queue_path]
+    connection = storage.connect(str(tmp_path / "x.db"))
+    try:
+        assert [row["id_comentario"] for row in storage.iter_comments(connection, ("id_comentario",))] == ["x1"]
+    finally:
+        connection.close()
@@ -0,0 +1,31 @@
+"""
+Compact dashboard frame (visualizations.build_compact_comments): topic and leader
+bitmasks grow with the keyword dictionaries.
+"""
+
+import numpy as np
+import pytest
+
+import visualizations
+
+def test_bitmask_dtype_fits_the_labels():
+    assert visualizations.bitmask_dtype(["a"] * 8) == np.uint8
+    assert visualizations.bitmask_dtype(["a"] * 9) == np.uint16
+    assert visualizations.bitmask_dtype(["a"] * 17) == np.uint32
+    assert visualizations.bitmask_dtype(["a"] * 64) == np.uint64
+    with pytest.raises(ValueError, match="at most 64"):
+        visualizations.bitmask_dtype(["a"] * 65)
+
+def test_a_ninth_leader_gets_its_bit(monkeypatch):
+    leaders = [f"Leader {i}" for i in range(9)]
+    monkeypatch.setattr(visualizations, "COMPACT_LEADERS", leaders)
+    monkeypatch.setattr(visualizations, "count_party_leaders", lambda text: {leaders[8]: 1} if text else {})
+    rows = [{"party": "PS", "sentiment": "positive", "texto_comentario": "debate"},
+            {"party": "PS", "sentiment": "negative", "texto_comentario": ""}]
+
+    frame = visualizations.build_compact_comments(rows)
+
+    assert frame["leaders"].dtype == np.uint16
+    assert frame["leaders"].tolist() == [1 << 8, 0]
+    payload = visualizations.get_pie_chart_leader_distribution_data(frame, count_all=True)
+    assert dict(zip(payload["labels"], payload["datasets"][0]["data"])) == {leaders[8]: 1}
@@ -0,0 +1,59 @@
+"""
+Golden-output tests: annotations and chart payloads of the shipped dataset must stay
+exactly as recorded in tests/golden/ (regenerate with `python tests/golden.py`).
+"""
+
+import pytest
+
+import golden
+
+MAX_REPORTED = 10  # Differing comments listed in a failure
+
+@pytest.fixture(scope="module")
+def expected_annotations():
+    return golden.read_annotations()
+
+@pytest.fixture(scope="module")
+def annotations(data_rows):
+    return golden.annotate_rows(data_rows)
+
+@pytest.fixture(scope="module")
+def expected_payloads():
+    return golden.read_payloads()
+
+def assert_column_matches(annotations, expected_annotations, field):
+    differing = [
+        f"row {i} ({actual['comment_key']}): {expected[field]!r} -> {actual[field]!r}"
+        for i, (actual, expected) in enumerate(zip(annotations, expected_annotations))
+        if actual[field] != expected[field]
+    ]
+    assert not differing, f"{len(differing)} comments changed {field}:\n" + "\n".join(differing[:MAX_REPORTED])
+
+def test_golden_annotations_cover_the_dataset(annotations, expected_annotations):
+    assert [a["comment_key"] for a in annotations] == [e["comment_key"] for e in expected_annotations]
+
+def test_party_labels(annotations, expected_annotations):
+    assert_column_matches(annotations, expected_annotations, "party")
+
+def test_topic_lists(annotations, expected_annotations):
+    assert_column_matches(annotations, expected_annotations, "topics")
+
+def test_leader_labels(annotations, expected_annotations):
+    assert_column_matches(annotations, expected_annotations, "leader")
+    assert_column_matches(annotations, expected_annotations, "leaders")
+
+def test_chart_payloads_from_rows(data_rows, expected_payloads):
+    payloads = golden.chart_payloads(data_rows)
+    assert sorted(payloads) == sorted(expected_payloads)
+    for chart, expected in expected_payloads.items():
+        assert payloads[chart] == expected, chart
+
+def test_chart_payloads_from_compact_frame(compact_frame, expected_payloads):
+    payloads = golden.chart_payloads(compact_frame)
+    assert sorted(payloads) == sorted(expected_payloads)
+    for chart, expected in expected_payloads.items():
+        if chart.startswith("word_cloud_"):
+            # Topics with equal counts may come in another order; the word cloud only uses the counts
+            payloads[chart] = dict(zip(payloads[chart]["labels"], payloads[chart]["datasets"][0]["data"]))
+            expected = dict(zip(expected["labels"], expected["datasets"][0]["data"]))
+        assert payloads[chart] == expected, chart
@@ -0,0 +1,68 @@
+"""
+Stage code fingerprints (pipeline.code_hash): a stage is keyed by everything its entry
+point uses, followed through the project's modules.
+"""
+
+import pytest
+
+import pipeline
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    """Writes module files to a scratch source directory; returns the writer."""
+    monkeypatch.setattr(pipeline, "SOURCE_DIR", str(tmp_path))
+    monkeypatch.setattr(pipeline, "_module_cache", {})
+
+    def write(**modules):
+        pipeline._module_cache.clear()
+        for name, source in modules.items():
+            (tmp_path / f"{name}.py").write_text(source, encoding="utf-8")
+    return write
+
+HELPERS = (
+    "FORMATS = ['%Y-%m-%d']\n"
+    "PATTERN, KEYWORDS = ('p', 'k')\n"
+    "def parse(text):\n    return [text, FORMATS]\n"
+    "def match(text):\n    return KEYWORDS\n"
+    "def unused():\n    return 0\n"
+)
+
+def test_closure_follows_module_attributes_and_from_imports(sources):
+    sources(helpers=HELPERS, stage=(
+        "import os\n"
+        "import helpers\n"
+        "from helpers import match as matcher\n"
+        "def run(path):\n    return helpers.parse(os.path.basename(path)), matcher(path)\n"
+    ))
+
+    assert pipeline.code_closure({"stage.py": ["run"]}) == [
+        ("helpers.py", "FORMATS"), ("helpers.py", "KEYWORDS"), ("helpers.py", "match"),
+        ("helpers.py", "parse"), ("stage.py", "run"),
+    ]
+
+def test_editing_a_transitive_helper_changes_the_hash(sources):
+    stage = "def run(text):\n    import helpers\n    return helpers.parse(text)\n"
+    sources(helpers=HELPERS, stage=stage)
+    code = {"stage.py": ["run"]}
+    before = pipeline.code_hash(code)
+
+    sources(helpers=HELPERS.replace("def unused():\n    return 0", "def unused():\n    return 1"))
+    assert pipeline.code_hash(code) == before
+
+    sources(helpers=HELPERS.replace("'%Y-%m-%d'", "'%d/%m/%Y'"))
+    assert pipeline.code_hash(code) != before
+
+def test_unknown_entry_point_is_an_error(sources):
+    sources(stage="def run():\n    pass\n")
+    with pytest.raises(KeyError, match="missing"):
+        pipeline.code_hash({"stage.py": ["missing"]})
+
+def test_stage_bookkeeping_is_not_part_of_the_sentiment_code():
+    closure = pipeline.code_closure(pipeline.STAGES[pipeline.STAGE_NAMES.index("sentiment")]["code"])
+    assert ("pipeline.py", "run_fetch") not in closure
+    assert ("sentiment_analysis.py", "SENTIMENT_PROMPT_TEMPLATE") in closure
+
+def test_aggregate_code_covers_day_parsing_and_keywords():
+    closure = pipeline.code_closure(pipeline.STAGES[pipeline.STAGE_NAMES.index("aggregate")]["code"])
+    for name in ("parse_comment_day", "DATE_FORMATS", "identify_topics", "party_leaders_keywords"):
+        assert ("visualizations.py", name) in closure
@@ -0,0 +1,66 @@
+"""
+The seen-comments index (seen_comments.py): exact set and Bloom filter membership,
+persistence, and dropping repeated comments at fetch time.
+"""
+
+import random
+
+import pytest
+
+import seen_comments
+
+def random_ids(count, seed):
+    rng = random.Random(seed)
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(digits) for _ in range(7)) for _ in range(count)]
+
+@pytest.mark.parametrize("kind", ["set", "bloom"])
+def test_added_ids_are_seen(kind):
+    index = seen_comments.new_seen_index(kind, capacity=5000, error_rate=1e-4)
+    ids = random_ids(5000, seed=1)
+    seen_comments.add_seen(index, ids)
+    assert seen_comments.seen_mask(index, ids).all()
+    assert seen_comments.seen_mask(index, ["t1_" + ids[0], ids[1].upper()]).all()
+
+def test_set_index_is_exact():
+    index = seen_comments.new_seen_index()
+    seen_comments.add_seen(index, random_ids(5000, seed=1))
+    assert not seen_comments.seen_mask(index, random_ids(5000, seed=2)).any()
+
+def test_bloom_filter_false_positive_rate():
+    index = seen_comments.new_seen_index("bloom", capacity=20000, error_rate=1e-3)
+    seen_comments.add_seen(index, random_ids(20000, seed=1))
+    assert seen_comments.seen_mask(index, random_ids(20000, seed=2)).mean() < 3e-3
+
+def test_empty_and_non_reddit_ids():
+    index = seen_comments.new_seen_index()
+    seen_comments.add_seen(index, ["", None, "sha1:abc"])
+    assert seen_comments.seen_mask(index, ["", None, "sha1:abc", "sha1:abd"]).tolist() == [False, False, True, False]
+    assert seen_comments.seen_count(index) == 1
+
+@pytest.mark.parametrize("kind", ["set", "bloom"])
+def test_index_round_trips(tmp_path, kind):
+    path = str(tmp_path / "seen.npz")
+    index = seen_comments.new_seen_index(kind, capacity=1000)
+    ids = random_ids(1000, seed=3)
+    seen_comments.add_seen(index, ids)
+    seen_comments.save_seen_index(index, path)
+
+    loaded = seen_comments.load_seen_index(path)
+    assert loaded["kind"] == kind
+    assert seen_comments.seen_count(loaded) == 1000
+    assert seen_comments.seen_mask(loaded, ids).all()
+
+def test_repeated_comments_are_dropped_at_fetch_time():
+    import data_processing
+    from test_comment_expansion import FakeComment
+
+    index = seen_comments.new_seen_index()
+    seen_comments.add_seen(index, ["old"])
+    fetched_ids = set()
+
+    first = data_processing.drop_seen_comments([FakeComment("old"), FakeComment("a")], fetched_ids, index)
+    crosspost = data_processing.drop_seen_comments([FakeComment("a"), FakeComment("b")], fetched_ids, index)
+
+    assert [comment.id for comment in first] == ["a"]
+    assert [comment.id for comment in crosspost] == ["b"]
@@ -0,0 +1,102 @@
+"""
+The comments database (storage.py): titles and comment bodies stored apart from the
+labels, in compressed blocks that are only decompressed when the text is read.
+"""
+
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+import aggregates
+import golden
+import storage
+
+@pytest.fixture
+def database(tmp_path):
+    db_path = str(tmp_path / "comments.db")
+    storage.import_csv(db_path, golden.DATASET_PATH)
+    return db_path
+
+def expected_rows(data_rows):
+    return [
+        {column: aggregates.comment_key(row) if column == "id_comentario" else row.get(column, "")
+         for column in storage.COMMENT_COLUMNS}
+        for row in data_rows
+    ]
+
+def block_count(connection):
+    return connection.execute("SELECT COUNT(*) FROM text_blocks").fetchone()[0]
+
+def test_comments_round_trip(database, data_rows):
+    with closing(storage.connect(database)) as connection:
+        assert list(storage.iter_comments(connection)) == expected_rows(data_rows)
+        titles = connection.execute("SELECT COUNT(*) FROM titles").fetchone()[0]
+    assert titles == len({row["titulo_post"] for row in data_rows})
+
+def test_labels_are_read_without_decompressing_text(database, monkeypatch):
+    def fail(codec, data):
+        raise AssertionError("text block decompressed")
+    monkeypatch.setattr(storage, "_decompress_texts", fail)
+
+    with closing(storage.connect(database)) as connection:
+        rows = list(storage.iter_comments(connection, ("id_comentario", "titulo_post", "party", "sentiment")))
+    assert rows and all(row["titulo_post"] for row in rows)
+    assert len(storage.load_compact_comments(database, annotate=False)) == len(rows)
+
+def test_upserts_only_store_new_or_edited_text(database, data_rows):
+    rows = expected_rows(data_rows)
+    with closing(storage.connect(database)) as connection:
+        blocks = block_count(connection)
+        storage.upsert_comments(connection, rows[:1000])
+        assert block_count(connection) == blocks
+
+        # Editing every comment of the first block replaces it
+        edited = [dict(row, texto_comentario=row["texto_comentario"] + " (editado)")
+                  for row in rows[:storage.TEXT_BLOCK_ROWS]]
+        storage.upsert_comments(connection, edited)
+        storage.upsert_comments(connection, [{"id_comentario": rows[0]["id_comentario"], "sentiment": "positive"}])
+        assert block_count(connection) == blocks
+        stored = list(storage.iter_comments(connection))
+    assert stored[0] == dict(edited[0], sentiment="positive")
+    assert stored[1:] == edited[1:] + rows[storage.TEXT_BLOCK_ROWS:]
+
+def test_comments_repeated_in_a_batch_are_merged(tmp_path):
+    db_path = str(tmp_path / "comments.db")
+    with closing(storage.connect(db_path)) as connection:
+        storage.upsert_comments(connection, [
+            {"id_comentario": "a", "texto_comentario": "first", "party": "PS"},
+            {"id_comentario": "b", "texto_comentario": "other"},
+            {"id_comentario": "a", "texto_comentario": "second", "sentiment": "positive"},
+        ])
+        stored = list(storage.iter_comments(connection, ("id_comentario", "texto_comentario", "party", "sentiment")))
+        assert stored == [
+            {"id_comentario": "a", "texto_comentario": "second", "party": "PS", "sentiment": "positive"},
+            {"id_comentario": "b", "texto_comentario": "other", "party": "", "sentiment": ""},
+        ]
+        assert connection.execute("SELECT live FROM text_blocks").fetchall() == [(2,)]
+
+        # Once both comments get new bodies, nothing references the first block and it is deleted
+        storage.upsert_comments(connection, [{"id_comentario": "a", "texto_comentario": "third"},
+                                             {"id_comentario": "b", "texto_comentario": "edited"}])
+        assert connection.execute("SELECT live FROM text_blocks").fetchall() == [(2,)]
+        assert [row["texto_comentario"] for row in storage.iter_comments(connection)] == ["third", "edited"]
+
+def test_databases_with_inline_text_are_converted(tmp_path, data_rows):
+    db_path = str(tmp_path / "inline.db")
+    rows = expected_rows(data_rows)[:500]
+    with closing(sqlite3.connect(db_path)) as connection, connection:
+        connection.execute(
+            "CREATE TABLE comments (seq INTEGER PRIMARY KEY, id_comentario TEXT NOT NULL UNIQUE, "
+            + ", ".join(f"{column} TEXT" for column in storage.COMMENT_COLUMNS[1:]) + ")"
+        )
+        connection.execute("CREATE INDEX comments_party ON comments (party)")
+        connection.executemany(
+            f"INSERT INTO comments ({', '.join(storage.COMMENT_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in storage.COMMENT_COLUMNS)})",
+            [[row[column] for column in storage.COMMENT_COLUMNS] for row in rows],
+        )
+
+    with closing(storage.connect(db_path)) as connection:
+        assert "texto_comentario" not in storage._table_columns(connection)
+        assert list(storage.iter_comments(connection)) == rows
@@ -0,0 +1,77 @@
+"""
+Pre-resized thumbnails for the dashboard's static images (logo and party logos).
+
+Resizing with LANCZOS is done once per source image and size: the result is stored as
+PNG in THUMBNAIL_CACHE_DIR, under a name keyed by the hash of the source file, so an
+edited image gets a new thumbnail automatically. Callers get encoded PNG bytes that
+can be served directly (e.g. by st.image) without decoding anything.
+
+Thumbnails are created lazily on first use, or ahead of time with:
+    python thumbnails.py 200x200 logo.jpg
+    python thumbnails.py 100x100 ps.jpg ad.jpg il.jpg chega.jpg be.jpg livre.jpg pan.jpg pcp.jpg
+"""
+
+import hashlib
+import io
+import os
+import sys
+
+from PIL import Image
+
+# --- Configuration & Constants ---
+
+THUMBNAIL_CACHE_DIR = ".thumbnail_cache"
+
+# --- Core Functions ---
+
+def file_digest(file_path):
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, mode="rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def thumbnail_path(image_path, size, cache_dir=THUMBNAIL_CACHE_DIR):
+    """Returns where the thumbnail of image_path at size (width, height) is cached."""
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    width, height = size
+    return os.path.join(cache_dir, f"{stem}-{file_digest(image_path)[:16]}-{width}x{height}.png")
+
+def get_thumbnail(image_path, size, cache_dir=THUMBNAIL_CACHE_DIR):
+    """Returns the PNG bytes of image_path resized to size, creating the cached file if needed."""
+    cached_path = thumbnail_path(image_path, size, cache_dir)
+    if os.path.exists(cached_path):
+        with open(cached_path, mode="rb") as f:
+            return f.read()
+
+    with Image.open(image_path) as image:
+        resized = image.resize(size, Image.LANCZOS)
+    buffer = io.BytesIO()
+    resized.save(buffer, format="PNG", optimize=True)
+    thumbnail = buffer.getvalue()
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cached_path}.{os.getpid()}.tmp"
+        with open(tmp_path, mode="wb") as f:
+            f.write(thumbnail)
+        os.replace(tmp_path, cached_path)  # Atomic, so concurrent sessions never read a partial file
+    except OSError as e:
+        print(f"Warning: could not cache thumbnail {cached_path}: {e}")
+    return thumbnail
+
+# --- Main Execution ---
+
+def main():
+    """Pre-builds thumbnails: python thumbnails.py WIDTHxHEIGHT image [image ...]"""
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    width, height = (int(value) for value in sys.argv[1].lower().split("x"))
+    for image_path in sys.argv[2:]:
+        get_thumbnail(image_path, (width, height))
+        print(f"Thumbnail of {image_path} ({width}x{height}) saved to {thumbnail_path(image_path, (width, height))}")
+
+if __name__ == "__main__":
+    main()
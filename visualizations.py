@@ -1,10 +1,12 @@
 import csv
+import hashlib
 import os
 from collections import Counter, defaultdict
 import re
 import unicodedata
 import json
-from datetime import datetime
+from datetime import date, datetime, timedelta
+import numpy as np
 import pandas as pd
 
 # --- Configuration & Constants ---
@@ -57,10 +59,23 @@ def read_csv_data(file_path):
         print(f"Error reading CSV file {file_path}: {e}")
     return data
 
+def get_dataset_version(file_path):
+    """
+    Returns a cheap version key for a dataset file (modification time and size).
+    Changes whenever the file is rewritten or appended to; None if it doesn't exist.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
 # --- Data Preparation Functions for Charts ---
 
 def get_paired_bar_plot_data(data_rows):
     """Prepares data for a paired bar plot of positive vs. negative sentiment per party."""
+    if isinstance(data_rows, pd.DataFrame):
+        return _paired_bar_from_frame(data_rows)
     if not data_rows:
         return {"labels": [], "datasets": []}
 
@@ -74,6 +89,32 @@ def get_paired_bar_plot_data(data_rows):
             sentiment_counts[party][sentiment] += 1
             all_parties_set.add(party)
 
+    return _paired_bar_payload(sentiment_counts)
+
+def _paired_bar_from_frame(frame):
+    """Vectorized get_paired_bar_plot_data for a DataFrame (e.g. from load_compact_comments)."""
+    if frame.empty:
+        return {"labels": [], "datasets": []}
+    mask = _defined_party_mask(frame["party"]) & frame["sentiment"].isin(["positive", "negative"])
+    counts = frame.loc[mask].groupby(["party", "sentiment"], observed=True).size()
+    sentiment_counts = {}
+    for (party, sentiment), count in counts.items():
+        sentiment_counts.setdefault(party, {"positive": 0, "negative": 0})[sentiment] = int(count)
+    return _paired_bar_payload(sentiment_counts)
+
+def _appearance_counts(values):
+    """Counter of a Series' values in first-appearance order, so ties rank as with row dictionaries."""
+    counts = values.value_counts(sort=False)
+    return Counter({value: int(counts[value]) for value in values.unique()})
+
+def _defined_party_mask(parties):
+    """Boolean mask of rows whose party is set and not "Undefined"."""
+    return parties.notna() & ~parties.isin(["", "Undefined"])
+
+def _paired_bar_payload(sentiment_counts):
+    """Builds the paired bar payload from a {party: {"positive": n, "negative": n}} mapping."""
+    all_parties_set = set(sentiment_counts)
+
     defined_parties_sorted = sorted(
         [p for p in PARTY_COLORS_HEX.keys() if p not in ["Undefined", "Positive", "Negative"]]
     )
@@ -89,13 +130,12 @@ def get_paired_bar_plot_data(data_rows):
 
     labels = sorted(set(labels))
 
-    positive_data = [sentiment_counts[party].get("positive", 0) for party in labels]
-    negative_data = [sentiment_counts[party].get("negative", 0) for party in labels]
+    positive_data = [sentiment_counts.get(party, {}).get("positive", 0) for party in labels]
+    negative_data = [sentiment_counts.get(party, {}).get("negative", 0) for party in labels]
 
     # Calculate total sentiment counts per party for percentage
     total_per_party = [
-        sentiment_counts[party].get("positive", 0) + sentiment_counts[party].get("negative", 0)
-        for party in labels
+        pos + neg for pos, neg in zip(positive_data, negative_data)
     ]
 
     positive_percentage = [
@@ -129,13 +169,20 @@ def get_pie_chart_party_distribution_data(data_rows):
     """Prepares data for a pie chart of party mention distribution."""
     # if not data_rows:
     #     return {"labels": [], "datasets": []}
+    if isinstance(data_rows, pd.DataFrame):
+        parties = data_rows["party"][_defined_party_mask(data_rows["party"])]
+        return _party_distribution_payload(_appearance_counts(parties))
 
     party_counts = Counter()
     for row in data_rows:
         party = row.get("party")
         if party and party != "Undefined":
             party_counts[party] += 1
-    
+
+    return _party_distribution_payload(party_counts)
+
+def _party_distribution_payload(party_counts):
+    """Builds the party pie payload from a Counter of mentions per party."""
     if not party_counts:
         return {"labels": [], "datasets": []}
 
@@ -218,20 +265,27 @@ def get_pie_chart_party_distribution_data(data_rows):
 
     return {"labels": sorted_dates, "datasets": datasets}
 
-def get_time_series_party_mentions_data(data_rows, top_n=None):
+def get_time_series_party_mentions_data(data_rows, top_n=None, granularity="day"):
     """
     Prepares data for a time series plot of party mentions over time.
     
     Args:
         data_rows: List of data dictionaries
         top_n: Number of top parties to include (None for all parties)
+        granularity: "hour", "day" or "week" (weeks start on Monday)
+
+    Besides the "labels" and "datasets", the payload carries its "granularity" and
+    "dates", a sorted NumPy datetime64 array of the labels, used by
+    filter_time_series_by_date_range.
     """
+    if isinstance(data_rows, pd.DataFrame):
+        if "day" in data_rows.columns:
+            return _time_series_from_frame(data_rows, top_n, granularity)
+        data_rows = data_rows.to_dict("records")
     if not data_rows:
         return {"labels": [], "datasets": []}
     
     mentions_by_day_party = defaultdict(lambda: Counter())
-    all_dates = set()
-    all_parties_in_data = set()
     
     # Track parsing failures for debugging
     parsing_failures = 0
@@ -251,33 +305,9 @@ def get_time_series_party_mentions_data(data_rows, top_n=None):
         
         if party and party != "Undefined" and date_str:
             try:
-                # Expanded date format support
-                dt_obj = None
-                date_formats = [
-                    "%Y-%m-%d %H:%M:%S", 
-                    "%Y-%m-%d", 
-                    "%d/%m/%Y %H:%M:%S",
-                    "%d/%m/%Y",
-                    "%m/%d/%Y %H:%M:%S",
-                    "%m/%d/%Y",
-                    "%d-%m-%Y %H:%M:%S",
-                    "%d-%m-%Y"
-                ]
-                
-                for fmt in date_formats:
-                    try:
-                        # Handle potential microseconds or timezone info
-                        clean_date_str = date_str.split(".")[0].split("+")[0].strip()
-                        dt_obj = datetime.strptime(clean_date_str, fmt)
-                        break
-                    except ValueError:
-                        continue
-                
+                dt_obj = parse_comment_datetime(date_str)
                 if dt_obj:
-                    day_str = dt_obj.strftime("%Y-%m-%d")
-                    mentions_by_day_party[day_str][party] += 1
-                    all_dates.add(day_str)
-                    all_parties_in_data.add(party)
+                    mentions_by_day_party[time_bucket_label(dt_obj, granularity)][party] += 1
                 else:
                     parsing_failures += 1
             except Exception as e:
@@ -286,11 +316,184 @@ def get_time_series_party_mentions_data(data_rows, top_n=None):
     
     # Log parsing statistics
     print(f"Processed {total_rows} rows, failed to parse {parsing_failures} dates")
-    
-    if not mentions_by_day_party or not all_dates:
+
+    return _time_series_payload(mentions_by_day_party, top_n, granularity)
+
+def _time_series_from_frame(frame, top_n=None, granularity="day"):
+    """Vectorized get_time_series_party_mentions_data for a compact frame with int32 day ordinals."""
+    if frame.empty:
         return {"labels": [], "datasets": []}
+    defined = frame.loc[_defined_party_mask(frame["party"])]
+    parsed = defined[defined["day"] > 0]
+    print(f"Processed {len(frame)} rows, failed to parse {len(defined) - len(parsed)} dates")
+
+    if granularity == "hour":
+        keys = [parsed["day"], parsed["hour"], parsed["party"]]
+    elif granularity == "week":
+        # Day ordinal 1 (0001-01-01) is a Monday, so this maps every day to its week's Monday
+        keys = [parsed["day"] - (parsed["day"] - 1) % 7, parsed["party"]]
+    else:
+        keys = [parsed["day"], parsed["party"]]
+
+    mentions_by_day_party = defaultdict(Counter)
+    for key, count in parsed.groupby(keys, observed=True).size().items():
+        day, party = key[0], key[-1]
+        label = date.fromordinal(int(day)).isoformat()
+        if granularity == "hour":
+            label += f" {int(key[1]):02d}:00"
+        mentions_by_day_party[label][party] = int(count)
+    return _time_series_payload(mentions_by_day_party, top_n, granularity)
+
+DATE_FORMATS = [
+    "%Y-%m-%d %H:%M:%S", 
+    "%Y-%m-%d", 
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y",
+    "%m/%d/%Y %H:%M:%S",
+    "%m/%d/%Y",
+    "%d-%m-%Y %H:%M:%S",
+    "%d-%m-%Y"
+]
+
+TIME_SERIES_GRANULARITIES = ("hour", "day", "week")
+
+def parse_comment_datetime(date_str):
+    """Parses a comment timestamp in any of DATE_FORMATS, or returns None."""
+    # Handle potential microseconds or timezone info
+    clean_date_str = date_str.split(".")[0].split("+")[0].strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(clean_date_str, fmt)
+        except ValueError:
+            continue
+    return None
+
+def parse_comment_day(date_str):
+    """Returns the YYYY-MM-DD day of a comment timestamp, or None if it can't be parsed."""
+    dt_obj = parse_comment_datetime(date_str)
+    return dt_obj.strftime("%Y-%m-%d") if dt_obj else None
+
+def time_bucket_label(dt_obj, granularity="day"):
+    """Time series label of a timestamp: "YYYY-MM-DD HH:00", "YYYY-MM-DD" or the week's Monday."""
+    if granularity == "hour":
+        return dt_obj.strftime("%Y-%m-%d %H:00")
+    if granularity == "week":
+        dt_obj = dt_obj - timedelta(days=dt_obj.weekday())
+    return dt_obj.strftime("%Y-%m-%d")
+
+def time_series_label_dates(labels):
+    """Converts time series labels to a datetime64 array (hour resolution for hourly labels)."""
+    if labels and len(labels[0]) > 10:
+        return np.array([label[:13].replace(" ", "T") for label in labels], dtype="datetime64[h]")
+    return np.array(labels, dtype="datetime64[D]")
+
+def filter_time_series_by_date_range(time_series_data, start_date, end_date):
+    """
+    Restricts a time series payload to the days start_date..end_date (inclusive); for
+    weekly series, to the weeks overlapping them.
+
+    The sorted "dates" array is binary-searched, so this costs O(log n) plus copying
+    the selected slice of each dataset.
+    """
+    dates = time_series_data.get("dates")
+    if dates is None:
+        dates = time_series_label_dates(time_series_data["labels"])
+    first_day = np.datetime64(start_date, "D")
+    if time_series_data.get("granularity") == "week":
+        # Weeks are labelled by their Monday; keep every week overlapping the range
+        first_day -= np.timedelta64(6, "D")
+    start = np.searchsorted(dates, first_day, side="left")
+    stop = np.searchsorted(dates, np.datetime64(end_date, "D") + np.timedelta64(1, "D"), side="left")
+
+    filtered = dict(time_series_data)
+    filtered["labels"] = time_series_data["labels"][start:stop]
+    filtered["dates"] = dates[start:stop]
+    filtered["datasets"] = [
+        _select_points(dataset, lambda values: values[start:stop]) for dataset in time_series_data["datasets"]
+    ]
+    return filtered
+
+def _select_points(dataset, select):
+    """Copy of a time series dataset with select() applied to its per-point lists ("data", and "ci" if any)."""
+    return dict(dataset, **{key: select(dataset[key]) for key in ("data", "ci") if key in dataset})
+
+def lttb_indices(x, y, target):
+    """
+    Largest-Triangle-Three-Buckets: indices of `target` points of (x, y) that keep the
+    shape of the line (peaks, troughs), always including the first and last points.
+    """
+    n = len(y)
+    if target >= n or target < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    every = (n - 2) / (target - 2)
+    indices = np.empty(target, dtype=np.int64)
+    indices[0] = 0
+    previous = 0
+    for bucket in range(target - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, n)
+        # Triangle between the previously kept point, each candidate and the next bucket's average
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        indices[bucket + 1] = previous
+    indices[-1] = n - 1
+    return indices
+
+def downsample_time_series(time_series_data, max_points):
+    """
+    Caps a time series payload at about max_points labels, keeping its format.
+
+    Each dataset is reduced with LTTB to its share of max_points and the union of the
+    kept labels is used for all of them, so datasets still share their x values. Payloads
+    that already fit are returned unchanged, so a narrower date range (see
+    filter_time_series_by_date_range) gets full resolution back. Downsampled payloads
+    carry "downsampled_from", the number of labels before downsampling.
+    """
+    labels = time_series_data["labels"]
+    datasets = time_series_data["datasets"]
+    if not datasets or len(labels) <= max_points:
+        return time_series_data
+    dates = time_series_data.get("dates")
+    if dates is None:
+        dates = time_series_label_dates(labels)
+    x = dates.astype(np.int64)
+
+    def kept_indices(per_dataset):
+        return np.unique(np.concatenate([lttb_indices(x, dataset["data"], per_dataset) for dataset in datasets]))
+
+    per_dataset = max(3, max_points // len(datasets))
+    keep = kept_indices(per_dataset)
+    # Datasets often keep the same labels, so grow their share while the union still fits
+    while per_dataset < len(labels):
+        candidate = kept_indices(per_dataset * 2)
+        if len(candidate) > max_points:
+            break
+        keep, per_dataset = candidate, per_dataset * 2
+
+    downsampled = dict(time_series_data)
+    downsampled["labels"] = [labels[i] for i in keep]
+    downsampled["dates"] = dates[keep]
+    downsampled["datasets"] = [
+        _select_points(dataset, lambda values: [values[i] for i in keep]) for dataset in datasets
+    ]
+    downsampled["downsampled_from"] = len(labels)
+    return downsampled
+
+def _time_series_payload(mentions_by_day_party, top_n=None, granularity="day"):
+    """Builds the time series payload from a {label: Counter(party -> mentions)} mapping."""
+    mentions_by_day_party = {day: counts for day, counts in mentions_by_day_party.items() if counts}
+    if not mentions_by_day_party:
+        return {"labels": [], "datasets": [], "dates": time_series_label_dates([]), "granularity": granularity}
     
-    sorted_dates = sorted(list(all_dates))
+    sorted_dates = sorted(mentions_by_day_party)
     
     # Determine parties to include
     overall_party_counts = Counter()
@@ -301,10 +504,11 @@ def get_time_series_party_mentions_data(data_rows, top_n=None):
         top_parties_list = [p[0] for p in overall_party_counts.most_common(top_n)]
     else:
         # Include all parties
-        top_parties_list = sorted(list(all_parties_in_data))
+        top_parties_list = sorted(overall_party_counts)
     
     if not top_parties_list:
-        return {"labels": sorted_dates, "datasets": []}
+        return {"labels": sorted_dates, "datasets": [], "dates": time_series_label_dates(sorted_dates),
+                "granularity": granularity}
     
     datasets = []
     for party in top_parties_list:
@@ -318,7 +522,8 @@ def get_time_series_party_mentions_data(data_rows, top_n=None):
             "tension": 0.1
         })
     
-    return {"labels": sorted_dates, "datasets": datasets}
+    return {"labels": sorted_dates, "datasets": datasets, "dates": time_series_label_dates(sorted_dates),
+            "granularity": granularity}
 
 trendy_topics = {
     "taxes": [
@@ -418,29 +623,55 @@ party_leaders_keywords = {
     ]
 }
 
-def identify_party_leader(comment):
+def normalize_comment(comment):
+    """Lower-cases a comment, drops punctuation (keeping hashtags) and strips accents."""
+    comment = comment.lower()
+    return strip_accents(re.sub(r'[^\w\s#]', '', comment))  # keeps hashtags
+
+def build_keyword_matcher(keywords_dict):
     """
-    Identify mentioned party leaders in a comment.
-    Returns the first leader found or "Undefined" if none found.
+    Compiles a {label: [keywords]} dictionary into a single whole-word regex.
+
+    Returns (pattern, keyword_labels) where keyword_labels maps each normalized keyword
+    to its label. Longer keywords are tried first, so "pedro nuno santos" is one mention
+    rather than also matching "pedro". A keyword listed under several labels belongs to
+    the first one.
     """
+    keyword_labels = {}
+    for label, keywords in keywords_dict.items():
+        for keyword in keywords:
+            keyword_labels.setdefault(strip_accents(keyword.lower()), label)
+    alternatives = sorted(keyword_labels, key=lambda k: (-len(k), k))
+    pattern = re.compile(r'\b(?:' + '|'.join(re.escape(k) for k in alternatives) + r')\b')
+    return pattern, keyword_labels
+
+LEADER_PATTERN, LEADER_KEYWORDS = build_keyword_matcher(party_leaders_keywords)
+
+def count_party_leaders(comment):
+    """Counts the mentions of each party leader in a comment, in order of first mention."""
     if not isinstance(comment, str):
-        return "Undefined"
-        
-    comment = comment.lower()
-    comment = strip_accents(re.sub(r'[^\w\s#]', '', comment))  # keeps hashtags
+        return Counter()
+    return Counter(LEADER_KEYWORDS[match] for match in LEADER_PATTERN.findall(normalize_comment(comment)))
 
-    for leader, keywords in party_leaders_keywords.items():
-        for keyword in keywords:
-            keyword_clean = strip_accents(keyword.lower())
-            pattern = r'\b' + re.escape(keyword_clean) + r'\b'
-            if re.search(pattern, comment):
-                return leader  # Return the first leader found
+def identify_party_leader(comment):
+    """
+    Identify the main party leader mentioned in a comment.
+    Returns the leader with the most mentions (ties go to the one mentioned first),
+    or "Undefined" if none found.
+    """
+    leader_counts = count_party_leaders(comment)
+    if not leader_counts:
+        return "Undefined"  # No leader found
+    return max(leader_counts, key=leader_counts.get)
 
-    return "Undefined"  # No leader found
+def get_pie_chart_leader_distribution_data(data_rows, count_all=False):
+    """
+    Prepares data for a pie chart of leader mention distribution.
 
-def get_pie_chart_leader_distribution_data(data_rows):
-    """Prepares data for a pie chart of leader mention distribution."""
-    if not data_rows:
+    By default each comment counts once, for its main leader (see identify_party_leader).
+    With count_all=True each comment counts once for every leader it mentions.
+    """
+    if not isinstance(data_rows, pd.DataFrame) and not data_rows:
         return {"labels": [], "datasets": []}
     
     # Convert to pandas DataFrame if it's not already
@@ -453,17 +684,42 @@ def get_pie_chart_leader_distribution_data(data_rows):
     else:
         data_df = data_rows
     
+    # Compact frames carry the leaders already identified at load time
+    if 'leader' in data_df.columns and not count_all:
+        return _leader_distribution_payload(_appearance_counts(data_df['leader']))
+    if 'leaders' in data_df.columns and count_all:
+        masks = data_df['leaders'].to_numpy()
+        leader_counts = Counter({
+            leader: int(np.count_nonzero(masks & (1 << bit)))
+            for bit, leader in enumerate(COMPACT_LEADERS)
+        })
+        leader_counts["Undefined"] = int(np.count_nonzero(masks == 0))
+        return _leader_distribution_payload(+leader_counts)
+
     # Ensure the texto_comentario column exists
     if 'texto_comentario' not in data_df.columns:
         print("Column 'texto_comentario' not found in data")
         return {"labels": [], "datasets": []}
     
+    if count_all:
+        # One count per (comment, leader) pair: explode the leaders matched in each comment
+        mentioned = data_df['texto_comentario'].map(
+            lambda text: list(count_party_leaders(text)) or ["Undefined"]
+        ).explode()
+        return _leader_distribution_payload(_appearance_counts(mentioned))
+
     # Apply the identify_party_leader function to each comment
     leader_series = data_df['texto_comentario'].apply(identify_party_leader)
     
     # Count occurrences of each leader
     leader_counts = Counter(leader_series)
-    
+
+    return _leader_distribution_payload(leader_counts)
+
+def _leader_distribution_payload(leader_counts):
+    """Builds the leader pie payload from a Counter of mentions per leader."""
+    leader_counts = Counter(leader_counts)
+
     # Remove "Undefined" if present, as we typically don't want to show it in the pie chart
     if "Undefined" in leader_counts and len(leader_counts) > 1:
         del leader_counts["Undefined"]
@@ -488,6 +744,577 @@ def get_pie_chart_leader_distribution_data(data_rows):
         }]
     }
 
+def get_topic_counts(data_rows):
+    """Counts comments per trendy topic ("Undefined" excluded)."""
+    return get_word_cloud_tables(data_rows)["overall"]
+
+def get_word_cloud_tables(data_rows):
+    """
+    Builds the topic frequency tables for the word cloud in a single pass.
+
+    Returns {"overall": Counter(topic -> comments), party: Counter(topic -> comments), ...};
+    comments with an "Undefined" party only count towards "overall".
+    """
+    tables = defaultdict(Counter)
+    tables["overall"] = Counter()
+    if isinstance(data_rows, pd.DataFrame):
+        if "topics" in data_rows.columns:
+            # Only the distinct (party, topic mask) pairs need expanding into topics
+            combinations = data_rows.groupby(["party", "topics"], observed=True).size()
+            for (party, mask), count in combinations.items():
+                for bit, topic in enumerate(COMPACT_TOPICS):
+                    if mask & (1 << bit):
+                        tables["overall"][topic] += int(count)
+                        tables[party][topic] += int(count)
+            return dict(tables)
+        data_rows = data_rows.to_dict("records")
+
+    for row in data_rows:
+        party = row.get("party") or ""
+        for topic in identify_topics(row.get("texto_comentario") or ""):
+            if topic != "Undefined":
+                tables["overall"][topic] += 1
+                tables[party][topic] += 1
+    return dict(tables)
+
+def get_word_cloud_data(data_rows, party_filter="overall", tables=None):
+    """
+    Prepares the topic frequencies for the word cloud, overall or for a single party.
+
+    Pass the result of get_word_cloud_tables as `tables` to switch parties without
+    recounting the comments.
+    """
+    if tables is None:
+        tables = get_word_cloud_tables(data_rows)
+    sorted_topic_counts = tables.get(party_filter, Counter()).most_common()
+
+    return {
+        "labels": [item[0] for item in sorted_topic_counts],
+        "datasets": [{
+            "label": "Frequência de Tópicos",
+            "data": [item[1] for item in sorted_topic_counts],
+        }]
+    }
+
+def frequency_hash(frequencies):
+    """Stable hash of a {term: count} mapping, used to key cached word cloud renders."""
+    encoded = json.dumps(sorted(frequencies.items()), ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()
+
+def to_json_compatible(payload):
+    """Returns a copy of a chart payload with NumPy arrays (e.g. time series "dates") as lists of strings."""
+    if isinstance(payload, dict):
+        return {key: to_json_compatible(value) for key, value in payload.items()}
+    if isinstance(payload, list):
+        return [to_json_compatible(value) for value in payload]
+    if isinstance(payload, np.ndarray):
+        return [str(value) for value in payload]
+    return payload
+
+# --- Compact Dashboard Representation ---
+
+# Bit i of the "topics" column is set when the comment mentions COMPACT_TOPICS[i],
+# and likewise for the "leaders" column and COMPACT_LEADERS
+COMPACT_TOPICS = list(trendy_topics)
+COMPACT_LEADERS = list(party_leaders_keywords)
+COMPACT_DETAIL_FIELDS = ("titulo_post", "texto_comentario", "data_comentario", "url_comentario")
+
+def bitmask_dtype(labels):
+    """The smallest unsigned integer dtype with a bit for each of labels (at most 64)."""
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if len(labels) <= np.iinfo(dtype).bits:
+            return dtype
+    raise ValueError(f"Compact bitmasks hold at most 64 labels, got {len(labels)}; "
+                     "split the topic or leader keywords into fewer groups.")
+
+def build_compact_comments(data_rows, source=None, annotate=True):
+    """
+    Builds the compact, label-only representation of the comments used by the dashboard.
+
+    Columns: party/sentiment/leader (main leader) as categoricals, day as int32 date
+    ordinal (0 when the date can't be parsed), hour as uint8, topics as a bitmask over
+    COMPACT_TOPICS and leaders (every leader mentioned) as a bitmask over COMPACT_LEADERS,
+    each of the smallest unsigned dtype with enough bits (see bitmask_dtype). With annotate=False the text is not matched against topics and
+    leaders (by far the slowest part) and only party, sentiment, day and hour are built,
+    which is enough for the sentiment, party and time series charts. Text fields
+    are not kept; the frame's row number is the comment's record number in `source`, so
+    they can be read back with load_comment_details. The frame is meant to be shared
+    read-only between dashboard sessions.
+    """
+    codes = {"party": {}, "sentiment": {}}
+    columns = {"party": [], "sentiment": []}
+    if annotate:
+        codes["leader"] = {}
+        columns["leader"] = []
+    days = []
+    hours = []
+    topic_masks = []
+    leader_masks = []
+    topic_bits = {topic: 1 << bit for bit, topic in enumerate(COMPACT_TOPICS)}
+    leader_bits = {leader: 1 << bit for bit, leader in enumerate(COMPACT_LEADERS)}
+
+    for row in data_rows:
+        values = {
+            "party": row.get("party") or "",
+            "sentiment": row.get("sentiment") or "",
+        }
+        if annotate:
+            text = row.get("texto_comentario") or ""
+            leader_counts = count_party_leaders(text)
+            values["leader"] = max(leader_counts, key=leader_counts.get) if leader_counts else "Undefined"
+        for column, value in values.items():
+            columns[column].append(codes[column].setdefault(value, len(codes[column])))
+
+        day_ordinal = 0
+        hour = 0
+        date_str = row.get("data_comentario")
+        if date_str:
+            try:
+                dt_obj = parse_comment_datetime(date_str)
+                if dt_obj:
+                    day_ordinal = dt_obj.toordinal()
+                    hour = dt_obj.hour
+            except Exception:
+                pass
+        days.append(day_ordinal)
+        hours.append(hour)
+
+        if not annotate:
+            continue
+        mask = 0
+        for topic in identify_topics(text):
+            mask |= topic_bits.get(topic, 0)
+        topic_masks.append(mask)
+        leader_masks.append(sum(leader_bits[leader] for leader in leader_counts))
+
+    frame = pd.DataFrame({
+        column: pd.Categorical.from_codes(
+            np.array(columns[column], dtype=np.int16), categories=list(codes[column])
+        )
+        for column in columns
+    })
+    frame["day"] = np.array(days, dtype=np.int32)
+    frame["hour"] = np.array(hours, dtype=np.uint8)
+    if annotate:
+        frame["topics"] = np.array(topic_masks, dtype=bitmask_dtype(COMPACT_TOPICS))
+        frame["leaders"] = np.array(leader_masks, dtype=bitmask_dtype(COMPACT_LEADERS))
+    frame.attrs["source"] = source
+    return frame
+
+def load_compact_comments(file_path, annotate=True):
+    """
+    Streams a CSV into the compact representation without keeping any row dictionaries.
+    When the CSV has an up-to-date published copy (see publish_compact_comments), that
+    copy is memory-mapped instead and the CSV isn't read at all.
+    """
+    version = get_dataset_version(file_path)
+    if version is not None:
+        published = open_compact_comments(published_path(file_path), annotate=annotate, source_version=version)
+        if published is not None:
+            published.attrs["source"] = file_path  # Same rows in the same order, so details can be read back
+            return published
+    return _read_compact_comments(file_path, annotate)
+
+def _read_compact_comments(file_path, annotate=True):
+    """Builds the compact representation of a CSV by parsing it."""
+    if not os.path.exists(file_path):
+        print(f"Warning: Data file {file_path} not found.")
+        return build_compact_comments([], source=file_path, annotate=annotate)
+    try:
+        with open(file_path, mode="r", newline="", encoding="utf-8") as csvfile:
+            return build_compact_comments(csv.DictReader(csvfile), source=file_path, annotate=annotate)
+    except Exception as e:
+        print(f"Error reading CSV file {file_path}: {e}")
+        return build_compact_comments([], source=file_path, annotate=annotate)
+
+def append_compact_comments(frame, appended):
+    """
+    Returns a new compact frame with the rows of `appended` after those of `frame`.
+
+    Categorical columns are merged (new labels are added after the existing ones), so the
+    result is the same as building the frame from all the rows at once. `frame` is not
+    modified, so sessions still reading it are unaffected.
+    """
+    if appended.empty:
+        return frame
+    if frame.empty:
+        result = appended.copy()
+        result.attrs["source"] = frame.attrs.get("source")
+        return result
+    columns = {}
+    for column in frame.columns:
+        if isinstance(frame[column].dtype, pd.CategoricalDtype):
+            columns[column] = pd.api.types.union_categoricals([frame[column], appended[column]])
+        else:
+            columns[column] = np.concatenate([frame[column].to_numpy(), appended[column].to_numpy()])
+    result = pd.DataFrame(columns)
+    result.attrs["source"] = frame.attrs.get("source")
+    return result
+
+def concat_compact_comments(frames, source=None, annotate=True):
+    """
+    Returns one compact frame with the rows of all `frames`, in order (e.g. the union of
+    several dataset partitions). Categorical columns are merged as in append_compact_comments.
+    Row numbers no longer match a single file, so `source` defaults to None.
+    """
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return build_compact_comments([], source=source, annotate=annotate)
+    columns = {}
+    for column in frames[0].columns:
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype):
+            columns[column] = pd.api.types.union_categoricals([frame[column] for frame in frames])
+        else:
+            columns[column] = np.concatenate([frame[column].to_numpy() for frame in frames])
+    result = pd.DataFrame(columns)
+    result.attrs["source"] = source
+    return result
+
+def replace_compact_rows(frame, positions, replacement):
+    """
+    Returns a copy of a compact frame with the rows at `positions` (sorted) replaced by
+    the rows of `replacement`, a compact frame built from their new values. Categorical
+    columns are merged as in append_compact_comments.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    columns = {}
+    for column in frame.columns:
+        if isinstance(frame[column].dtype, pd.CategoricalDtype):
+            merged = pd.api.types.union_categoricals([frame[column], replacement[column]])
+            codes = merged.codes[:len(frame)].copy()
+            codes[positions] = merged.codes[len(frame):]
+            columns[column] = pd.Categorical.from_codes(codes, categories=merged.categories)
+        else:
+            values = frame[column].to_numpy().copy()
+            values[positions] = replacement[column].to_numpy()
+            columns[column] = values
+    result = pd.DataFrame(columns)
+    result.attrs["source"] = frame.attrs.get("source")
+    return result
+
+def filter_compact_comments(frame, start_date=None, end_date=None, parties=None):
+    """
+    Returns the compact rows dated between start_date and end_date (inclusive dates)
+    and, if parties is given, about one of those parties. Rows without a parseable date
+    are dropped when a date bound is given.
+    """
+    mask = np.ones(len(frame), dtype=bool)
+    days = frame["day"].to_numpy()
+    if start_date:
+        mask &= days >= start_date.toordinal()
+    if end_date:
+        mask &= days <= end_date.toordinal()
+    if parties:
+        mask &= frame["party"].isin(list(parties)).to_numpy()
+    if mask.all():
+        return frame
+    return frame[mask]
+
+def load_comment_details(frame, positions, fields=COMPACT_DETAIL_FIELDS):
+    """Reads the text fields of the given compact rows back from the source CSV (for drill-down)."""
+    source = frame.attrs.get("source")
+    wanted = set(int(p) for p in positions)
+    details = {}
+    if not wanted or not source or not os.path.exists(source):
+        return []
+    with open(source, mode="r", newline="", encoding="utf-8") as csvfile:
+        for position, row in enumerate(csv.DictReader(csvfile)):
+            if position in wanted:
+                details[position] = {field: row.get(field, "") for field in fields}
+                if len(details) == len(wanted):
+                    break
+    return [details[p] for p in sorted(details)]
+
+# --- Approximate Mode (Stratified Sample) ---
+
+# The sentiment, party share and time series charts of very large datasets can be answered
+# from a stratified sample of the compact comments instead of every row. The sample keeps up
+# to SAMPLE_PER_STRATUM comments of each (party, day), drawn uniformly at random, plus the
+# exact number of comments of each. Party shares and daily or weekly mentions are sums of
+# those counts, so they are exact; sentiment counts and percentages and hourly mentions are
+# estimated from the sampled comments, with CONFIDENCE_LEVEL confidence intervals. The
+# cost of a chart is bounded by the sample size, whatever the number of comments.
+SAMPLE_PER_STRATUM = 200
+SAMPLE_SEED = 2025
+APPROXIMATE_MIN_ROWS = 1_000_000  # The dashboard starts in approximate mode from this many comments
+CONFIDENCE_LEVEL = 0.95
+CONFIDENCE_Z = 1.96  # Normal quantile for CONFIDENCE_LEVEL
+SAMPLE_SENTIMENTS = ("positive", "negative")  # Sentiment codes 1 and 2 in the sample; 0 for others
+
+def new_stratified_sample(per_stratum=SAMPLE_PER_STRATUM, seed=SAMPLE_SEED):
+    """An empty stratified sample; update_stratified_sample fills it."""
+    return {
+        "per_stratum": per_stratum,
+        "seed": seed,
+        "rows": 0,  # Rows of the frame folded in so far
+        "strata": {},  # (party, day) -> stratum number
+        "party": [],  # Per stratum
+        "day": np.array([], dtype=np.int32),
+        "count": np.array([], dtype=np.int64),  # Comments per stratum (exact)
+        "stratum": np.array([], dtype=np.int32),  # Per sampled comment
+        "sentiment": np.array([], dtype=np.int8),
+        "hour": np.array([], dtype=np.uint8),
+    }
+
+def build_stratified_sample(frame, per_stratum=SAMPLE_PER_STRATUM, seed=SAMPLE_SEED):
+    """Draws the stratified sample of a compact frame (see new_stratified_sample)."""
+    return update_stratified_sample(new_stratified_sample(per_stratum, seed), frame)
+
+def _ranks_within(groups, rng):
+    """Random rank of each element among the elements of its group (0, 1, ...)."""
+    order = np.lexsort((rng.random(groups.size), groups))
+    sizes = np.bincount(groups)
+    starts = np.cumsum(sizes) - sizes
+    ranks = np.empty(groups.size, dtype=np.int64)
+    ranks[order] = np.arange(groups.size) - starts[groups[order]]
+    return ranks
+
+def update_stratified_sample(sample, frame):
+    """
+    Returns the sample with the rows of `frame` after the first sample["rows"] folded in
+    (e.g. the rows live mode appended), keeping every stratum a uniform sample of its
+    comments as reservoir sampling does: the number of new comments a stratum keeps is
+    drawn from the hypergeometric distribution, then that many new and the rest of its
+    current comments are picked at random. Costs as much as the new rows plus the sample.
+    `sample` is not modified, so sessions still reading it are unaffected.
+    """
+    appended = frame.iloc[sample["rows"]:]
+    if appended.empty:
+        return sample
+    rng = np.random.default_rng([sample["seed"], sample["rows"]])
+    defined = _defined_party_mask(appended["party"]).to_numpy()
+    parties = appended["party"].cat.codes.to_numpy()[defined].astype(np.int64)
+    days = appended["day"].to_numpy()[defined]
+    keys, inverse = np.unique((parties << 32) | days.astype(np.int64), return_inverse=True)
+
+    strata = dict(sample["strata"])
+    party_labels = list(sample["party"])
+    new_days = []
+    key_strata = np.empty(keys.size, dtype=np.int32)
+    categories = appended["party"].cat.categories
+    for i, key in enumerate(keys.tolist()):
+        stratum_key = (categories[key >> 32], key & 0xFFFFFFFF)
+        if stratum_key not in strata:
+            strata[stratum_key] = len(strata)
+            party_labels.append(stratum_key[0])
+            new_days.append(stratum_key[1])
+        key_strata[i] = strata[stratum_key]
+    batch_strata = key_strata[inverse.ravel()]
+
+    count = np.concatenate([sample["count"], np.zeros(len(new_days), dtype=np.int64)])
+    added = np.bincount(batch_strata, minlength=count.size)
+    size = np.minimum(count + added, sample["per_stratum"])
+    keep_new = np.zeros(count.size, dtype=np.int64)
+    touched = added > 0
+    keep_new[touched] = rng.hypergeometric(added[touched], count[touched], size[touched])
+    keep_old = size - keep_new
+
+    kept = _ranks_within(sample["stratum"], rng) < keep_old[sample["stratum"]]
+    picked = _ranks_within(batch_strata, rng) < keep_new[batch_strata]
+    sentiments = appended["sentiment"].to_numpy()[defined][picked]
+    sentiment_codes = np.zeros(sentiments.size, dtype=np.int8)
+    for code, sentiment in enumerate(SAMPLE_SENTIMENTS, start=1):
+        sentiment_codes[sentiments == sentiment] = code
+
+    return dict(
+        sample,
+        rows=len(frame),
+        strata=strata,
+        party=party_labels,
+        day=np.concatenate([sample["day"], np.array(new_days, dtype=np.int32)]),
+        count=count + added,
+        stratum=np.concatenate([sample["stratum"][kept], batch_strata[picked]]),
+        sentiment=np.concatenate([sample["sentiment"][kept], sentiment_codes]),
+        hour=np.concatenate([sample["hour"][kept], appended["hour"].to_numpy()[defined][picked]]),
+    )
+
+def _sample_info(sample):
+    """What an approximate payload was estimated from (shown with the charts)."""
+    return {"sampled": int(sample["stratum"].size), "comments": int(sample["count"].sum()),
+            "confidence": CONFIDENCE_LEVEL}
+
+def _variance_factors(sample):
+    """
+    N (N - n) / (n - 1) per stratum (N comments, n sampled): the variance of an estimated
+    stratum total N * mean is this times the sampled values' mean square deviation.
+    Zero for strata sampled in full.
+    """
+    sampled = np.bincount(sample["stratum"], minlength=sample["count"].size)
+    count = sample["count"].astype(np.float64)
+    return sampled, count * (count - sampled) / np.maximum(sampled - 1, 1)
+
+def get_approximate_paired_bar_data(sample):
+    """
+    get_paired_bar_plot_data estimated from a stratified sample. Each dataset also has
+    "ci" and "percentage_ci", the half-widths of the confidence intervals of its counts
+    and percentages, and the payload has "approximate" (see _sample_info).
+    """
+    strata_count = sample["count"].size
+    sampled, factors = _variance_factors(sample)
+    cells = np.bincount(sample["stratum"].astype(np.int64) * 3 + sample["sentiment"],
+                        minlength=strata_count * 3).reshape(strata_count, 3)
+    share = {code: cells[:, code] / np.maximum(sampled, 1) for code in (1, 2)}
+    parties, party_index = np.unique(np.array(sample["party"], dtype=object), return_inverse=True)
+
+    def party_sums(values):
+        return np.bincount(party_index, weights=values, minlength=parties.size)
+
+    totals = {code: party_sums(sample["count"] * share[code]) for code in (1, 2)}
+    variances = {code: party_sums(factors * share[code] * (1 - share[code])) for code in (1, 2)}
+    # Percentages are ratios (positive over positive + negative), linearized per party
+    judged = totals[1] + totals[2]
+    ratio = np.divide(totals[1], judged, out=np.zeros_like(judged), where=judged > 0)[party_index]
+    deviation = share[1] - ratio * (share[1] + share[2])
+    mean_square = share[1] * (1 - ratio) ** 2 + share[2] * ratio ** 2 - deviation ** 2
+    ratio_variance = np.divide(party_sums(factors * mean_square), judged ** 2,
+                               out=np.zeros_like(judged), where=judged > 0)
+
+    sentiment_counts = {
+        party: {"positive": int(round(totals[1][i])), "negative": int(round(totals[2][i]))}
+        for i, party in enumerate(parties) if judged[i] > 0
+    }
+    payload = _paired_bar_payload(sentiment_counts)
+    positions = {party: i for i, party in enumerate(parties)}
+    for dataset, code in zip(payload["datasets"], (1, 2)):
+        rows = [positions[party] for party in payload["labels"]]
+        dataset["ci"] = [float(CONFIDENCE_Z * np.sqrt(variances[code][i])) for i in rows]
+        dataset["percentage_ci"] = [float(CONFIDENCE_Z * np.sqrt(ratio_variance[i]) * 100) for i in rows]
+    payload["approximate"] = _sample_info(sample)
+    return payload
+
+def get_approximate_party_distribution_data(sample):
+    """get_pie_chart_party_distribution_data from a stratified sample; exact, since it is stratified by party."""
+    party_counts = Counter()
+    for party, count in zip(sample["party"], sample["count"].tolist()):
+        party_counts[party] += count
+    payload = _party_distribution_payload(party_counts)
+    for dataset in payload["datasets"]:
+        dataset["ci"] = [0.0] * len(dataset["data"])
+    payload["approximate"] = _sample_info(sample)
+    return payload
+
+def get_approximate_time_series_data(sample, top_n=None, granularity="day"):
+    """
+    get_time_series_party_mentions_data from a stratified sample. Daily and weekly
+    mentions are exact; hourly ones are estimated. Each dataset also has "ci", the
+    half-widths of the confidence intervals of its points.
+    """
+    mentions_by_day_party = defaultdict(Counter)
+    variances = defaultdict(dict)
+    days = sample["day"].tolist()
+    if granularity == "hour":
+        strata_count = sample["count"].size
+        sampled, factors = _variance_factors(sample)
+        cells = np.bincount(sample["stratum"].astype(np.int64) * 24 + sample["hour"],
+                            minlength=strata_count * 24).reshape(strata_count, 24)
+        share = cells / np.maximum(sampled, 1)[:, None]
+        totals = sample["count"][:, None] * share
+        cell_variances = factors[:, None] * share * (1 - share)
+        for stratum, hour in zip(*np.nonzero(cells)):
+            if days[stratum] > 0:
+                label = f"{date.fromordinal(days[stratum]).isoformat()} {int(hour):02d}:00"
+                party = sample["party"][stratum]
+                mentions_by_day_party[label][party] = int(round(totals[stratum, hour]))
+                variances[label][party] = float(cell_variances[stratum, hour])
+    else:
+        for party, day, count in zip(sample["party"], days, sample["count"].tolist()):
+            if day > 0:
+                if granularity == "week":
+                    day -= (day - 1) % 7  # Day ordinal 1 (0001-01-01) is a Monday
+                mentions_by_day_party[date.fromordinal(day).isoformat()][party] += count
+
+    payload = _time_series_payload(mentions_by_day_party, top_n, granularity)
+    for dataset in payload["datasets"]:
+        dataset["ci"] = [
+            float(CONFIDENCE_Z * np.sqrt(variances[label].get(dataset["label"], 0.0)))
+            for label in payload["labels"]
+        ]
+    payload["approximate"] = _sample_info(sample)
+    return payload
+
+# --- Published Compact Comments ---
+# The pipeline publishes the compact frame of its final dataset as an uncompressed
+# Arrow IPC (Feather v2) file. Opening it memory-maps the file and the frame's columns
+# are read-only views of it, so startup doesn't depend on the number of comments and
+# every dashboard process shares the one page-cached copy. Files are replaced
+# atomically: processes that still map the previous file keep reading it unchanged.
+
+COMPACT_FORMAT_VERSION = "2"  # Bump when the compact columns change, so older published files are ignored
+COMPACT_BASE_COLUMNS = ["party", "sentiment", "day", "hour"]  # The columns built with annotate=False
+PUBLISHED_SUFFIX = ".arrow"
+
+def published_path(file_path):
+    """Path of the published compact copy of a CSV dataset (comments.csv -> comments.arrow)."""
+    return os.path.splitext(file_path)[0] + PUBLISHED_SUFFIX
+
+def save_compact_comments(frame, arrow_path, source_version=None):
+    """
+    Atomically writes a compact frame as an uncompressed Arrow IPC file, recording the
+    version of the data it was built from. Returns False when pyarrow isn't installed.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        print(f"Warning: pyarrow is not installed; {arrow_path} was not published.")
+        return False
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"compact_format"] = COMPACT_FORMAT_VERSION.encode()
+    metadata[b"source_version"] = str(source_version).encode("utf-8")
+    table = table.replace_schema_metadata(metadata)
+    temp_path = arrow_path + ".tmp"
+    with pa.OSFile(temp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(temp_path, arrow_path)
+    return True
+
+def open_compact_comments(arrow_path, annotate=True, source_version=None):
+    """
+    Opens a published compact frame, memory-mapped (zero-copy, read-only).
+
+    Returns None when the file doesn't exist or can't be used: pyarrow isn't installed,
+    it was written with another COMPACT_FORMAT_VERSION, it lacks the annotated columns,
+    or source_version is given and it was built from another version of the data.
+    """
+    if not os.path.exists(arrow_path):
+        return None
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+    try:
+        table = pa.ipc.open_file(pa.memory_map(arrow_path, "r")).read_all()
+    except (OSError, pa.ArrowException) as e:
+        print(f"Warning: could not open {arrow_path}: {e}")
+        return None
+    metadata = table.schema.metadata or {}
+    if metadata.get(b"compact_format") != COMPACT_FORMAT_VERSION.encode():
+        return None
+    if source_version is not None and metadata.get(b"source_version") != str(source_version).encode("utf-8"):
+        return None
+    if not annotate:
+        table = table.select(COMPACT_BASE_COLUMNS)
+    elif "topics" not in table.column_names:
+        return None
+    # One block per column, so pandas keeps every column as a view of the mapped file
+    frame = table.to_pandas(split_blocks=True)
+    frame.attrs["source"] = None
+    return frame
+
+def publish_compact_comments(file_path, arrow_path=None):
+    """
+    Builds the annotated compact frame of a CSV dataset and publishes it (by default
+    next to it, see published_path). Returns the published path, or None.
+    """
+    arrow_path = arrow_path or published_path(file_path)
+    version = get_dataset_version(file_path)  # Taken first: a CSV rewritten meanwhile makes the copy stale, not wrong
+    if version is None:
+        print(f"Warning: Data file {file_path} not found; nothing published.")
+        return None
+    if not save_compact_comments(_read_compact_comments(file_path), arrow_path, version):
+        return None
+    return arrow_path
+
 # --- Main function for testing (optional) ---
 if __name__ == "__main__":
     print("Testing visualization data preparation (standard Python version)...")
@@ -535,7 +1362,7 @@ if __name__ == "__main__":
 
         time_series_data = get_time_series_party_mentions_data(main_data_rows)
         print("\nTime Series Data:")
-        print(json.dumps(time_series_data, indent=2, ensure_ascii=False))
+        print(json.dumps(to_json_compatible(time_series_data), indent=2, ensure_ascii=False))
 
         word_cloud_overall_data = get_word_cloud_data(main_data_rows, party_filter="overall")
         print("\nWord Cloud Data (Overall):")